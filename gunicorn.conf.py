@@ -0,0 +1,28 @@
+"""Gunicorn settings of the Docker image.
+
+WEB_WORKERS sets the number of eventlet worker processes (default 1). With
+more than one, Socket.IO only accepts the websocket transport (a websocket
+stays on the worker that accepted it, so no sticky sessions are needed) and
+emits reach the other workers through the Redis message queue; create_app
+refuses to start unless caches and rate limits are shared through Redis as
+well.
+"""
+import os
+import subprocess
+import sys
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+chdir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src')
+wsgi_app = 'wsgi:app'
+worker_class = 'eventlet'
+workers = max(1, int(os.getenv('WEB_WORKERS', '1')))
+worker_connections = int(os.getenv('WEB_WORKER_CONNECTIONS', '1000'))
+accesslog = '-'
+errorlog = '-'
+
+
+def on_starting(server):
+    # Create/upgrade tables and the secret key file once, before the workers
+    # run create_app concurrently. A separate interpreter keeps the master
+    # free of application modules that eventlet would have to patch later.
+    subprocess.check_call([sys.executable, '-c', 'from app import create_app; create_app()'], cwd=chdir)
@@ -0,0 +1,45 @@
+"""Add stored posts.effective_at with timeline indexes
+
+Revision ID: add_post_effective_at
+Revises: add_push_subscriptions
+Create Date: 2026-10-17 10:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_post_effective_at'
+down_revision = 'add_push_subscriptions'
+branch_labels = None
+depends_on = None
+
+INDEXES = (
+    ('ix_posts_published_effective_at', 'is_published, effective_at DESC, id'),
+    ('ix_posts_user_effective_at', 'user_id, effective_at'),
+    ('ix_posts_group_effective_at', 'group_id, effective_at'),
+)
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    post_columns = [col['name'] for col in sa.inspect(bind).get_columns('posts')]
+    if 'effective_at' not in post_columns:
+        # Nullable without default: no table rewrite
+        op.add_column('posts', sa.Column('effective_at', sa.DateTime(), nullable=True))
+
+    # Same id-range backfill as create_app, each range committed on its own
+    # so the app can keep writing while the migration runs
+    from queries import backfill_effective_at
+    backfill_effective_at(bind=bind, batch_block=op.get_context().autocommit_block)
+
+    concurrently = 'CONCURRENTLY ' if bind.dialect.name == 'postgresql' else ''
+    with op.get_context().autocommit_block():
+        for name, columns in INDEXES:
+            op.execute(f'CREATE INDEX {concurrently}IF NOT EXISTS {name} ON posts ({columns})')
+
+
+def downgrade() -> None:
+    for name, _columns in INDEXES:
+        op.execute(f'DROP INDEX IF EXISTS {name}')
+    op.drop_column('posts', 'effective_at')
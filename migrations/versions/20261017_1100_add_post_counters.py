@@ -0,0 +1,78 @@
+"""Add denormalized reaction, comment, bookmark and poll vote counters
+
+Revision ID: add_post_counters
+Revises: add_post_effective_at
+Create Date: 2026-10-17 11:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_post_counters'
+down_revision = 'add_post_effective_at'
+branch_labels = None
+depends_on = None
+
+BACKFILL_BATCH_SIZE = 5000
+
+
+def _backfill(bind) -> None:
+    """Compute the counters in post id ranges, committing each batch separately."""
+    max_id = bind.execute(sa.text('SELECT MAX(id) FROM posts')).scalar() or 0
+    low = 0
+    while low < max_id:
+        high = low + BACKFILL_BATCH_SIZE
+        params = {'low': low, 'high': high}
+        with op.get_context().autocommit_block():
+            bind.execute(sa.text(
+                'UPDATE posts SET '
+                'comment_count = (SELECT COUNT(*) FROM comments '
+                'WHERE comments.post_id = posts.id AND comments.is_approved = :approved), '
+                'bookmark_count = (SELECT COUNT(*) FROM bookmarks WHERE bookmarks.post_id = posts.id) '
+                'WHERE id > :low AND id <= :high'
+            ), {**params, 'approved': True})
+            bind.execute(sa.text(
+                'INSERT INTO post_reaction_counts (post_id, emoji, count) '
+                'SELECT post_id, emoji, COUNT(*) FROM reactions '
+                'WHERE post_id > :low AND post_id <= :high '
+                'GROUP BY post_id, emoji'
+            ), params)
+            bind.execute(sa.text(
+                'UPDATE poll_options SET vote_count = '
+                '(SELECT COUNT(*) FROM poll_votes WHERE poll_votes.option_id = poll_options.id) '
+                'WHERE poll_id IN (SELECT id FROM polls WHERE post_id > :low AND post_id <= :high)'
+            ), params)
+        low = high
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    post_columns = [col['name'] for col in inspector.get_columns('posts')]
+    for name in ('comment_count', 'bookmark_count'):
+        if name not in post_columns:
+            op.add_column('posts', sa.Column(name, sa.Integer(), nullable=False, server_default='0'))
+
+    poll_option_columns = [col['name'] for col in inspector.get_columns('poll_options')]
+    if 'vote_count' not in poll_option_columns:
+        op.add_column('poll_options', sa.Column('vote_count', sa.Integer(), nullable=False, server_default='0'))
+
+    if 'post_reaction_counts' not in inspector.get_table_names():
+        op.create_table(
+            'post_reaction_counts',
+            sa.Column('post_id', sa.Integer(), sa.ForeignKey('posts.id'), primary_key=True),
+            sa.Column('emoji', sa.String(length=10), primary_key=True),
+            sa.Column('count', sa.Integer(), nullable=False, server_default='0'),
+        )
+    else:
+        op.execute('DELETE FROM post_reaction_counts')
+
+    _backfill(bind)
+
+
+def downgrade() -> None:
+    op.drop_table('post_reaction_counts')
+    op.drop_column('poll_options', 'vote_count')
+    op.drop_column('posts', 'bookmark_count')
+    op.drop_column('posts', 'comment_count')
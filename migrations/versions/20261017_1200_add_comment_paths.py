@@ -0,0 +1,71 @@
+"""Add comments.depth and materialized comments.path
+
+Revision ID: add_comment_paths
+Revises: add_post_counters
+Create Date: 2026-10-17 12:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_comment_paths'
+down_revision = 'add_post_counters'
+branch_labels = None
+depends_on = None
+
+BACKFILL_BATCH_SIZE = 5000
+PATH_WIDTH = 10
+
+INDEXES = (
+    ('ix_comments_post_parent_id', 'post_id, parent_id, id'),
+    ('ix_comments_post_path', 'post_id, path'),
+)
+
+# Comments whose parent already has a path (or that have none) - filled top-down
+PENDING = sa.text(
+    'SELECT c.id, p.id, p.depth, p.path FROM comments c '
+    'LEFT JOIN comments p ON p.id = c.parent_id '
+    'WHERE c.path IS NULL AND (c.parent_id IS NULL OR p.id IS NULL OR p.path IS NOT NULL) '
+    'ORDER BY c.id LIMIT :limit'
+)
+
+
+def _backfill(bind) -> None:
+    """Fill depth/path level by level, committing each batch separately."""
+    while True:
+        rows = bind.execute(PENDING, {'limit': BACKFILL_BATCH_SIZE}).fetchall()
+        if not rows:
+            break
+        updates = []
+        for comment_id, parent_id, parent_depth, parent_path in rows:
+            segment = str(comment_id).zfill(PATH_WIDTH)
+            if parent_id is None:
+                updates.append({'id': comment_id, 'depth': 0, 'path': segment})
+            else:
+                updates.append({'id': comment_id, 'depth': parent_depth + 1, 'path': f'{parent_path}.{segment}'})
+        with op.get_context().autocommit_block():
+            bind.execute(sa.text('UPDATE comments SET depth = :depth, path = :path WHERE id = :id'), updates)
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    comment_columns = [col['name'] for col in sa.inspect(bind).get_columns('comments')]
+    if 'depth' not in comment_columns:
+        op.add_column('comments', sa.Column('depth', sa.Integer(), nullable=False, server_default='0'))
+    if 'path' not in comment_columns:
+        op.add_column('comments', sa.Column('path', sa.String(length=255), nullable=True))
+
+    _backfill(bind)
+
+    concurrently = 'CONCURRENTLY ' if bind.dialect.name == 'postgresql' else ''
+    with op.get_context().autocommit_block():
+        for name, columns in INDEXES:
+            op.execute(f'CREATE INDEX {concurrently}IF NOT EXISTS {name} ON comments ({columns})')
+
+
+def downgrade() -> None:
+    for name, _columns in INDEXES:
+        op.execute(f'DROP INDEX IF EXISTS {name}')
+    op.drop_column('comments', 'path')
+    op.drop_column('comments', 'depth')
@@ -0,0 +1,25 @@
+"""Add link_previews.status for background fetching
+
+Revision ID: add_link_preview_status
+Revises: add_comment_paths
+Create Date: 2026-10-17 13:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_link_preview_status'
+down_revision = 'add_comment_paths'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    columns = [col['name'] for col in sa.inspect(op.get_bind()).get_columns('link_previews')]
+    if 'status' not in columns:
+        op.add_column('link_previews', sa.Column('status', sa.String(length=20), nullable=False, server_default='ready'))
+
+
+def downgrade() -> None:
+    op.drop_column('link_previews', 'status')
@@ -0,0 +1,48 @@
+"""Add shared url_metadata cache referenced by link previews
+
+Revision ID: add_url_metadata
+Revises: add_link_preview_status
+Create Date: 2026-10-17 14:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_url_metadata'
+down_revision = 'add_link_preview_status'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if 'url_metadata' not in inspector.get_table_names():
+        op.create_table(
+            'url_metadata',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('url_hash', sa.String(length=64), nullable=False, unique=True),
+            sa.Column('url', sa.String(length=2000), nullable=False),
+            sa.Column('status', sa.String(length=20), nullable=False),
+            sa.Column('failure_reason', sa.String(length=50), nullable=True),
+            sa.Column('title', sa.String(length=500), nullable=True),
+            sa.Column('description', sa.Text(), nullable=True),
+            sa.Column('image_url', sa.String(length=2000), nullable=True),
+            sa.Column('site_name', sa.String(length=200), nullable=True),
+            sa.Column('fetched_at', sa.DateTime(), nullable=False),
+            sa.Column('expires_at', sa.DateTime(), nullable=False),
+        )
+        op.create_index('ix_url_metadata_expires_at', 'url_metadata', ['expires_at'])
+
+    # Existing previews keep their inline metadata; new ones reference url_metadata
+    columns = [col['name'] for col in inspector.get_columns('link_previews')]
+    if 'url_metadata_id' not in columns:
+        op.add_column('link_previews', sa.Column('url_metadata_id', sa.Integer(), sa.ForeignKey('url_metadata.id'), nullable=True))
+    op.execute('CREATE INDEX IF NOT EXISTS ix_link_previews_url_metadata_id ON link_previews (url_metadata_id)')
+
+
+def downgrade() -> None:
+    op.execute('DROP INDEX IF EXISTS ix_link_previews_url_metadata_id')
+    op.drop_column('link_previews', 'url_metadata_id')
+    op.drop_table('url_metadata')
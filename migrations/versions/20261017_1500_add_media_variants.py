@@ -0,0 +1,35 @@
+"""Add responsive variant metadata to media
+
+Revision ID: add_media_variants
+Revises: add_url_metadata
+Create Date: 2026-10-17 15:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_media_variants'
+down_revision = 'add_url_metadata'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    columns = [col['name'] for col in sa.inspect(op.get_bind()).get_columns('media')]
+    # Existing uploads are ready (a single JPEG); `chronicle backfill-image-variants` adds their variants
+    if 'status' not in columns:
+        op.add_column('media', sa.Column('status', sa.String(length=20), nullable=False, server_default='ready'))
+    if 'width' not in columns:
+        op.add_column('media', sa.Column('width', sa.Integer(), nullable=True))
+    if 'height' not in columns:
+        op.add_column('media', sa.Column('height', sa.Integer(), nullable=True))
+    if 'variants' not in columns:
+        op.add_column('media', sa.Column('variants', sa.Text(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('media', 'variants')
+    op.drop_column('media', 'height')
+    op.drop_column('media', 'width')
+    op.drop_column('media', 'status')
@@ -0,0 +1,44 @@
+"""Add notification_outbox for push delivery outside the request
+
+Revision ID: add_notification_outbox
+Revises: add_media_variants
+Create Date: 2026-10-17 16:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_notification_outbox'
+down_revision = 'add_media_variants'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    if 'notification_outbox' in inspector.get_table_names():
+        return
+    op.create_table(
+        'notification_outbox',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('notification_id', sa.Integer(), sa.ForeignKey('notifications.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('user_id', sa.Integer(), sa.ForeignKey('users.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('next_attempt_at', sa.DateTime(), nullable=False),
+        sa.Column('claim_token', sa.String(length=32), nullable=True),
+        sa.Column('claimed_until', sa.DateTime(), nullable=True),
+        sa.Column('retry_endpoints', sa.Text(), nullable=True),
+        sa.Column('last_error', sa.String(length=300), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('delivered_at', sa.DateTime(), nullable=True),
+    )
+    op.create_index('ix_notification_outbox_notification_id', 'notification_outbox', ['notification_id'])
+    op.create_index('ix_notification_outbox_due', 'notification_outbox', ['status', 'next_attempt_at'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_notification_outbox_due', table_name='notification_outbox')
+    op.drop_index('ix_notification_outbox_notification_id', table_name='notification_outbox')
+    op.drop_table('notification_outbox')
@@ -0,0 +1,53 @@
+"""Add denormalized per-emoji comment reaction counters
+
+Revision ID: add_comment_reaction_counts
+Revises: add_notification_outbox
+Create Date: 2026-10-17 17:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_comment_reaction_counts'
+down_revision = 'add_notification_outbox'
+branch_labels = None
+depends_on = None
+
+BACKFILL_BATCH_SIZE = 5000
+
+
+def _backfill(bind) -> None:
+    """Count the reactions in comment id ranges, committing each batch separately."""
+    max_id = bind.execute(sa.text('SELECT MAX(id) FROM comments')).scalar() or 0
+    low = 0
+    while low < max_id:
+        high = low + BACKFILL_BATCH_SIZE
+        with op.get_context().autocommit_block():
+            bind.execute(sa.text(
+                'INSERT INTO comment_reaction_counts (comment_id, emoji, count) '
+                'SELECT comment_id, emoji, COUNT(*) FROM comment_reactions '
+                'WHERE comment_id > :low AND comment_id <= :high '
+                'GROUP BY comment_id, emoji'
+            ), {'low': low, 'high': high})
+        low = high
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if 'comment_reaction_counts' not in inspector.get_table_names():
+        op.create_table(
+            'comment_reaction_counts',
+            sa.Column('comment_id', sa.Integer(), sa.ForeignKey('comments.id'), primary_key=True),
+            sa.Column('emoji', sa.String(length=10), primary_key=True),
+            sa.Column('count', sa.Integer(), nullable=False, server_default='0'),
+        )
+    else:
+        op.execute('DELETE FROM comment_reaction_counts')
+
+    _backfill(bind)
+
+
+def downgrade() -> None:
+    op.drop_table('comment_reaction_counts')
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""Benchmark time and memory per upload of the image variant pipeline.
+
+Compares three ways of turning phone photos into post image variants:
+
+- ``legacy``: the previous ``blog.resize_and_compress_image``: full decode,
+  rotate by EXIF orientation, one 1920 px JPEG
+- ``full``: ``image_variants.render_variants`` decoding JPEGs at full size
+- ``draft``: ``image_variants.render_variants`` as used by the workers, JPEGs
+  decoded at 1/2, 1/4 or 1/8 scale and rotated afterwards
+
+Each mode processes the whole corpus in a fresh process (like a gallery post
+with that many images); ``+MB`` is the peak RSS above the process after its
+imports, i.e. what one worker needs for the images.
+
+Usage:
+  python scripts/benchmark_image_decode.py
+  python scripts/benchmark_image_decode.py --images ~/phone_photos/ --formats avif,webp
+
+``--images`` takes a directory of JPEGs; without it synthetic 24 MP photos
+(6000x4000, portrait ones with EXIF orientation 6) are generated.
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
+
+from PIL import ExifTags, Image  # noqa: E402
+
+MODES = ('legacy', 'full', 'draft')
+LEGACY_MAX_SIZE = 1920
+
+
+def _synthetic_images(directory: Path, count: int) -> list[Path]:
+    # Gradients with noise compress like photos, unlike flat colour
+    base = Image.linear_gradient('L').resize((6000, 4000))
+    noise = Image.effect_noise((6000, 4000), 40)
+    photo = Image.merge('RGB', (base, noise, base.transpose(Image.Transpose.FLIP_LEFT_RIGHT)))
+    paths = []
+    for index in range(count):
+        exif = Image.Exif()
+        exif[ExifTags.Base.Orientation] = 6 if index % 2 else 1
+        path = directory / f'photo-{index}.jpg'
+        photo.save(path, 'JPEG', quality=90, exif=exif.tobytes())
+        paths.append(path)
+    return paths
+
+
+def _phone_images(directory: Path) -> list[Path]:
+    return sorted(path for path in directory.iterdir() if path.suffix.lower() in ('.jpg', '.jpeg'))
+
+
+def _pixels(path: Path) -> int:
+    with Image.open(path) as img:
+        return img.width * img.height
+
+
+def legacy_resize(source: Path, target_dir: str) -> None:
+    """The previous resize_and_compress_image plus save_compressed_image."""
+    img = Image.open(source)
+    orientation = img.getexif().get(ExifTags.Base.Orientation)
+    if orientation == 3:
+        img = img.rotate(180, expand=True)
+    elif orientation == 6:
+        img = img.rotate(270, expand=True)
+    elif orientation == 8:
+        img = img.rotate(90, expand=True)
+    if img.mode in ('RGBA', 'P'):
+        img = img.convert('RGB')
+    width, height = img.size
+    if width > LEGACY_MAX_SIZE or height > LEGACY_MAX_SIZE:
+        scale = LEGACY_MAX_SIZE / max(width, height)
+        img = img.resize((int(width * scale), int(height * scale)), Image.Resampling.LANCZOS)
+    img.save(os.path.join(target_dir, f'{source.stem}.jpg'), 'JPEG', quality=85, optimize=True)
+
+
+def _reset_peak_rss() -> int:
+    """Reset the peak RSS to the current RSS where Linux allows it; returns the baseline in KB."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+    except OSError:
+        pass
+    return _peak_rss()
+
+
+def _peak_rss() -> int:
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss  # KB on Linux
+
+
+def _child(mode: str, images: list[Path], formats: tuple[str, ...]) -> dict:
+    from image_variants import PROFILES, render_variants
+
+    baseline = _reset_peak_rss()
+    timings = []
+    with tempfile.TemporaryDirectory() as target_dir:
+        for source in images:
+            started = time.perf_counter()
+            if mode == 'legacy':
+                legacy_resize(source, target_dir)
+            else:
+                render_variants(str(source), target_dir, source.stem, PROFILES['post'], formats,
+                                False, draft=mode == 'draft')
+            timings.append((time.perf_counter() - started) * 1000)
+    return {'timings': timings, 'peak_kb': _peak_rss(), 'baseline_kb': baseline}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--images', type=Path, help='Directory with phone photos (.jpg)')
+    parser.add_argument('--count', type=int, default=6, help='Synthetic photos to generate without --images')
+    parser.add_argument('--formats', default='webp', help='Variant formats besides JPEG (e.g. avif,webp)')
+    parser.add_argument('--child', choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument('paths', nargs='*', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    formats = tuple(fmt.strip() for fmt in args.formats.split(',') if fmt.strip())
+
+    if args.child:
+        print(json.dumps(_child(args.child, [Path(path) for path in args.paths], formats)))
+        return 0
+
+    with tempfile.TemporaryDirectory() as scratch:
+        images = _phone_images(args.images) if args.images else _synthetic_images(Path(scratch), args.count)
+        if not images:
+            print('No images found.')
+            return 1
+        megapixels = sum(_pixels(path) for path in images) / len(images) / 1e6
+        print(f'{len(images)} images, {megapixels:.1f} MP on average, formats: jpg,{",".join(formats)}')
+        print(f"{'mode':8} {'ms/image':>9} {'max ms':>8} {'peak RSS MB':>12} {'+MB':>6}")
+        for mode in MODES:
+            output = subprocess.run(
+                [sys.executable, __file__, '--child', mode, '--formats', ','.join(formats), *map(str, images)],
+                check=True, capture_output=True, text=True,
+            ).stdout
+            result = json.loads(output)
+            timings = result['timings']
+            print(f"{mode:8} {sum(timings) / len(timings):9.0f} {max(timings):8.0f} "
+                  f"{result['peak_kb'] / 1024:12.1f} {(result['peak_kb'] - result['baseline_kb']) / 1024:6.1f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
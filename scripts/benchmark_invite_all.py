@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""Benchmark "invite all users to a group" against the previous per-user loop.
+
+The previous implementation loaded every eligible user, added one
+``GroupMembership`` and called ``create_notification`` per user (before the
+outbox it also committed and sent web pushes per user). The current one
+(``queries.add_all_users_to_group``) inserts memberships, notifications
+and outbox rows with three INSERT ... SELECT statements.
+
+Usage:
+  python scripts/benchmark_invite_all.py
+  python scripts/benchmark_invite_all.py --users 10000 --database sqlite:////tmp/invite.sqlite
+
+Runs against a throwaway SQLite file by default; ``--database`` takes any
+SQLAlchemy URL (use an empty database, tables are created). Push keys are
+set so outbox rows are written, nothing is sent.
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+import argparse
+import os
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
+
+from sqlalchemy import event  # noqa: E402
+
+
+def _seed_users(db, User, count: int) -> int:
+    admin = User(username='bench-admin', email='bench-admin@example.org', password_hash='x')
+    db.session.add(admin)
+    db.session.flush()
+    db.session.execute(db.insert(User), [
+        {'username': f'bench-{i}', 'email': f'bench-{i}@example.org', 'password_hash': 'x'}
+        for i in range(count)
+    ])
+    db.session.commit()
+    return admin.id
+
+
+def legacy_invite_all(group, actor_id: int) -> int:
+    """The previous invite_all_to_group loop (with create_notification as it is now)."""
+    from extensions import db
+    from models import GroupMembership, User
+    from social import create_notification
+
+    existing_member_ids = [m.user_id for m in GroupMembership.query.filter_by(group_id=group.id).all()]
+    users_to_invite = User.query.filter(
+        User.is_deleted.is_(False),
+        User.is_active.is_(True),
+        ~User.id.in_(existing_member_ids)
+    ).all()
+    added = 0
+    for user in users_to_invite:
+        db.session.add(GroupMembership(group_id=group.id, user_id=user.id, role='member'))
+        create_notification(
+            user_id=user.id,
+            type='group_invite',
+            title=f'added you to the group "{group.name}"',
+            link=f'/groups/{group.slug}',
+            actor_id=actor_id
+        )
+        added += 1
+    db.session.commit()
+    return added
+
+
+def bulk_invite_all(group, actor_id: int) -> int:
+    from extensions import db
+    from queries import add_all_users_to_group
+
+    added, _marker = add_all_users_to_group(group.id, actor_id, f'added you to the group "{group.name}"', f'/groups/{group.slug}')
+    db.session.commit()
+    return added
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=10000, help='Users to create and invite')
+    parser.add_argument('--database', help='SQLAlchemy URL of an empty database (default: temporary SQLite file)')
+    args = parser.parse_args()
+
+    scratch = tempfile.mkdtemp()
+    database = args.database or f"sqlite:///{os.path.join(scratch, 'invite.sqlite')}"
+
+    from flask import Flask
+    from extensions import db
+    from models import Group, GroupMembership, Notification, NotificationOutbox, User
+
+    # Only the database layer; create_app would bind to the instance database
+    app = Flask(__name__)
+    app.config.update(
+        SQLALCHEMY_DATABASE_URI=database,
+        VAPID_PRIVATE_KEY='benchmark',
+        VAPID_PUBLIC_KEY='benchmark',
+    )
+    db.init_app(app)
+    statements = []
+    with app.app_context():
+        db.create_all()
+        event.listen(db.engine, 'before_cursor_execute', lambda *a, **kw: statements.append(1))
+        actor_id = _seed_users(db, User, args.users)
+        print(f'{args.users} users, {db.engine.dialect.name}')
+        print(f"{'implementation':16} {'added':>7} {'seconds':>8} {'statements':>11} {'outbox rows':>12}")
+        for label, invite in (('legacy loop', legacy_invite_all), ('bulk insert', bulk_invite_all)):
+            group = Group(name=label, slug=label.replace(' ', '-'), created_by=actor_id)
+            db.session.add(group)
+            db.session.flush()
+            db.session.add(GroupMembership(group_id=group.id, user_id=actor_id, role='admin'))
+            db.session.commit()
+            group = SimpleNamespace(id=group.id, name=group.name, slug=group.slug)
+            db.session.expunge_all()
+            statements.clear()
+            started = time.perf_counter()
+            added = invite(group, actor_id)
+            elapsed = time.perf_counter() - started
+            queued = NotificationOutbox.query.join(Notification).filter(Notification.link == f'/groups/{group.slug}').count()
+            print(f'{label:16} {added:7} {elapsed:8.2f} {len(statements):11} {queued:12}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
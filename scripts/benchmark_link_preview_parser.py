@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""Benchmark the head-only link preview parser against the previous implementation.
+
+The previous implementation read the whole response (up to 2 MB), decoded it
+and built a full BeautifulSoup tree to find five tags; the current one
+(``content_utils.read_head_metadata``) streams chunks into an HTMLParser
+and stops at the end of <head>.
+
+Usage:
+  python scripts/benchmark_link_preview_parser.py
+  python scripts/benchmark_link_preview_parser.py --pages saved_pages/ --repeat 20
+  python scripts/benchmark_link_preview_parser.py --synthetic
+
+Pages come from ``scripts/fixtures/link_preview_pages/`` (saved pages, see
+the README there) or ``--pages`` (any directory, ``curl -o page.html URL``).
+``--synthetic`` uses generated pages shaped like news, blog and legacy
+(windows-1252) pages instead. The baseline needs ``beautifulsoup4``, which
+the app no longer depends on; without it only the current parser runs.
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+import argparse
+import importlib.util
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
+
+from content_utils import read_head_metadata, PREVIEW_CHUNK_SIZE  # noqa: E402
+
+LEGACY_MAX_BYTES = 2 * 1024 * 1024
+FIXTURE_PAGES = Path(__file__).resolve().parent / 'fixtures' / 'link_preview_pages'
+
+
+def _synthetic_pages() -> dict[str, tuple[bytes, str]]:
+    paragraph = '<p>' + 'Lorem ipsum dolor sit amet, consectetur adipiscing elit. ' * 12 + '</p>\n'
+    script = '<script>window.__STATE__ = {' + ', '.join(f'"k{i}": {i}' for i in range(3000)) + '};</script>\n'
+    style = '<style>' + ''.join(f'.c{i} {{ margin: {i % 7}px; }}\n' for i in range(1500)) + '</style>\n'
+    meta = (
+        '<meta property="og:title" content="Stadtrat beschließt neuen Radweg &amp; mehr">\n'
+        '<meta property="og:description" content="Nach langer Debatte über die Innenstadt.">\n'
+        '<meta property="og:image" content="https://example.org/image.jpg">\n'
+        '<meta property="og:site_name" content="Example News">\n'
+    )
+    news = (
+        '<!DOCTYPE html><html lang="de"><head><meta charset="utf-8">\n<title>Radweg | Example News</title>\n'
+        + meta + style + script + '</head><body>\n' + paragraph * 1500 + '</body></html>'
+    )
+    blog = (
+        '<!DOCTYPE html><html><head><title>Ein kleiner Blog</title>\n'
+        '<meta name="description" content="Notizen über Fotografie und Reisen.">\n'
+        '<meta name="twitter:image" content="https://blog.example/cover.png">\n'
+        '</head><body>\n' + paragraph * 250 + '</body></html>'
+    )
+    legacy = (
+        '<html><head><meta http-equiv="Content-Type" content="text/html; charset=iso-8859-1">\n'
+        '<title>Über uns – Bäckerei Müller</title></head><body>\n' + paragraph * 40 + '</body></html>'
+    )
+    return {
+        'news (utf-8, large head)': (news.encode('utf-8'), 'text/html; charset=utf-8'),
+        'blog (no charset)': (blog.encode('utf-8'), 'text/html'),
+        'legacy (windows-1252 meta)': (legacy.encode('cp1252'), 'text/html'),
+    }
+
+
+def _saved_pages(directory: Path) -> dict[str, tuple[bytes, str]]:
+    return {path.name: (path.read_bytes(), 'text/html') for path in sorted(directory.glob('*.htm*'))}
+
+
+def _chunks(body: bytes):
+    for offset in range(0, len(body), PREVIEW_CHUNK_SIZE):
+        yield body[offset:offset + PREVIEW_CHUNK_SIZE]
+
+
+def legacy_parse(body: bytes, content_type: str) -> tuple[dict, int]:
+    """The previous fetch_open_graph: read everything, decode, BeautifulSoup the whole page."""
+    from bs4 import BeautifulSoup
+    import requests.utils
+
+    buf = bytearray()
+    for chunk in _chunks(body):
+        buf.extend(chunk)
+        if len(buf) > LEGACY_MAX_BYTES:
+            return {}, len(buf)
+    # requests falls back to ISO-8859-1 for text/* without a charset parameter
+    encoding = requests.utils.get_encoding_from_headers({'content-type': content_type}) or 'utf-8'
+    html = bytes(buf).decode(encoding, errors='replace')
+    soup = BeautifulSoup(html, 'html.parser')
+
+    result = {'title': None, 'description': None, 'image_url': None, 'site_name': None}
+    for field, prop in (('title', 'og:title'), ('description', 'og:description'),
+                        ('image_url', 'og:image'), ('site_name', 'og:site_name')):
+        tag = soup.find('meta', property=prop)
+        if tag:
+            result[field] = tag.get('content', '')
+    if not result['title']:
+        title_tag = soup.find('title')
+        if title_tag:
+            result['title'] = title_tag.text.strip()
+    if not result['description']:
+        meta_desc = soup.find('meta', attrs={'name': 'description'})
+        if meta_desc:
+            result['description'] = meta_desc.get('content', '')
+    return result, len(buf)
+
+
+def head_parse(body: bytes, content_type: str) -> tuple[dict, int]:
+    return read_head_metadata(_chunks(body), content_type)
+
+
+def _measure(parse, body: bytes, content_type: str, repeat: int) -> tuple[dict, int, float, int]:
+    result, consumed = parse(body, content_type)
+    started = time.perf_counter()
+    for _ in range(repeat):
+        parse(body, content_type)
+    elapsed_ms = (time.perf_counter() - started) * 1000 / repeat
+    tracemalloc.start()
+    parse(body, content_type)
+    _current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, consumed, elapsed_ms, peak
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pages', type=Path, default=FIXTURE_PAGES, help='Directory with saved .html pages')
+    parser.add_argument('--synthetic', action='store_true', help='Use generated pages instead of saved ones')
+    parser.add_argument('--repeat', type=int, default=10, help='Timed runs per page and parser')
+    args = parser.parse_args()
+
+    pages = _synthetic_pages() if args.synthetic else _saved_pages(args.pages)
+    if not pages:
+        print('No pages found.')
+        return 1
+
+    parsers = [('head', head_parse)]
+    if importlib.util.find_spec('bs4') is not None:
+        parsers.insert(0, ('legacy', legacy_parse))
+    else:
+        print('beautifulsoup4 is not installed (pip install beautifulsoup4), skipping the legacy parser.\n')
+
+    print(f"{'page':32} {'parser':8} {'read KB':>8} {'ms':>8} {'peak KB':>8}  title")
+    for name, (body, content_type) in pages.items():
+        for label, parse in parsers:
+            result, consumed, elapsed_ms, peak = _measure(parse, body, content_type, args.repeat)
+            print(f"{name[:32]:32} {label:8} {consumed / 1024:8.1f} {elapsed_ms:8.2f} {peak / 1024:8.1f}  {result.get('title')!r}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
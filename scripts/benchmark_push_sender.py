@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""Benchmark push delivery against a local fake push service.
+
+Compares the previous delivery (``pywebpush.webpush`` per message, one
+after another: a new VAPID JWT and a new connection every time) with
+``push.PushSender`` (pooled connections per push service, cached VAPID
+headers, ``--concurrency`` requests in flight).
+
+The fake service answers every POST after ``--latency`` ms with 201, or
+410 for every ``--gone-every``-th subscription, and counts the TCP
+connections it accepted. Subscriptions get real P-256 keys, so payloads
+are encrypted exactly as for a browser.
+
+Usage:
+  python scripts/benchmark_push_sender.py
+  python scripts/benchmark_push_sender.py --messages 2000 --latency 80 --concurrency 32
+"""
+
+from __future__ import annotations
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+import argparse
+import base64
+import json
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
+
+from cryptography.hazmat.primitives import serialization  # noqa: E402
+from cryptography.hazmat.primitives.asymmetric import ec  # noqa: E402
+
+from push import GONE, SENT, PushSender, _outcome  # noqa: E402
+
+SUBJECT = 'mailto:benchmark@example.org'
+
+
+def _b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+
+class FakePushService(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, latency: float):
+        super().__init__(('127.0.0.1', 0), _FakePushHandler)
+        self.latency = latency
+        self.connections = 0
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+
+class _FakePushHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        with self.server.lock:
+            self.server.requests += 1
+        time.sleep(self.server.latency)
+        status = 410 if self.path.startswith('/gone/') else 201
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def _subscriptions(base_url: str, count: int, gone_every: int) -> list[dict]:
+    subscriptions = []
+    for index in range(count):
+        key = ec.generate_private_key(ec.SECP256R1())
+        public = key.public_key().public_bytes(serialization.Encoding.X962, serialization.PublicFormat.UncompressedPoint)
+        kind = 'gone' if gone_every and index % gone_every == gone_every - 1 else 'ok'
+        subscriptions.append({
+            'endpoint': f'{base_url}/{kind}/{index}',
+            'keys': {'p256dh': _b64(public), 'auth': _b64(os.urandom(16))},
+        })
+    return subscriptions
+
+
+def _vapid_private_key() -> str:
+    key = ec.generate_private_key(ec.SECP256R1())
+    return _b64(key.private_numbers().private_value.to_bytes(32, 'big'))
+
+
+def legacy_send_all(private_key: str, messages: list[tuple[dict, str]]) -> list[str]:
+    """The previous send_push_notification loop."""
+    from pywebpush import webpush, WebPushException
+
+    outcomes = []
+    for info, data in messages:
+        try:
+            webpush(subscription_info=info, data=data, vapid_private_key=private_key,
+                    vapid_claims={'sub': SUBJECT}, timeout=10)
+            outcomes.append(SENT)
+        except WebPushException as exc:
+            outcomes.append(_outcome(getattr(exc.response, 'status_code', None), str(exc))[0])
+    return outcomes
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=500, help='Pushes to send (one per subscription)')
+    parser.add_argument('--latency', type=float, default=50, help='Response time of the fake service in ms')
+    parser.add_argument('--concurrency', type=int, default=16, help='Requests in flight for PushSender')
+    parser.add_argument('--gone-every', type=int, default=10, help='Every n-th subscription answers 410 (0: none)')
+    args = parser.parse_args()
+
+    private_key = _vapid_private_key()
+    data = json.dumps({'title': 'Benchmark', 'message': 'x' * 120, 'type': 'reaction', 'link': '/', 'unread_count': 3})
+
+    print(f'{args.messages} pushes, {args.latency:.0f} ms service latency')
+    print(f"{'sender':22} {'seconds':>8} {'pushes/s':>9} {'connections':>12} {'signatures':>11} {'gone':>5}")
+    for label in ('legacy (serial)', f'PushSender ({args.concurrency})'):
+        service = FakePushService(args.latency / 1000)
+        threading.Thread(target=service.serve_forever, daemon=True).start()
+        messages = [(info, data) for info in _subscriptions(service.url, args.messages, args.gone_every)]
+        started = time.perf_counter()
+        if label.startswith('legacy'):
+            outcomes = legacy_send_all(private_key, messages)
+            signatures = len(messages)
+        else:
+            sender = PushSender(private_key, SUBJECT, concurrency=args.concurrency)
+            outcomes = [outcome for outcome, _error in sender.send_many(messages)]
+            signatures = sender.stats()['vapid_signatures']
+            sender.close()
+        elapsed = time.perf_counter() - started
+        service.shutdown()
+        print(f'{label:22} {elapsed:8.2f} {len(messages) / elapsed:9.1f} {service.connections:12} '
+              f'{signatures:11} {outcomes.count(GONE):5}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""Load test the feed endpoints of a running Chronicle instance.
+
+Logs in once, then requests the given paths from concurrent clients for a
+fixed duration and reports throughput and latency percentiles. Run it once
+against ``WEB_WORKERS=1`` and once against ``WEB_WORKERS=N`` to compare, on
+a host with at least N cores and with Postgres and Redis
+(``scripts/loadtest_workers.sh`` does both runs on the Docker Compose stack).
+
+Usage:
+  python scripts/loadtest_feed.py --base-url http://localhost:5000 --login alice:secret
+  python scripts/loadtest_feed.py --base-url http://localhost:5000 --login alice:secret \\
+      --concurrency 32 --duration 30 --path /feed --path '/feed/api?page=2'
+
+Exit codes:
+  0 = OK
+  1 = Login failed or no request succeeded
+"""
+
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import re
+import statistics
+import sys
+import threading
+import time
+
+import requests
+
+DEFAULT_PATHS = ['/feed/api', '/feed/api?page=2', '/feed']
+
+
+def _login(base_url: str, credentials: str) -> requests.Session:
+    username, _, password = credentials.partition(':')
+    session = requests.Session()
+    page = session.get(f'{base_url}/auth/login', timeout=10)
+    match = re.search(r'name="csrf_token" value="([^"]+)"', page.text)
+    data = {'username': username, 'password': password}
+    if match:
+        data['csrf_token'] = match.group(1)
+    response = session.post(f'{base_url}/auth/login', data=data, timeout=10, allow_redirects=False)
+    if response.status_code not in (301, 302, 303):
+        raise SystemExit(f'Login failed with status {response.status_code}')
+    return session
+
+
+def _client(base_url: str, paths: list[str], cookies, deadline: float, results: list, errors: list, lock) -> None:
+    session = requests.Session()
+    session.cookies.update(cookies)
+    latencies = []
+    failed = 0
+    index = 0
+    while time.perf_counter() < deadline:
+        path = paths[index % len(paths)]
+        index += 1
+        started = time.perf_counter()
+        try:
+            response = session.get(f'{base_url}{path}', timeout=30, allow_redirects=False)
+            ok = response.status_code == 200
+        except requests.RequestException:
+            ok = False
+        if ok:
+            latencies.append(time.perf_counter() - started)
+        else:
+            failed += 1
+    with lock:
+        results.extend(latencies)
+        errors.append(failed)
+
+
+def _percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--base-url', default='http://localhost:5000')
+    parser.add_argument('--login', required=True, help='username:password of an existing user')
+    parser.add_argument('--path', action='append', help='Path to request (repeatable)')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=20, help='Seconds per run')
+    args = parser.parse_args()
+
+    base_url = args.base_url.rstrip('/')
+    paths = args.path or DEFAULT_PATHS
+    cookies = _login(base_url, args.login).cookies
+
+    results, errors, lock = [], [], threading.Lock()
+    deadline = time.perf_counter() + args.duration
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        for _ in range(args.concurrency):
+            pool.submit(_client, base_url, paths, cookies, deadline, results, errors, lock)
+
+    if not results:
+        print('No successful requests.')
+        return 1
+    print(f'paths:       {", ".join(paths)}')
+    print(f'concurrency: {args.concurrency}, duration: {args.duration:.0f}s')
+    print(f'requests:    {len(results)} ok, {sum(errors)} failed')
+    print(f'throughput:  {len(results) / args.duration:.1f} req/s')
+    print(f'latency ms:  p50 {statistics.median(results) * 1000:.1f}  '
+          f'p95 {_percentile(results, 95) * 1000:.1f}  p99 {_percentile(results, 99) * 1000:.1f}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,36 @@
+#!/usr/bin/env bash
+# Compare feed throughput of WEB_WORKERS=1 and WEB_WORKERS=N on the Docker
+# Compose stack (Postgres, Redis cache/rate limits/Socket.IO message queue).
+#
+# Usage: LOGIN=alice:secret scripts/loadtest_workers.sh [N] [extra loadtest_feed.py args]
+#
+# Needs at least N cores: with fewer, the workers only take turns on the same
+# CPU and the comparison says nothing about the multi-core gain.
+set -euo pipefail
+
+REPO_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")/.." && pwd)"
+cd "$REPO_DIR"
+
+WORKERS="${1:-4}"
+shift || true
+: "${LOGIN:?set LOGIN=username:password of an existing user}"
+BASE_URL="${BASE_URL:-http://localhost:5000}"
+CORES="$(nproc)"
+
+log() { printf '[loadtest] %s\n' "$*"; }
+
+if (( CORES < WORKERS )); then
+  log "Only $CORES core(s) for $WORKERS workers; run this on a host with at least $WORKERS cores."
+  exit 2
+fi
+
+for n in 1 "$WORKERS"; do
+  log "Starting web with WEB_WORKERS=$n…"
+  WEB_WORKERS="$n" docker compose up -d --build --force-recreate web
+  for _ in $(seq 1 60); do
+    curl -fsS -o /dev/null "$BASE_URL/auth/login" && break
+    sleep 2
+  done
+  log "WEB_WORKERS=$n, $CORES cores, Postgres + Redis:"
+  python scripts/loadtest_feed.py --base-url "$BASE_URL" --login "$LOGIN" --concurrency 32 --duration 30 "$@"
+done
@@ -9,8 +9,15 @@ from extensions import db
 from models import (
     User, Post, Comment, Reaction, Bookmark, 
     Notification, Tag, Group, GroupMembership, GroupFile,
-    Poll, PollVote, Media, post_tags
+    Poll, PollVote, Media, NotificationOutbox, post_tags
 )
+from url_metadata import metadata_stats
+from http_client import client_stats
+from executor import executor_stats
+from image_variants import encoder_stats
+from notification_outbox import outbox_stats
+from push import push_stats
+from websocket import broadcast_stats
 
 admin_bp = Blueprint('admin', __name__, url_prefix='/analytics')
 
@@ -118,6 +125,14 @@ def dashboard():
         'media': {
             'total': Media.query.count(),
             'total_size': db.session.query(func.coalesce(func.sum(Media.file_size), 0)).scalar() or 0,
+            'avg_image_size': db.session.query(func.avg(Media.file_size)).filter(
+                Media.file_type.like('image/%'), Media.status == 'ready'
+            ).scalar() or 0,
+            'max_image_size': db.session.query(func.max(Media.file_size)).filter(
+                Media.file_type.like('image/%'), Media.status == 'ready'
+            ).scalar() or 0,
+            'pending': Media.query.filter_by(status='pending').count(),
+            'failed': Media.query.filter_by(status='failed').count(),
         },
         'group_files': {
             'total': GroupFile.query.count(),
@@ -330,6 +345,16 @@ def stats_realtime():
         'active_users_today': db.session.query(func.count(distinct(Post.user_id))).filter(
             Post.created_at >= today
         ).scalar() or 0,
+        'link_metadata': metadata_stats(),
+        'outbound_http': client_stats(),
+        'executor': executor_stats(),
+        'image_encoder': encoder_stats(),
+        'notification_outbox': {
+            **outbox_stats(),
+            'pending': NotificationOutbox.query.filter_by(status='pending').count(),
+        },
+        'push': push_stats(),
+        'reaction_broadcasts': broadcast_stats(),
         'timestamp': now.isoformat()
     })
 
@@ -162,6 +162,23 @@ def _load_or_create_secret_key(instance_path: str) -> str:
     return secret_key
 
 
+def _check_shared_state(app) -> None:
+    """Refuse to run several worker processes with per-process caches, rate limits or emits."""
+    if app.config.get("WEB_WORKERS", 1) <= 1 or app.config.get("TESTING"):
+        return
+    problems = []
+    if app.config.get("CACHE_TYPE") != "RedisCache":
+        problems.append(f"CACHE_TYPE is {app.config.get('CACHE_TYPE')}")
+    if str(app.config.get("RATELIMIT_STORAGE_URL", "memory://")).startswith("memory://"):
+        problems.append("rate limits are stored in memory")
+    if not app.config.get("SOCKETIO_MESSAGE_QUEUE"):
+        problems.append("Socket.IO has no message queue")
+    if problems:
+        raise RuntimeError(
+            f"WEB_WORKERS={app.config['WEB_WORKERS']} needs REDIS_URL in production mode: " + ", ".join(problems)
+        )
+
+
 def create_app(config: dict | None = None):
     """Application factory with optional configuration overrides."""
     app = Flask(__name__, static_folder="static", template_folder="templates")
@@ -230,6 +247,100 @@ def create_app(config: dict | None = None):
         app.config["CACHE_TYPE"] = "SimpleCache"
         app.config["CACHE_DEFAULT_TIMEOUT"] = 300
     
+    # Scheduled-post publishing: "embedded" runs it inside the web process,
+    # "worker" expects a separate `flask chronicle scheduler` process, "off" disables it.
+    app.config["SCHEDULER_MODE"] = (os.getenv("SCHEDULER_MODE", "embedded") or "embedded").strip().lower()
+    try:
+        app.config["SCHEDULER_BATCH_SIZE"] = int(os.getenv("SCHEDULER_BATCH_SIZE", "100"))
+    except ValueError:
+        app.config["SCHEDULER_BATCH_SIZE"] = 100
+    try:
+        app.config["SCHEDULER_MAX_SLEEP_SECONDS"] = float(os.getenv("SCHEDULER_MAX_SLEEP_SECONDS", "30"))
+    except ValueError:
+        app.config["SCHEDULER_MAX_SLEEP_SECONDS"] = 30.0
+
+    # Link previews: "background" fetches them in a worker pool after the post is saved,
+    # "inline" inside the request. Workers bound the total concurrency, PER_HOST each site.
+    app.config["LINK_PREVIEW_MODE"] = (os.getenv("LINK_PREVIEW_MODE", "background") or "background").strip().lower()
+    try:
+        app.config["LINK_PREVIEW_WORKERS"] = int(os.getenv("LINK_PREVIEW_WORKERS", "4"))
+    except ValueError:
+        app.config["LINK_PREVIEW_WORKERS"] = 4
+    try:
+        app.config["LINK_PREVIEW_PER_HOST"] = int(os.getenv("LINK_PREVIEW_PER_HOST", "2"))
+    except ValueError:
+        app.config["LINK_PREVIEW_PER_HOST"] = 2
+
+    # CPU-bound work (images, Markdown, password hashes) runs in this many native threads
+    # under eventlet; hub stalls longer than HUB_BLOCK_WARN_MS are logged
+    try:
+        app.config["CPU_POOL_SIZE"] = int(os.getenv("CPU_POOL_SIZE", "4"))
+    except ValueError:
+        app.config["CPU_POOL_SIZE"] = 4
+    try:
+        app.config["HUB_BLOCK_WARN_MS"] = int(os.getenv("HUB_BLOCK_WARN_MS", "500"))
+    except ValueError:
+        app.config["HUB_BLOCK_WARN_MS"] = 500
+
+    # Outbound HTTP client (http_client.py): keep-alive connections per host, DNS cache lifetime
+    try:
+        app.config["OUTBOUND_HTTP_PER_HOST"] = int(os.getenv("OUTBOUND_HTTP_PER_HOST", "4"))
+    except ValueError:
+        app.config["OUTBOUND_HTTP_PER_HOST"] = 4
+    try:
+        app.config["OUTBOUND_DNS_TTL"] = int(os.getenv("OUTBOUND_DNS_TTL", "300"))
+    except ValueError:
+        app.config["OUTBOUND_DNS_TTL"] = 300
+
+    # Shared link metadata cache: lifetime of fetched metadata and of remembered failures
+    try:
+        app.config["URL_METADATA_TTL"] = int(os.getenv("URL_METADATA_TTL", str(7 * 24 * 3600)))
+    except ValueError:
+        app.config["URL_METADATA_TTL"] = 7 * 24 * 3600
+    try:
+        app.config["URL_METADATA_FAILURE_TTL"] = int(os.getenv("URL_METADATA_FAILURE_TTL", "3600"))
+    except ValueError:
+        app.config["URL_METADATA_FAILURE_TTL"] = 3600
+
+    # Rendered Markdown cache: number of entries kept in the in-process LRU
+    try:
+        app.config["RENDER_CACHE_LRU_SIZE"] = int(os.getenv("RENDER_CACHE_LRU_SIZE", "2048"))
+    except ValueError:
+        app.config["RENDER_CACHE_LRU_SIZE"] = 2048
+
+    # Image uploads (image_variants.py): originals are kept outside static, responsive
+    # variants are created by a worker pool ("background") or inside the request ("inline")
+    app.config["IMAGE_ORIGINALS_FOLDER"] = os.getenv("IMAGE_ORIGINALS_FOLDER") or os.path.join(instance_path, "originals")
+    app.config["IMAGE_PROCESSING_MODE"] = (os.getenv("IMAGE_PROCESSING_MODE", "background") or "background").strip().lower()
+    try:
+        app.config["IMAGE_PROCESSING_WORKERS"] = int(os.getenv("IMAGE_PROCESSING_WORKERS", "2"))
+    except ValueError:
+        app.config["IMAGE_PROCESSING_WORKERS"] = 2
+    app.config["IMAGE_VARIANT_FORMATS"] = tuple(
+        fmt.strip().lower() for fmt in os.getenv("IMAGE_VARIANT_FORMATS", "avif,webp").split(",") if fmt.strip()
+    )
+
+    # Push notifications (notification_outbox.py): "embedded" runs a dispatcher in every web
+    # process, "worker" leaves delivery to `flask chronicle notification-dispatcher`
+    app.config["NOTIFICATION_DISPATCH_MODE"] = (os.getenv("NOTIFICATION_DISPATCH_MODE", "embedded") or "embedded").strip().lower()
+    try:
+        app.config["NOTIFICATION_DISPATCH_BATCH_SIZE"] = int(os.getenv("NOTIFICATION_DISPATCH_BATCH_SIZE", "100"))
+    except ValueError:
+        app.config["NOTIFICATION_DISPATCH_BATCH_SIZE"] = 100
+    try:
+        app.config["NOTIFICATION_DISPATCH_POLL_SECONDS"] = float(os.getenv("NOTIFICATION_DISPATCH_POLL_SECONDS", "5"))
+    except ValueError:
+        app.config["NOTIFICATION_DISPATCH_POLL_SECONDS"] = 5.0
+    try:
+        app.config["PUSH_CONCURRENCY"] = int(os.getenv("PUSH_CONCURRENCY", "16"))
+    except ValueError:
+        app.config["PUSH_CONCURRENCY"] = 16
+    # Reaction changes of a post are broadcast at most once per interval (see websocket.py)
+    try:
+        app.config["REACTION_BROADCAST_SECONDS"] = float(os.getenv("REACTION_BROADCAST_SECONDS", "1"))
+    except ValueError:
+        app.config["REACTION_BROADCAST_SECONDS"] = 1.0
+
     # CDN configuration
     app.config["CDN_DOMAIN"] = os.getenv("CDN_DOMAIN", None)
     
@@ -241,22 +352,41 @@ def create_app(config: dict | None = None):
     else:
         app.config["RATELIMIT_STORAGE_URL"] = "memory://"
 
-    db.init_app(app)
-    csrf.init_app(app)
-    if cache:
-        cache.init_app(app)
-    if limiter:
-        limiter.init_app(app)
-    migrate.init_app(app, db)
-    
+    # Socket.IO message queue for emits across processes (see websocket.py)
+    # In development (local run without Docker), don't use Redis message queue
+    if redis_url and env != "development" and not is_windows:
+        app.config["SOCKETIO_MESSAGE_QUEUE"] = redis_url
+    else:
+        app.config["SOCKETIO_MESSAGE_QUEUE"] = None
+
+    # Redis channel that wakes the scheduler in whichever process holds its lock
+    app.config["SCHEDULER_WAKEUP_URL"] = app.config["SOCKETIO_MESSAGE_QUEUE"]
+
+    # Worker processes serving this app (gunicorn.conf.py); several of them must share
+    # caches, rate limits and Socket.IO emits through Redis
+    try:
+        app.config["WEB_WORKERS"] = max(1, int(os.getenv("WEB_WORKERS", "1")))
+    except ValueError:
+        app.config["WEB_WORKERS"] = 1
+
     # Babel i18n configuration
     app.config['BABEL_SUPPORTED_LOCALES'] = ['de', 'en', 'es', 'fr']
     default_locale = _determine_default_locale(app.config['BABEL_SUPPORTED_LOCALES'])
     app.config['BABEL_DEFAULT_LOCALE'] = default_locale
     app.config['BABEL_TRANSLATION_DIRECTORIES'] = os.path.join(os.path.dirname(__file__), 'translations')
     
+    # Overrides (tests) must be in place before the extensions read the config
     if config:
         app.config.update(config)
+    _check_shared_state(app)
+    
+    db.init_app(app)
+    csrf.init_app(app)
+    if cache:
+        cache.init_app(app)
+    if limiter:
+        limiter.init_app(app)
+    migrate.init_app(app, db)
     
     def get_locale():
         supported = app.config.get('BABEL_SUPPORTED_LOCALES', [])
@@ -297,10 +427,12 @@ def create_app(config: dict | None = None):
     # Import models and create tables
     with app.app_context():
         from models import User, PasswordResetToken, Invite, Page, Post, Media, LinkPreview, Tag, Category, Reaction, Bookmark, Comment, CommentReaction, Notification, Follow, Poll, PollOption, PollVote, PostVersion, Group, GroupMembership, GroupFile
+        from sqlalchemy import inspect, text
+        # Per-emoji comment reaction counters (see counters.py); filled by reconcile_counters() below
+        comment_reaction_counts_added = 'comment_reaction_counts' not in inspect(db.engine).get_table_names()
         db.create_all()
         
         # Migration: Add new columns if they don't exist
-        from sqlalchemy import inspect, text
         inspector = inspect(db.engine)
         dialect = db.engine.dialect.name
         bool_default_true = 'TRUE' if dialect == 'postgresql' else '1'
@@ -312,6 +444,14 @@ def create_app(config: dict | None = None):
             db.session.execute(text('ALTER TABLE media ADD COLUMN caption TEXT'))
         if 'order' not in media_columns:
             db.session.execute(text('ALTER TABLE media ADD COLUMN "order" INTEGER DEFAULT 0'))
+        if 'status' not in media_columns:
+            db.session.execute(text("ALTER TABLE media ADD COLUMN status VARCHAR(20) NOT NULL DEFAULT 'ready'"))
+        if 'width' not in media_columns:
+            db.session.execute(text('ALTER TABLE media ADD COLUMN width INTEGER'))
+        if 'height' not in media_columns:
+            db.session.execute(text('ALTER TABLE media ADD COLUMN height INTEGER'))
+        if 'variants' not in media_columns:
+            db.session.execute(text('ALTER TABLE media ADD COLUMN variants TEXT'))
         
         # Check User table columns for new theme/layout fields
         user_columns = [col['name'] for col in inspector.get_columns('users')]
@@ -366,6 +506,33 @@ def create_app(config: dict | None = None):
 
         if 'published_at' not in post_columns:
             db.session.execute(text('ALTER TABLE posts ADD COLUMN published_at TIMESTAMP'))
+
+        # The scheduler looks up the next due post by scheduled_at
+        db.session.execute(text('CREATE INDEX IF NOT EXISTS ix_posts_scheduled_at ON posts(scheduled_at)'))
+
+        # Stored effective publish time; filled in batches by backfill_effective_at() below
+        # (see migrations/versions/*_add_post_effective_at.py)
+        effective_at_added = False
+        if 'effective_at' not in post_columns:
+            db.session.execute(text('ALTER TABLE posts ADD COLUMN effective_at TIMESTAMP'))
+            effective_at_added = True
+        db.session.execute(text(
+            'CREATE INDEX IF NOT EXISTS ix_posts_published_effective_at ON posts(is_published, effective_at DESC, id)'
+        ))
+        db.session.execute(text('CREATE INDEX IF NOT EXISTS ix_posts_user_effective_at ON posts(user_id, effective_at)'))
+        db.session.execute(text('CREATE INDEX IF NOT EXISTS ix_posts_group_effective_at ON posts(group_id, effective_at)'))
+
+        # Denormalized counters (see counters.py); filled by reconcile_counters() below
+        counters_added = False
+        for col in ('comment_count', 'bookmark_count'):
+            if col not in post_columns:
+                db.session.execute(text(f'ALTER TABLE posts ADD COLUMN {col} INTEGER NOT NULL DEFAULT 0'))
+                counters_added = True
+        if 'poll_options' in inspector.get_table_names():
+            poll_option_columns = [col['name'] for col in inspector.get_columns('poll_options')]
+            if 'vote_count' not in poll_option_columns:
+                db.session.execute(text('ALTER TABLE poll_options ADD COLUMN vote_count INTEGER NOT NULL DEFAULT 0'))
+                counters_added = True
         
         # Check Group table columns
         if 'groups' in inspector.get_table_names():
@@ -375,6 +542,17 @@ def create_app(config: dict | None = None):
             if 'icon_url' not in group_columns:
                 db.session.execute(text('ALTER TABLE groups ADD COLUMN icon_url VARCHAR(500)'))
 
+        # Comment threading (see migrations/versions/*_add_comment_paths.py)
+        comment_columns = [col['name'] for col in inspector.get_columns('comments')]
+        comment_paths_added = False
+        if 'depth' not in comment_columns:
+            db.session.execute(text('ALTER TABLE comments ADD COLUMN depth INTEGER NOT NULL DEFAULT 0'))
+        if 'path' not in comment_columns:
+            db.session.execute(text('ALTER TABLE comments ADD COLUMN path VARCHAR(255)'))
+            comment_paths_added = True
+        db.session.execute(text('CREATE INDEX IF NOT EXISTS ix_comments_post_parent_id ON comments(post_id, parent_id, id)'))
+        db.session.execute(text('CREATE INDEX IF NOT EXISTS ix_comments_post_path ON comments(post_id, path)'))
+
         # Create comment_reactions table if not exists
         if 'comment_reactions' not in inspector.get_table_names():
             db.create_all()
@@ -382,6 +560,13 @@ def create_app(config: dict | None = None):
         # Create link_previews table if not exists
         if 'link_previews' not in inspector.get_table_names():
             db.create_all()
+        else:
+            link_preview_columns = [col['name'] for col in inspector.get_columns('link_previews')]
+            if 'status' not in link_preview_columns:
+                db.session.execute(text("ALTER TABLE link_previews ADD COLUMN status VARCHAR(20) NOT NULL DEFAULT 'ready'"))
+            if 'url_metadata_id' not in link_preview_columns:
+                db.session.execute(text('ALTER TABLE link_previews ADD COLUMN url_metadata_id INTEGER REFERENCES url_metadata(id)'))
+            db.session.execute(text('CREATE INDEX IF NOT EXISTS ix_link_previews_url_metadata_id ON link_previews (url_metadata_id)'))
         
         # Create group_announcements table if not exists
         if 'group_announcements' not in inspector.get_table_names():
@@ -409,6 +594,18 @@ def create_app(config: dict | None = None):
         
         db.session.commit()
 
+        if counters_added or comment_reaction_counts_added:
+            from counters import reconcile_counters
+            reconcile_counters()
+
+        if comment_paths_added:
+            from queries import backfill_comment_paths
+            backfill_comment_paths()
+
+        if effective_at_added:
+            from queries import backfill_effective_at
+            backfill_effective_at()
+
         # Process invitation list (invites.txt) on startup
         try:
             from flask_babel import force_locale, gettext as _
@@ -523,30 +720,20 @@ def create_app(config: dict | None = None):
             except Exception:
                 return None
     
-    # Auto-publish scheduled posts whose time has passed
-    def autopublish_due_posts():
-        from models import Post
-        updated = Post.query.filter(
-            Post.scheduled_at.isnot(None),
-            Post.scheduled_at <= db.func.now()
-        ).update(
-            {
-                Post.is_published: True,
-                Post.published_at: Post.scheduled_at,
-                Post.scheduled_at: None
-            },
-            synchronize_session=False
-        )
-        if updated:
-            db.session.commit()
-            try:
-                app.logger.info('Auto-published %s scheduled posts', updated)
-            except Exception:
-                pass
+    # Scheduled posts are published by the scheduler (see scheduler.py),
+    # not on the request path.
+    from scheduler import init_scheduler, post_published
+    from render_cache import prerender_posts
+    post_published.connect(prerender_posts)
+    init_scheduler(app)
+
+    # Push notifications are delivered from the outbox, not on the request path
+    from notification_outbox import init_dispatcher
+    init_dispatcher(app)
 
-    @app.before_request
-    def handle_autopublish():
-        autopublish_due_posts()
+    # CPU-bound work leaves the eventlet hub through executor.run_blocking
+    from executor import init_executor
+    init_executor(app)
 
     # Register blueprints
     from auth import auth_bp, init_oauth
@@ -699,10 +886,16 @@ def create_app(config: dict | None = None):
         return redirect(referrer or url_for('blog.feed'))
     
     # Add custom Jinja2 filters
-    from content_utils import highlight_search_terms, generate_toc, render_markdown
+    from content_utils import highlight_search_terms, generate_toc
+    from render_cache import render_markdown_cached
     app.jinja_env.filters['highlight'] = highlight_search_terms
     app.jinja_env.filters['generate_toc'] = generate_toc
-    app.jinja_env.filters['markdown'] = render_markdown
+    app.jinja_env.filters['markdown'] = render_markdown_cached
+
+    # Responsive images (components/picture.html)
+    from image_variants import media_image, profile_image
+    app.jinja_env.globals['media_image'] = media_image
+    app.jinja_env.globals['profile_image'] = profile_image
     
     # i18n date formatting filter
     def format_datetime_i18n(dt, include_time=True):
@@ -787,6 +980,133 @@ def register_cli_commands(app):
         _run_babel_command(['pybabel', 'compile', '-d', 'translations', '-f'])
         click.echo("Translations compiled successfully.")
 
+    @app.cli.group()
+    def chronicle():
+        """Chronicle maintenance and background workers."""
+        pass
+
+    @chronicle.command('scheduler')
+    @click.option('--once', is_flag=True, help='Publish due posts once and exit.')
+    def scheduler_command(once):
+        """Run the scheduled-post publisher in the foreground."""
+        from scheduler import autopublish_due_posts, run_scheduler
+
+        if once:
+            published = autopublish_due_posts()
+            click.echo(f"Published {len(published)} scheduled posts.")
+            return
+        click.echo("Scheduler running. Press Ctrl+C to stop.")
+        try:
+            run_scheduler(app)
+        except KeyboardInterrupt:
+            pass
+
+    @chronicle.command('notification-dispatcher')
+    @click.option('--once', is_flag=True, help='Deliver due pushes once and exit.')
+    def notification_dispatcher_command(once):
+        """Deliver queued push notifications in the foreground."""
+        from notification_outbox import dispatch_due, outbox_stats, run_dispatcher
+
+        if once:
+            handled = 0
+            while True:
+                count = dispatch_due()
+                handled += count
+                if count < app.config['NOTIFICATION_DISPATCH_BATCH_SIZE']:
+                    break
+            stats = outbox_stats()
+            click.echo(f"Handled {handled} notifications: {stats['delivered']} delivered, "
+                       f"{stats['retried']} retried, {stats['failed']} failed, {stats['skipped']} skipped.")
+            return
+        click.echo("Notification dispatcher running. Press Ctrl+C to stop.")
+        try:
+            run_dispatcher(app)
+        except KeyboardInterrupt:
+            pass
+
+    @chronicle.command('backfill-render-cache')
+    @click.option('--batch-size', default=500, show_default=True, help='Rows loaded per batch.')
+    @click.option('--rebuild', is_flag=True, help='Drop all persisted renders first.')
+    def backfill_render_cache(batch_size, rebuild):
+        """Render and persist HTML for all posts, comments and announcements."""
+        from models import Post, Comment, GroupAnnouncement, RenderedContent
+        from render_cache import render_many, clear_lru
+
+        if rebuild:
+            RenderedContent.query.delete(synchronize_session=False)
+            db.session.commit()
+            clear_lru()
+
+        total = 0
+        for model in (Post, Comment, GroupAnnouncement):
+            last_id = 0
+            while True:
+                rows = db.session.query(model.id, model.content).filter(
+                    model.id > last_id,
+                    model.content.isnot(None)
+                ).order_by(model.id.asc()).limit(batch_size).all()
+                if not rows:
+                    break
+                render_many([row.content for row in rows])
+                total += len(rows)
+                last_id = rows[-1].id
+                db.session.remove()
+            click.echo(f"{model.__tablename__}: done")
+        click.echo(f"Processed {total} rows.")
+
+    @chronicle.command('reconcile-counters')
+    @click.option('--batch-size', default=1000, show_default=True, help='Posts per batch.')
+    def reconcile_counters_command(batch_size):
+        """Recompute reaction, comment, bookmark and vote counters from the raw rows."""
+        from counters import reconcile_counters
+
+        fixed = reconcile_counters(batch_size=batch_size)
+        for name, count in fixed.items():
+            click.echo(f"{name}: {count} corrected")
+
+    @chronicle.command('refresh-link-metadata')
+    @click.option('--limit', default=200, show_default=True, help='Expired entries re-fetched per run.')
+    def refresh_link_metadata_command(limit):
+        """Re-fetch expired link metadata that previews still use and drop unused entries."""
+        from url_metadata import refresh_stale_metadata, metadata_stats
+
+        result = refresh_stale_metadata(limit=limit)
+        click.echo(f"Refreshed {result['refreshed']}, removed {result['removed']} entries.")
+        stats = metadata_stats()
+        click.echo(f"Fetches: {stats['fetches']}, failures: {stats['failures']}")
+
+    @chronicle.command('backfill-image-variants')
+    @click.option('--batch-size', default=100, show_default=True, help='Media rows loaded per batch.')
+    def backfill_image_variants(batch_size):
+        """Create responsive variants for existing uploads, avatars, covers and group icons."""
+        from models import Media, User, Group
+        from image_variants import pending_media, backfill_media, backfill_profile_image
+
+        processed = failed = 0
+        last_id = 0
+        while True:
+            rows = pending_media().filter(Media.id > last_id).limit(batch_size).all()
+            if not rows:
+                break
+            for media in rows:
+                backfill_media(media)
+                if media.status == 'ready':
+                    processed += 1
+                else:
+                    failed += 1
+            last_id = rows[-1].id
+            db.session.remove()
+        click.echo(f"media: {processed} processed, {failed} failed")
+
+        for model, fields in ((User, (('avatar_url', 'avatar'), ('cover_image_url', 'cover'))),
+                              (Group, (('cover_image_url', 'cover'), ('icon_url', 'icon')))):
+            count = 0
+            for obj in model.query.order_by(model.id.asc()).all():
+                for attr, kind in fields:
+                    if backfill_profile_image(obj, attr, kind):
+                        count += 1
+            click.echo(f"{model.__tablename__}: {count} images processed")
+
 if __name__ == "__main__":
     app = create_app()
     
@@ -3,14 +3,21 @@ import uuid
 from datetime import datetime, timedelta, timezone
 from io import BytesIO
 from urllib.parse import urlparse
-from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, abort, session, current_app
+from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, abort, session, current_app, get_template_attribute
 from flask_login import login_required, current_user
 from flask_babel import gettext as _
-from werkzeug.utils import secure_filename
-from PIL import Image
 from extensions import db
-from models import User, Page, Post, Media, LinkPreview, Tag, Poll, PollOption, PostVersion, Notification, Group, GroupMembership, GroupFile, Reaction, Bookmark, Comment, CommentReaction, Follow
-from content_utils import process_link_preview, extract_urls, render_markdown, get_embed_html, extract_mentions
+from models import User, Page, Post, Media, Tag, Poll, PollOption, PostVersion, Notification, NotificationOutbox, Group, GroupMembership, GroupFile, Reaction, Bookmark, Comment, CommentReaction, Follow
+from content_utils import render_markdown, get_embed_html, extract_mentions
+from link_previews import add_pending_previews, sync_pending_previews, enqueue_previews, fetch_preview
+from image_variants import InvalidImage, add_post_image, enqueue_media, replace_profile_image, delete_image_files
+from scheduler import notify_schedule_changed
+from executor import run_blocking
+from render_cache import render_markdown_cached, invalidate_rendered
+from pagination import paginate_posts
+from serializers import with_post_relations, serialize_feed_posts, serialize_profile_posts, serialize_own_posts
+from queries import delete_comment_dependents, delete_posts, group_post_counts, visible_post_ids
+from counters import reconcile_counters
 
 try:
     from zoneinfo import ZoneInfo
@@ -63,7 +70,6 @@ def format_datetime_i18n(dt):
 blog_bp = Blueprint('blog', __name__)
 
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
-MAX_IMAGE_RESOLUTION = 1920  # Max width/height in pixels (configurable)
 
 
 def allowed_file(filename):
@@ -76,64 +82,6 @@ def get_upload_folder(*subfolders: str):
     return upload_folder
 
 
-def resize_and_compress_image(file, max_size=MAX_IMAGE_RESOLUTION, quality=85):
-    """Resize and compress image for optimal web delivery."""
-    img = Image.open(file)
-    
-    # Handle EXIF orientation
-    try:
-        from PIL import ExifTags
-        for orientation in ExifTags.TAGS.keys():
-            if ExifTags.TAGS[orientation] == 'Orientation':
-                break
-        exif = img._getexif()
-        if exif:
-            orientation_value = exif.get(orientation)
-            if orientation_value == 3:
-                img = img.rotate(180, expand=True)
-            elif orientation_value == 6:
-                img = img.rotate(270, expand=True)
-            elif orientation_value == 8:
-                img = img.rotate(90, expand=True)
-    except (AttributeError, KeyError, IndexError):
-        pass
-    
-    # Convert RGBA to RGB for JPEG
-    if img.mode in ('RGBA', 'P'):
-        img = img.convert('RGB')
-    
-    # Resize if needed
-    width, height = img.size
-    if width > max_size or height > max_size:
-        if width > height:
-            new_width = max_size
-            new_height = int(height * (max_size / width))
-        else:
-            new_height = max_size
-            new_width = int(width * (max_size / height))
-        img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-    
-    return img, quality
-
-
-def save_compressed_image(img, filepath, quality=85):
-    """Save image with compression optimization."""
-    # Save with optimized settings
-    img.save(filepath, 'JPEG', quality=quality, optimize=True, progressive=True)
-    
-    # If file is still too large (>500KB), reduce quality further
-    file_size = os.path.getsize(filepath)
-    if file_size > 500 * 1024 and quality > 60:
-        new_quality = max(60, quality - 15)
-        img.save(filepath, 'JPEG', quality=new_quality, optimize=True, progressive=True)
-
-
-def resize_image(file, max_size=MAX_IMAGE_RESOLUTION):
-    """Convenience wrapper for resize_and_compress_image, returns only the image."""
-    img, _ = resize_and_compress_image(file, max_size)
-    return img
-
-
 def is_safe_next(next_url: str | None) -> bool:
     if not next_url:
         return False
@@ -148,9 +96,6 @@ def is_safe_next(next_url: str | None) -> bool:
     return False
 
 
-POSTS_PER_PAGE = 10
-
-
 def get_user_group_ids(user_id):
     """Get list of group IDs the user is a member of."""
     return [m.group_id for m in GroupMembership.query.filter_by(user_id=user_id).all()]
@@ -158,7 +103,7 @@ def get_user_group_ids(user_id):
 
 def build_feed_query(user_id, search_query='', tag_filter='', author_filter='', 
                      date_from='', date_to='', group_filter=''):
-    """Build the feed query with all filters applied. Returns (query, user_groups)."""
+    """Build the feed query with all filters applied. Returns (unordered query, user_groups)."""
     user_group_ids = get_user_group_ids(user_id)
 
     filters_active = any([
@@ -239,8 +184,7 @@ def build_feed_query(user_id, search_query='', tag_filter='', author_filter='',
         except ValueError:
             pass
     
-    # Order by effective publish date descending
-    posts_query = posts_query.order_by(db.func.coalesce(Post.scheduled_at, Post.published_at, Post.created_at).desc())
+    # Ordering (effective publish date descending) is applied by paginate_posts
     
     # Get user's groups for sidebar display
     user_groups = [m.group for m in GroupMembership.query.filter_by(user_id=user_id).all()]
@@ -265,14 +209,14 @@ def feed():
         date_from, date_to, group_filter
     )
     
-    total_posts = posts_query.count()
-    posts = posts_query.offset((page - 1) * POSTS_PER_PAGE).limit(POSTS_PER_PAGE).all()
-    has_more = (page * POSTS_PER_PAGE) < total_posts
+    posts, has_more, next_cursor = paginate_posts(with_post_relations(posts_query), page=page)
     
     return render_template('feed.html', 
                           posts=posts, 
+                          group_post_counts=group_post_counts([g.id for g in user_groups]),
                           current_page=page, 
                           has_more=has_more, 
+                          next_cursor=next_cursor,
                           search_query=search_query,
                           tag_filter=tag_filter,
                           author_filter=author_filter,
@@ -288,6 +232,7 @@ def feed():
 def feed_api():
     """API endpoint for loading more posts in the feed."""
     page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor')
     search_query = request.args.get('q', '').strip()
     tag_filter = request.args.get('tag', '').strip()
     author_filter = request.args.get('author', '').strip()
@@ -300,87 +245,13 @@ def feed_api():
         date_from, date_to, group_filter
     )
     
-    total_posts = posts_query.count()
-    posts = posts_query.offset((page - 1) * POSTS_PER_PAGE).limit(POSTS_PER_PAGE).all()
-    has_more = (page * POSTS_PER_PAGE) < total_posts
-    
-    posts_data = []
-    for post in posts:
-        author = post.author
-        author_is_deleted = bool(getattr(author, 'is_deleted', False))
-
-        author_payload = {
-            'id': author.id,
-            'is_deleted': author_is_deleted,
-            'username': author.username,
-            'display_name': author.display_name,
-            'avatar_url': author.avatar_url,
-            'theme_color': author.theme_color or '#4da9a4'
-        }
-
-        if author_is_deleted:
-            # Keep stable JSON shape, but do not leak profile-identifying fields into UI.
-            author_payload.update({
-                'username': None,
-                'display_name': None,
-                'avatar_url': None,
-                'theme_color': '#6b7280'
-            })
-
-        # Get poll data if exists
-        poll_data = None
-        if post.poll:
-            poll = post.poll
-            total_votes = sum(opt.votes.count() for opt in poll.options)
-            poll_data = {
-                'id': poll.id,
-                'question': poll.question,
-                'allows_multiple': poll.allows_multiple,
-                'total_votes': total_votes,
-                'options': [{
-                    'id': opt.id,
-                    'text': opt.text,
-                    'votes': opt.votes.count(),
-                    'percentage': round((opt.votes.count() / total_votes * 100) if total_votes > 0 else 0, 1)
-                } for opt in poll.options.order_by('order')]
-            }
-        
-        group_payload = None
-        if post.group:
-            group_payload = {
-                'id': post.group.id,
-                'slug': post.group.slug,
-                'name': post.group.name,
-                'color': post.group.color or '#6366f1'
-            }
-
-        posts_data.append({
-            'id': post.id,
-            'content': post.content,
-            'content_html': render_markdown(post.content) if post.content else '',
-            'created_at': format_datetime_i18n(post.scheduled_at or post.created_at),
-            'updated_at': post.updated_at.isoformat() if post.updated_at else None,
-            'is_edited': bool(post.updated_at and post.created_at and post.updated_at > post.created_at),
-            'is_owner': current_user.is_authenticated and current_user.id == post.user_id,
-            'author': author_payload,
-            'media': [{'url': m.file_path, 'file_type': m.file_type, 'alt_text': m.alt_text} for m in post.media_items.order_by('order').all()],
-            'tags': [{'name': t.name, 'slug': t.slug, 'color': t.color} for t in post.tags],
-            'poll': poll_data,
-            'group': group_payload,
-            'link_previews': [{
-                'embed_type': lp.embed_type,
-                'embed_id': lp.embed_id,
-                'url': lp.url,
-                'title': lp.title,
-                'description': lp.description,
-                'image_url': lp.image_url,
-                'site_name': lp.site_name
-            } for lp in post.link_previews]
-        })
+    posts, has_more, next_cursor = paginate_posts(with_post_relations(posts_query), cursor=cursor, page=page)
+    posts_data = serialize_feed_posts(posts)
     
     return jsonify({
         'posts': posts_data,
         'has_more': has_more,
+        'next_cursor': next_cursor,
         'page': page
     })
 
@@ -428,16 +299,14 @@ def public_profile(username):
                 Post.scheduled_at <= db.func.now()
             )
         )
-    posts_query = posts_query.order_by(db.func.coalesce(Post.scheduled_at, Post.published_at, Post.created_at).desc())
-    total_posts = posts_query.count()
-    posts = posts_query.offset((page - 1) * POSTS_PER_PAGE).limit(POSTS_PER_PAGE).all()
-    has_more = (page * POSTS_PER_PAGE) < total_posts
+    posts, has_more, next_cursor = paginate_posts(with_post_relations(posts_query), page=page)
     
     # Check if viewing own profile
     is_own_profile = current_user.is_authenticated and current_user.id == user.id
     
     return render_template('public_profile.html', profile_user=user, pages=pages, posts=posts, 
-                          current_page=page, has_more=has_more, is_own_profile=is_own_profile)
+                          current_page=page, has_more=has_more, next_cursor=next_cursor,
+                          is_own_profile=is_own_profile)
 
 
 @blog_bp.route('/u/<username>/api')
@@ -446,6 +315,7 @@ def public_profile_api(username):
     """API endpoint for loading more posts on public profile."""
     user = User.query.filter_by(username=username).first_or_404()
     page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor')
     
     posts_query = Post.query.filter_by(user_id=user.id, is_published=True)
     # Hide scheduled posts until publish time for non-owners
@@ -456,33 +326,17 @@ def public_profile_api(username):
                 Post.scheduled_at <= db.func.now()
             )
         )
-    posts_query = posts_query.order_by(db.func.coalesce(Post.scheduled_at, Post.published_at, Post.created_at).desc())
-    total_posts = posts_query.count()
-    posts = posts_query.offset((page - 1) * POSTS_PER_PAGE).limit(POSTS_PER_PAGE).all()
-    has_more = (page * POSTS_PER_PAGE) < total_posts
+    posts, has_more, next_cursor = paginate_posts(
+        with_post_relations(posts_query, with_polls=False), cursor=cursor, page=page
+    )
     
     is_own_profile = current_user.is_authenticated and current_user.id == user.id
-    
-    posts_data = []
-    for post in posts:
-        posts_data.append({
-            'id': post.id,
-            'title': post.title,
-            'content': post.content,
-            'content_html': render_markdown(post.content) if post.content else '',
-            'created_at': format_datetime_i18n(post.scheduled_at or post.published_at or post.created_at),
-            'updated_at': post.updated_at.isoformat() if post.updated_at else None,
-            'is_edited': bool(post.updated_at and post.created_at and post.updated_at > post.created_at),
-            'is_owner': is_own_profile,
-            'page_title': post.page.title if post.page else None,
-            'page_slug': post.page.slug if post.page else None,
-            'media': [{'url': m.file_path, 'alt_text': m.alt_text} for m in post.media_items.order_by('order').all()],
-            'tags': [{'name': t.name, 'slug': t.slug, 'color': t.color} for t in post.tags]
-        })
+    posts_data = serialize_profile_posts(posts, is_own_profile)
     
     return jsonify({
         'posts': posts_data,
         'has_more': has_more,
+        'next_cursor': next_cursor,
         'page': page,
         'theme_color': user.theme_color or '#4da9a4'
     })
@@ -504,10 +358,7 @@ def public_profile_page(username, slug):
                 Post.scheduled_at <= db.func.now()
             )
         )
-    posts_query = posts_query.order_by(db.func.coalesce(Post.scheduled_at, Post.published_at, Post.created_at).desc())
-    total_posts = posts_query.count()
-    posts = posts_query.offset((page_num - 1) * POSTS_PER_PAGE).limit(POSTS_PER_PAGE).all()
-    has_more = (page_num * POSTS_PER_PAGE) < total_posts
+    posts, has_more, next_cursor = paginate_posts(with_post_relations(posts_query), page=page_num)
     pages = Page.query.filter_by(user_id=user.id, is_visible=True).order_by(Page.order).all()
     
     is_own_profile = current_user.is_authenticated and current_user.id == user.id
@@ -521,6 +372,7 @@ def public_profile_page(username, slug):
         is_own_profile=is_own_profile,
         current_page=page_num,
         has_more=has_more,
+        next_cursor=next_cursor,
     )
 
 
@@ -531,6 +383,7 @@ def public_profile_page_api(username, slug):
     user = User.query.filter_by(username=username).first_or_404()
     page_obj = Page.query.filter_by(user_id=user.id, slug=slug, is_visible=True).first_or_404()
     page_num = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor')
 
     posts_query = Post.query.filter_by(page_id=page_obj.id, is_published=True)
     if not (current_user.is_authenticated and current_user.id == user.id):
@@ -540,10 +393,7 @@ def public_profile_page_api(username, slug):
                 Post.scheduled_at <= db.func.now()
             )
         )
-    posts_query = posts_query.order_by(db.func.coalesce(Post.scheduled_at, Post.published_at, Post.created_at).desc())
-    total_posts = posts_query.count()
-    posts = posts_query.offset((page_num - 1) * POSTS_PER_PAGE).limit(POSTS_PER_PAGE).all()
-    has_more = (page_num * POSTS_PER_PAGE) < total_posts
+    posts, has_more, next_cursor = paginate_posts(with_post_relations(posts_query), cursor=cursor, page=page_num)
 
     is_own_profile = current_user.is_authenticated and current_user.id == user.id
     html = render_template(
@@ -554,7 +404,7 @@ def public_profile_page_api(username, slug):
         is_own_profile=is_own_profile,
     )
 
-    return jsonify({'html': html, 'has_more': has_more, 'page': page_num})
+    return jsonify({'html': html, 'has_more': has_more, 'next_cursor': next_cursor, 'page': page_num})
 
 
 @blog_bp.route('/me')
@@ -565,12 +415,10 @@ def me():
     
     # Show ALL own posts (including unpublished and scheduled)
     posts_query = Post.query.filter_by(user_id=current_user.id)
-    posts_query = posts_query.order_by(db.func.coalesce(Post.scheduled_at, Post.published_at, Post.created_at).desc())
-    total_posts = posts_query.count()
-    posts = posts_query.offset((page - 1) * POSTS_PER_PAGE).limit(POSTS_PER_PAGE).all()
-    has_more = (page * POSTS_PER_PAGE) < total_posts
+    posts, has_more, next_cursor = paginate_posts(with_post_relations(posts_query), page=page)
     
-    return render_template('me/me.html', pages=pages, posts=posts, current_page=page, has_more=has_more)
+    return render_template('me/me.html', pages=pages, posts=posts, current_page=page, has_more=has_more,
+                           next_cursor=next_cursor)
 
 
 @blog_bp.route('/me/page/<slug>')
@@ -578,12 +426,13 @@ def me():
 def view_page(slug):
     page = Page.query.filter_by(user_id=current_user.id, slug=slug).first_or_404()
     page_num = request.args.get('page', 1, type=int)
-    posts_query = Post.query.filter_by(page_id=page.id, is_published=True).order_by(Post.created_at.desc())
-    total_posts = posts_query.count()
-    posts = posts_query.offset((page_num - 1) * POSTS_PER_PAGE).limit(POSTS_PER_PAGE).all()
-    has_more = (page_num * POSTS_PER_PAGE) < total_posts
+    posts_query = Post.query.filter_by(page_id=page.id, is_published=True)
+    posts, has_more, next_cursor = paginate_posts(
+        with_post_relations(posts_query), page=page_num, sort_expr=Post.created_at, sort_value_of=lambda p: p.created_at
+    )
     pages = Page.query.filter_by(user_id=current_user.id, is_visible=True).order_by(Page.order).all()
-    return render_template('me/page.html', page=page, posts=posts, pages=pages, current_page=page_num, has_more=has_more)
+    return render_template('me/page.html', page=page, posts=posts, pages=pages, current_page=page_num,
+                           has_more=has_more, next_cursor=next_cursor)
 
 
 @blog_bp.route('/me/page/<slug>/api')
@@ -592,14 +441,16 @@ def me_page_api(slug):
     """API endpoint for loading more posts on the private profile page subview."""
     page_obj = Page.query.filter_by(user_id=current_user.id, slug=slug).first_or_404()
     page_num = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor')
 
-    posts_query = Post.query.filter_by(page_id=page_obj.id, is_published=True).order_by(Post.created_at.desc())
-    total_posts = posts_query.count()
-    posts = posts_query.offset((page_num - 1) * POSTS_PER_PAGE).limit(POSTS_PER_PAGE).all()
-    has_more = (page_num * POSTS_PER_PAGE) < total_posts
+    posts_query = Post.query.filter_by(page_id=page_obj.id, is_published=True)
+    posts, has_more, next_cursor = paginate_posts(
+        with_post_relations(posts_query), cursor=cursor, page=page_num,
+        sort_expr=Post.created_at, sort_value_of=lambda p: p.created_at
+    )
 
     html = render_template('components/me_page_posts_fragment.html', posts=posts)
-    return jsonify({'html': html, 'has_more': has_more, 'page': page_num})
+    return jsonify({'html': html, 'has_more': has_more, 'next_cursor': next_cursor, 'page': page_num})
 
 
 @blog_bp.route('/me/settings', methods=['GET', 'POST'])
@@ -617,25 +468,16 @@ def settings():
         current_user.font_family = request.form.get('font_family', 'default')
         current_user.layout_style = request.form.get('layout_style', 'list')
         
-        # Handle avatar upload
-        if 'avatar' in request.files:
-            file = request.files['avatar']
+        # Avatar and cover keep the previous image until their variants are ready
+        rel_dir = f'uploads/users/{current_user.id}'
+        for field, attr, kind, prefix in (('avatar', 'avatar_url', 'avatar', 'avatar'),
+                                          ('cover_image', 'cover_image_url', 'cover', 'cover')):
+            file = request.files.get(field)
             if file and file.filename and allowed_file(file.filename):
-                filename = f"avatar_{current_user.id}_{uuid.uuid4().hex[:8]}.jpg"
-                filepath = os.path.join(get_upload_folder('users', str(current_user.id)), filename)
-                img = resize_image(file, max_size=512)
-                img.save(filepath, 'JPEG', quality=85)
-                current_user.avatar_url = url_for('static', filename=f'uploads/users/{current_user.id}/{filename}')
-        
-        # Handle cover image upload
-        if 'cover_image' in request.files:
-            file = request.files['cover_image']
-            if file and file.filename and allowed_file(file.filename):
-                filename = f"cover_{current_user.id}_{uuid.uuid4().hex[:8]}.jpg"
-                filepath = os.path.join(get_upload_folder('users', str(current_user.id)), filename)
-                img = resize_image(file, max_size=1920)
-                img.save(filepath, 'JPEG', quality=85)
-                current_user.cover_image_url = url_for('static', filename=f'uploads/users/{current_user.id}/{filename}')
+                try:
+                    replace_profile_image(current_user, attr, file, kind, rel_dir, f'{prefix}_{current_user.id}')
+                except InvalidImage:
+                    flash(_('Invalid image file.'), 'error')
         
         db.session.commit()
         flash(_('Profile updated successfully.'), 'success')
@@ -705,6 +547,7 @@ def edit_page(page_id):
 @login_required
 def delete_page(page_id):
     page = Page.query.filter_by(id=page_id, user_id=current_user.id).first_or_404()
+    delete_posts(Post.query.filter_by(page_id=page.id).all())
     db.session.delete(page)
     db.session.commit()
     flash(_('Page deleted.'), 'success')
@@ -820,6 +663,8 @@ def new_post():
             post.published_at = datetime.utcnow()
         db.session.add(post)
         db.session.commit()
+        if post.scheduled_at:
+            notify_schedule_changed()
 
         mentioned_usernames = extract_mentions(content or '')
         if mentioned_usernames:
@@ -839,57 +684,28 @@ def new_post():
                 db.session.add(notification)
             db.session.commit()
         
-        # Handle image uploads
+        # Handle image uploads: originals are stored now, sizes and formats are created in the background
         if 'images' in request.files:
             files = request.files.getlist('images')
-            order = 0
+            new_media = []
             for file in files:
                 if file and file.filename and allowed_file(file.filename):
-                    original_filename = secure_filename(file.filename)
-                    filename = f"{uuid.uuid4().hex}.jpg"
-                    if post.group_id:
-                        rel_dir = f"uploads/groups/{post.group_id}/posts/{post.id}"
-                        filepath = os.path.join(get_upload_folder('groups', str(post.group_id), 'posts', str(post.id)), filename)
-                    else:
-                        rel_dir = f"uploads/users/{current_user.id}/posts/{post.id}"
-                        filepath = os.path.join(get_upload_folder('users', str(current_user.id), 'posts', str(post.id)), filename)
-                    img = resize_image(file)
-                    img.save(filepath, 'JPEG', quality=85)
-                    file_size = os.path.getsize(filepath)
-                    
-                    media = Media(
-                        user_id=current_user.id,
-                        post_id=post.id,
-                        filename=filename,
-                        original_filename=original_filename,
-                        file_path=f'{rel_dir}/{filename}',
-                        file_type='image/jpeg',
-                        file_size=file_size,
-                        alt_text=request.form.get('alt_text', '').strip() or None,
-                        order=order
-                    )
-                    db.session.add(media)
-                    order += 1
+                    try:
+                        new_media.append(add_post_image(
+                            post, file, current_user.id,
+                            alt_text=request.form.get('alt_text', '').strip() or None,
+                            order=len(new_media)
+                        ))
+                    except InvalidImage:
+                        flash(_('Invalid image file.'), 'error')
             db.session.commit()
+            enqueue_media(new_media)
         
-        # Handle link previews - extract URLs from content
+        # Link previews are fetched in the background and rendered as placeholders until then
         if content:
-            urls = extract_urls(content)
-            for url in urls[:5]:  # Limit to 5 link previews per post
-                preview_data = process_link_preview(url)
-                if preview_data and (preview_data.get('title') or preview_data.get('embed_type')):
-                    link_preview = LinkPreview(
-                        post_id=post.id,
-                        url=preview_data['url'],
-                        title=preview_data.get('title'),
-                        description=preview_data.get('description'),
-                        image_url=preview_data.get('image_url'),
-                        site_name=preview_data.get('site_name'),
-                        embed_type=preview_data.get('embed_type'),
-                        embed_id=preview_data.get('embed_id')
-                    )
-                    db.session.add(link_preview)
+            pending_previews = add_pending_previews(post, content)
             db.session.commit()
+            enqueue_previews(pending_previews)
         
         # Handle tags
         raw_tag_ids = request.form.getlist('tags')
@@ -1002,6 +818,8 @@ def edit_post(post_id):
                 content=post.content,
                 edited_by=current_user.id
             )
+        if old_content != new_content:
+            invalidate_rendered(old_content)
         post.title = new_title
         post.content = new_content
         post.is_published = request.form.get('is_published') == 'on'
@@ -1058,35 +876,16 @@ def edit_post(post_id):
         ):
             post.updated_at = datetime.utcnow()
         
-        # Handle new image uploads
+        # Handle new image uploads (variants are created after the commit)
         files = request.files.getlist('images')
-        new_images_count = 0
+        new_media = []
         for file in files:
             if file and file.filename and file.filename.strip() and allowed_file(file.filename):
-                original_filename = secure_filename(file.filename)
-                filename = f"{uuid.uuid4().hex}.jpg"
-                if post.group_id:
-                    rel_dir = f"uploads/groups/{post.group_id}/posts/{post.id}"
-                    filepath = os.path.join(get_upload_folder('groups', str(post.group_id), 'posts', str(post.id)), filename)
-                else:
-                    rel_dir = f"uploads/users/{current_user.id}/posts/{post.id}"
-                    filepath = os.path.join(get_upload_folder('users', str(current_user.id), 'posts', str(post.id)), filename)
-                # Resize image to max resolution
-                img = resize_image(file)
-                img.save(filepath, 'JPEG', quality=85)
-                file_size = os.path.getsize(filepath)
-                
-                media = Media(
-                    user_id=current_user.id,
-                    post_id=post.id,
-                    filename=filename,
-                    original_filename=original_filename,
-                    file_path=f'{rel_dir}/{filename}',
-                    file_type='image/jpeg',
-                    file_size=file_size
-                )
-                db.session.add(media)
-                new_images_count += 1
+                try:
+                    new_media.append(add_post_image(post, file, current_user.id))
+                except InvalidImage:
+                    flash(_('Invalid image file.'), 'error')
+        new_images_count = len(new_media)
         
         # Handle tags
         raw_tag_ids = request.form.getlist('tags')
@@ -1105,7 +904,13 @@ def edit_post(post_id):
             if tag:
                 post.tags.append(tag)
         
+        pending_previews = sync_pending_previews(post, post.content) if post.content != old_content else []
+        
         db.session.commit()
+        enqueue_previews(pending_previews)
+        enqueue_media(new_media)
+        if post.scheduled_at != old_scheduled_at:
+            notify_schedule_changed()
 
         if newly_mentioned_usernames:
             mentioned_users = User.query.filter(User.username.in_(newly_mentioned_usernames)).all()
@@ -1147,14 +952,9 @@ def delete_post(post_id):
     
     # Delete associated media files
     for media in post.media_items:
-        try:
-            filepath = os.path.join(current_app.root_path, 'static', media.file_path)
-            if os.path.exists(filepath):
-                os.remove(filepath)
-        except Exception:
-            pass
+        delete_image_files(media.file_path)
     
-    db.session.delete(post)
+    delete_posts([post])
     db.session.commit()
     flash(_('Post deleted.'), 'success')
     return redirect(next_url)
@@ -1165,12 +965,7 @@ def delete_post(post_id):
 def delete_media(media_id):
     media = Media.query.filter_by(id=media_id, user_id=current_user.id).first_or_404()
     
-    try:
-        filepath = os.path.join(current_app.root_path, 'static', media.file_path)
-        if os.path.exists(filepath):
-            os.remove(filepath)
-    except Exception:
-        pass
+    delete_image_files(media.file_path)
     
     db.session.delete(media)
     db.session.commit()
@@ -1209,7 +1004,7 @@ def api_link_preview():
     if not url.startswith(('http://', 'https://')):
         url = 'https://' + url
     
-    preview_data = process_link_preview(url)
+    preview_data = fetch_preview(url)
     
     if preview_data:
         return jsonify(preview_data)
@@ -1217,6 +1012,20 @@ def api_link_preview():
         return jsonify({'error': 'Could not fetch preview'}), 404
 
 
+@blog_bp.route('/api/posts/<int:post_id>/link-previews')
+def api_post_link_previews(post_id):
+    """Rendered link previews of a post, polled by placeholders while they are fetched."""
+    post = Post.query.get_or_404(post_id)
+    if post.id not in visible_post_ids([post], current_user.id if current_user.is_authenticated else None):
+        abort(404)
+    previews = list(post.link_previews)
+    render_all_previews = get_template_attribute('components/link_preview.html', 'render_all_previews')
+    return jsonify({
+        'pending': any(preview.status == 'pending' for preview in previews),
+        'html': str(render_all_previews(previews))
+    })
+
+
 @blog_bp.route('/api/render-markdown', methods=['POST'])
 @login_required
 def api_render_markdown():
@@ -1224,7 +1033,7 @@ def api_render_markdown():
     data = request.get_json()
     content = data.get('content', '')
     
-    html = render_markdown(content)
+    html = run_blocking('markdown', render_markdown, content)
     return jsonify({'html': html})
 
 
@@ -1233,60 +1042,20 @@ def api_render_markdown():
 def api_posts():
     """Get paginated posts as JSON for AJAX loading."""
     page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor')
     now = datetime.utcnow()
     
     # Show ALL own posts (including unpublished and scheduled)
     posts_query = Post.query.filter_by(user_id=current_user.id)
-    posts_query = posts_query.order_by(db.func.coalesce(Post.scheduled_at, Post.published_at, Post.created_at).desc())
-    total_posts = posts_query.count()
-    posts = posts_query.offset((page - 1) * POSTS_PER_PAGE).limit(POSTS_PER_PAGE).all()
-    has_more = (page * POSTS_PER_PAGE) < total_posts
-    
-    posts_data = []
-    for post in posts:
-        media_items = []
-        for media in post.media_items.order_by('order').all():
-            media_items.append({
-                'file_path': media.file_path,
-                'alt_text': media.alt_text or _('Image')
-            })
-        
-        link_previews = []
-        for preview in post.link_previews:
-            link_previews.append({
-                'embed_type': preview.embed_type,
-                'embed_id': preview.embed_id,
-                'url': preview.url,
-                'title': preview.title,
-                'description': preview.description,
-                'image_url': preview.image_url,
-                'site_name': preview.site_name
-            })
-        
-        posts_data.append({
-            'id': post.id,
-            'title': post.title,
-            'content': render_markdown(post.content) if post.content else '',
-            'created_at': format_datetime_i18n(post.scheduled_at or post.published_at or post.created_at),
-            'updated_at': post.updated_at.isoformat() if post.updated_at else None,
-            'scheduled_at': (post.scheduled_at.replace(tzinfo=timezone.utc).isoformat().replace('+00:00', 'Z') if post.scheduled_at else None),
-            'published_at': (post.published_at.replace(tzinfo=timezone.utc).isoformat().replace('+00:00', 'Z') if post.published_at else None),
-            'is_scheduled_future': bool(post.scheduled_at and post.scheduled_at > now),
-            'is_published': post.is_published,
-            'is_unpublished': not post.is_published,
-            'is_edited': bool(post.updated_at and post.created_at and post.updated_at > post.created_at),
-            'page_title': post.page.title if post.page else None,
-            'page_slug': post.page.slug if post.page else None,
-            'group_name': post.group.name if post.group else None,
-            'group_slug': post.group.slug if post.group else None,
-            'group_color': post.group.color if post.group else None,
-            'media_items': media_items,
-            'link_previews': link_previews
-        })
+    posts, has_more, next_cursor = paginate_posts(
+        with_post_relations(posts_query, with_polls=False), cursor=cursor, page=page
+    )
+    posts_data = serialize_own_posts(posts, now)
     
     return jsonify({
         'posts': posts_data,
         'has_more': has_more,
+        'next_cursor': next_cursor,
         'current_page': page
     })
 
@@ -1316,16 +1085,18 @@ def delete_account():
         flash(_('Invalid credentials.'), 'error')
         return redirect(url_for('auth.logout'))
 
+    # Posts of other users whose comment/bookmark/reaction counters change through the bulk deletes below
+    counter_post_ids = {row[0] for row in db.session.query(Comment.post_id).filter(Comment.user_id == user.id).distinct()}
+    counter_post_ids |= {row[0] for row in db.session.query(Bookmark.post_id).filter(Bookmark.user_id == user.id).distinct()}
+    counter_post_ids |= {row[0] for row in db.session.query(Comment.post_id).join(
+        CommentReaction, CommentReaction.comment_id == Comment.id
+    ).filter(CommentReaction.user_id == user.id).distinct()}
+
     def _delete_user_non_post_data(*, delete_media: bool):
         if delete_media:
             try:
                 for media in Media.query.filter_by(user_id=user.id).all():
-                    try:
-                        filepath = os.path.join(current_app.root_path, 'static', media.file_path)
-                        if os.path.exists(filepath):
-                            os.remove(filepath)
-                    except Exception:
-                        pass
+                    delete_image_files(media.file_path)
                     db.session.delete(media)
             except Exception:
                 pass
@@ -1335,6 +1106,7 @@ def delete_account():
         except Exception:
             pass
         try:
+            delete_comment_dependents(db.select(Comment.id).where(Comment.user_id == user.id))
             Comment.query.filter_by(user_id=user.id).delete(synchronize_session=False)
         except Exception:
             pass
@@ -1352,6 +1124,10 @@ def delete_account():
         except Exception:
             pass
 
+        try:
+            NotificationOutbox.query.filter_by(user_id=user.id).delete(synchronize_session=False)
+        except Exception:
+            pass
         try:
             Notification.query.filter_by(user_id=user.id).delete(synchronize_session=False)
         except Exception:
@@ -1385,6 +1161,10 @@ def delete_account():
             pass
 
         try:
+            # Keep posts that live on a page; delete_all removes them separately
+            Post.query.filter(Post.user_id == user.id, Post.page_id.isnot(None)).update(
+                {Post.page_id: None}, synchronize_session=False
+            )
             for page in Page.query.filter_by(user_id=user.id).all():
                 db.session.delete(page)
         except Exception:
@@ -1393,8 +1173,7 @@ def delete_account():
     if mode == 'delete_all':
         _delete_user_non_post_data(delete_media=True)
         try:
-            for post in Post.query.filter_by(user_id=user.id).all():
-                db.session.delete(post)
+            delete_posts(Post.query.filter_by(user_id=user.id).all())
         except Exception:
             pass
     else:
@@ -1424,6 +1203,9 @@ def delete_account():
 
     db.session.commit()
 
+    if counter_post_ids:
+        reconcile_counters(post_ids=counter_post_ids)
+
     from flask_login import logout_user
     logout_user()
     flash(_('Your account has been deleted.'), 'success')
@@ -1435,7 +1217,7 @@ def delete_account():
 @blog_bp.app_template_filter('markdown')
 def markdown_filter(text):
     """Jinja2 filter for rendering markdown."""
-    return render_markdown(text)
+    return render_markdown_cached(text)
 
 
 @blog_bp.app_template_filter('embed_html')
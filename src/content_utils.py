@@ -1,16 +1,16 @@
 """
 Content utilities for link previews, embeds, and markdown processing.
 """
+import codecs
 import html
 import uuid
-import ipaddress
 import re
-import socket
-import requests
-from bs4 import BeautifulSoup
+from html.parser import HTMLParser
 import markdown
 import bleach
-from urllib.parse import urlparse, parse_qs
+from urllib.parse import urlparse, parse_qs, urljoin
+
+from http_client import outbound_client, OutboundError
 
 
 # Allowed HTML tags for sanitized content
@@ -30,169 +30,207 @@ ALLOWED_ATTRIBUTES = {
 }
 
 
-MAX_PREVIEW_BYTES = 2 * 1024 * 1024
-MAX_PREVIEW_REDIRECTS = 5
+# Bump whenever render_markdown output changes (extensions, sanitizer rules,
+# post-processing) so persisted renders in render_cache are re-created.
+RENDERER_VERSION = '1'
 
 
-def _is_private_host(hostname: str) -> bool:
-    if not hostname:
-        return True
+MAX_PREVIEW_HEAD_BYTES = 512 * 1024  # stop reading pages whose <head> never ends
+MAX_PREVIEW_REDIRECTS = 5
+PREVIEW_CHUNK_SIZE = 8192
+CHARSET_SNIFF_BYTES = 1024  # like browsers, look for <meta charset> in the first 1024 bytes
 
-    host = hostname.strip().lower()
-    if host in {'localhost', 'localhost.localdomain'}:
-        return True
 
-    try:
-        ip = ipaddress.ip_address(host)
-        return (
-            ip.is_private
-            or ip.is_loopback
-            or ip.is_link_local
-            or ip.is_reserved
-            or ip.is_multicast
-        )
-    except ValueError:
-        pass
+class PreviewUnavailable(Exception):
+    """A URL yields no preview; ``reason`` says why (e.g. ``timeout``, ``not_html``)."""
 
-    try:
-        infos = socket.getaddrinfo(host, None)
-    except Exception:
-        return True
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
 
-    for info in infos:
-        try:
-            ip = ipaddress.ip_address(info[4][0])
-        except Exception:
-            return True
-        if (
-            ip.is_private
-            or ip.is_loopback
-            or ip.is_link_local
-            or ip.is_reserved
-            or ip.is_multicast
-        ):
-            return True
-
-    return False
-
-
-def _validate_public_http_url(url: str) -> str | None:
-    try:
-        parsed = urlparse(url)
-    except Exception:
-        return None
 
-    if parsed.scheme not in ('http', 'https'):
-        return None
-    if not parsed.netloc:
-        return None
-    if _is_private_host(parsed.hostname or ''):
-        return None
-    return url
-
-
-def _fetch_html_with_redirect_checks(url: str, timeout: int = 5):
-    current = _validate_public_http_url(url)
-    if not current:
-        return None
+def _open_html_with_redirect_checks(url: str, timeout: int = 5):
+    """Follow redirects to an HTML response and return it unread (streamed); the caller closes it.
 
-    headers = {'User-Agent': 'Mozilla/5.0 (compatible; ChronicleBot/1.0)'}
-    session = requests.Session()
+    Every hop goes through the shared outbound client, which refuses
+    non-public hosts and connects to the address it validated.
+    """
+    client = outbound_client()
+    current = url
 
     for _ in range(MAX_PREVIEW_REDIRECTS + 1):
-        resp = session.get(
-            current,
-            headers=headers,
-            timeout=timeout,
-            allow_redirects=False,
-            stream=True,
-        )
+        resp = client.get(current, timeout=timeout)
 
         if 300 <= resp.status_code < 400:
+            resp.close()
             loc = resp.headers.get('Location')
             if not loc:
-                return None
-            next_url = requests.compat.urljoin(current, loc)
-            current = _validate_public_http_url(next_url)
-            if not current:
-                return None
+                raise PreviewUnavailable('http_error')
+            current = urljoin(current, loc)
             continue
 
         if resp.status_code >= 400:
-            return None
+            resp.close()
+            raise PreviewUnavailable('http_error')
 
         ctype = (resp.headers.get('Content-Type') or '').lower()
         if 'text/html' not in ctype and 'application/xhtml+xml' not in ctype and ctype:
-            return None
+            resp.close()
+            raise PreviewUnavailable('not_html')
 
-        buf = bytearray()
-        for chunk in resp.iter_content(chunk_size=16384):
-            if not chunk:
-                continue
-            buf.extend(chunk)
-            if len(buf) > MAX_PREVIEW_BYTES:
-                return None
+        return resp
 
-        encoding = resp.encoding or 'utf-8'
-        try:
-            return bytes(buf).decode(encoding, errors='replace')
-        except Exception:
-            return bytes(buf).decode('utf-8', errors='replace')
+    raise PreviewUnavailable('too_many_redirects')
 
-    return None
+
+# Meta keys read from <head>, in order of preference per field
+PREVIEW_META_KEYS = {
+    'title': ('og:title', 'twitter:title'),
+    'description': ('og:description', 'twitter:description', 'description'),
+    'image_url': ('og:image', 'og:image:url', 'twitter:image', 'twitter:image:src'),
+    'site_name': ('og:site_name',),
+}
+_WANTED_META_KEYS = {key for keys in PREVIEW_META_KEYS.values() for key in keys}
+
+_HEADER_CHARSET_RE = re.compile(r'charset\s*=\s*["\']?([\w.:-]+)', re.IGNORECASE)
+_META_CHARSET_RE = re.compile(rb'<meta[^>]+charset\s*=\s*["\']?\s*([\w.:-]+)', re.IGNORECASE)
+# Start tags that only occur in the body; they end an implicit <head> like in browsers
+_BODY_START_TAGS = {'body', 'div', 'p', 'main', 'article', 'section', 'h1', 'h2', 'table', 'ul', 'ol', 'form'}
+# Labels that browsers decode as windows-1252 (WHATWG encoding standard)
+_WINDOWS_1252_ALIASES = {'iso-8859-1', 'iso8859-1', 'latin1', 'latin-1', 'us-ascii', 'ascii'}
+
+
+class _HeadMetaParser(HTMLParser):
+    """Collects <title> and preview <meta> tags, ``done`` once the head is over."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.meta = {}
+        self.title = None
+        self.done = False
+        self._title_parts = None
+
+    def handle_starttag(self, tag, attrs):
+        if self.done:
+            return
+        if tag in _BODY_START_TAGS:
+            self.done = True
+        elif tag == 'title' and self.title is None:
+            self._title_parts = []
+        elif tag == 'meta':
+            attrs = dict(attrs)
+            key = (attrs.get('property') or attrs.get('name') or '').strip().lower()
+            if key in _WANTED_META_KEYS and key not in self.meta:
+                self.meta[key] = attrs.get('content') or ''
+
+    def handle_endtag(self, tag):
+        if self.done:
+            return
+        if tag == 'head':
+            self.done = True
+        elif tag == 'title' and self._title_parts is not None:
+            self.title = ''.join(self._title_parts)
+            self._title_parts = None
+
+    def handle_data(self, data):
+        if self._title_parts is not None and not self.done:
+            self._title_parts.append(data)
+
+    def page_title(self):
+        """Text of the first <title>, also when the read stopped inside it."""
+        title = self.title if self.title is not None else ''.join(self._title_parts or ())
+        return title.strip() or None
+
+
+def _preview_charset(content_type: str, start: bytes) -> str:
+    """Charset of a page from its BOM, Content-Type header or a <meta> in ``start``; utf-8 otherwise."""
+    if start.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    if start.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return 'utf-16'
+    match = _HEADER_CHARSET_RE.search(content_type or '')
+    if match:
+        label = match.group(1)
+    else:
+        match = _META_CHARSET_RE.search(start)
+        label = match.group(1).decode('ascii', 'ignore') if match else 'utf-8'
+    label = label.strip().lower()
+    if label in _WINDOWS_1252_ALIASES:
+        label = 'windows-1252'
+    try:
+        return codecs.lookup(label).name
+    except LookupError:
+        return 'utf-8'
+
+
+def read_head_metadata(chunks, content_type: str = '') -> tuple[dict, int]:
+    """Parse preview metadata from HTML byte ``chunks``, reading only up to the end of <head>.
+
+    Returns the metadata (``title``, ``description``, ``image_url``,
+    ``site_name``; None where missing) and the number of bytes consumed.
+    """
+    chunks = iter(chunks)
+    start = bytearray()
+    for chunk in chunks:
+        start.extend(chunk)
+        if len(start) >= CHARSET_SNIFF_BYTES:
+            break
+    decoder = codecs.getincrementaldecoder(_preview_charset(content_type, bytes(start)))(errors='replace')
+    parser = _HeadMetaParser()
+    parser.feed(decoder.decode(bytes(start)))
+    consumed = len(start)
+    if not parser.done:
+        for chunk in chunks:
+            consumed += len(chunk)
+            parser.feed(decoder.decode(chunk))
+            if parser.done or consumed >= MAX_PREVIEW_HEAD_BYTES:
+                break
+        else:
+            parser.feed(decoder.decode(b'', final=True))
+
+    result = {}
+    for field, keys in PREVIEW_META_KEYS.items():
+        result[field] = next((parser.meta[key].strip() for key in keys if parser.meta.get(key, '').strip()), None)
+    title = parser.page_title()
+    if not result['title'] and title:
+        result['title'] = title
+    return result, consumed
+
+
+def fetch_page_metadata(url, timeout=5):
+    """Fetch Open Graph metadata from a URL, raising ``PreviewUnavailable`` on failure."""
+    try:
+        resp = _open_html_with_redirect_checks(url, timeout=timeout)
+        try:
+            meta, _consumed = read_head_metadata(
+                resp.iter_content(chunk_size=PREVIEW_CHUNK_SIZE), resp.headers.get('Content-Type', '')
+            )
+        finally:
+            resp.close()
+    except OutboundError as exc:
+        raise PreviewUnavailable(exc.reason) from exc
+
+    og_data = {
+        'url': url,
+        'title': meta['title'][:500] if meta['title'] else None,
+        'description': meta['description'][:1000] if meta['description'] else None,
+        'image_url': meta['image_url'],
+        'site_name': meta['site_name'][:200] if meta['site_name'] else None
+    }
+    
+    # Fallback site name from domain
+    if not og_data['site_name']:
+        parsed = urlparse(url)
+        og_data['site_name'] = parsed.netloc
+    
+    return og_data
 
 
 def fetch_open_graph(url, timeout=5):
     """Fetch Open Graph metadata from a URL."""
     try:
-        html = _fetch_html_with_redirect_checks(url, timeout=timeout)
-        if not html:
-            return None
-
-        soup = BeautifulSoup(html, 'html.parser')
-        
-        # Extract Open Graph data
-        og_data = {
-            'url': url,
-            'title': None,
-            'description': None,
-            'image_url': None,
-            'site_name': None
-        }
-        
-        # Open Graph tags
-        og_title = soup.find('meta', property='og:title')
-        og_desc = soup.find('meta', property='og:description')
-        og_image = soup.find('meta', property='og:image')
-        og_site = soup.find('meta', property='og:site_name')
-        
-        if og_title:
-            og_data['title'] = og_title.get('content', '')[:500]
-        if og_desc:
-            og_data['description'] = og_desc.get('content', '')[:1000]
-        if og_image:
-            og_data['image_url'] = og_image.get('content', '')
-        if og_site:
-            og_data['site_name'] = og_site.get('content', '')[:200]
-        
-        # Fallback to standard meta tags
-        if not og_data['title']:
-            title_tag = soup.find('title')
-            if title_tag:
-                og_data['title'] = title_tag.text.strip()[:500]
-        
-        if not og_data['description']:
-            meta_desc = soup.find('meta', attrs={'name': 'description'})
-            if meta_desc:
-                og_data['description'] = meta_desc.get('content', '')[:1000]
-        
-        # Fallback site name from domain
-        if not og_data['site_name']:
-            parsed = urlparse(url)
-            og_data['site_name'] = parsed.netloc
-        
-        return og_data
-    except Exception as e:
+        return fetch_page_metadata(url, timeout=timeout)
+    except Exception:
         return None
 
 
@@ -256,8 +294,8 @@ def extract_urls(text):
     return urls
 
 
-def process_link_preview(url):
-    """Process a URL and return preview data with embed info if applicable."""
+def build_link_preview(url, og_data):
+    """Preview data with embed info for a URL from already fetched Open Graph data (or None)."""
     result = {
         'url': url,
         'title': None,
@@ -274,8 +312,6 @@ def process_link_preview(url):
         result['embed_type'] = embed_info['type']
         result['embed_id'] = embed_info['id']
     
-    # Fetch Open Graph data
-    og_data = fetch_open_graph(url)
     if og_data:
         result.update({
             'title': og_data.get('title'),
@@ -291,6 +327,11 @@ def process_link_preview(url):
     return result
 
 
+def process_link_preview(url):
+    """Process a URL and return preview data with embed info if applicable."""
+    return build_link_preview(url, fetch_open_graph(url))
+
+
 def generate_toc(text):
     """Generate table of contents from markdown headings."""
     if not text:
@@ -0,0 +1,168 @@
+"""Denormalized counters for reactions, comments, bookmarks and poll votes.
+
+Write endpoints adjust a counter with a relative ``SET n = n + :delta``
+(an upsert for the per-emoji reaction rows of posts and comments) on the
+request session, so the
+counter commits or rolls back together with the row it describes and
+concurrent requests never lose an increment. Reads use the counters only.
+
+``reconcile_counters`` recomputes everything from the raw rows and is exposed
+as ``flask chronicle reconcile-counters`` to repair drift, e.g. after bulk
+deletes or manual database edits.
+"""
+from extensions import db
+from models import (
+    Post, Comment, Bookmark, Reaction, PostReactionCount, CommentReaction, CommentReactionCount,
+    Poll, PollOption, PollVote
+)
+
+
+def _adjust_emoji_count(model, target: str, target_id: int, emoji: str, delta: int) -> None:
+    """Add ``delta`` to the ``model`` row of (``target`` = ``target_id``, ``emoji``), creating it if needed."""
+    dialect = db.engine.dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        stmt = insert(model).values({target: target_id, 'emoji': emoji, 'count': max(delta, 0)})
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[target, 'emoji'],
+            set_={'count': model.count + delta}
+        )
+        db.session.execute(stmt)
+        return
+
+    updated = db.session.execute(
+        db.update(model)
+        .where(getattr(model, target) == target_id, model.emoji == emoji)
+        .values(count=model.count + delta)
+    ).rowcount
+    if not updated and delta > 0:
+        db.session.add(model(**{target: target_id, 'emoji': emoji, 'count': delta}))
+
+
+def adjust_reaction_count(post_id: int, emoji: str, delta: int) -> None:
+    _adjust_emoji_count(PostReactionCount, 'post_id', post_id, emoji, delta)
+
+
+def adjust_comment_reaction_count(comment_id: int, emoji: str, delta: int) -> None:
+    _adjust_emoji_count(CommentReactionCount, 'comment_id', comment_id, emoji, delta)
+
+
+def adjust_comment_count(post_id: int, delta: int) -> None:
+    db.session.execute(
+        db.update(Post).where(Post.id == post_id).values(comment_count=Post.comment_count + delta)
+    )
+
+
+def adjust_bookmark_count(post_id: int, delta: int) -> None:
+    db.session.execute(
+        db.update(Post).where(Post.id == post_id).values(bookmark_count=Post.bookmark_count + delta)
+    )
+
+
+def adjust_vote_count(option_id: int, delta: int) -> None:
+    db.session.execute(
+        db.update(PollOption).where(PollOption.id == option_id).values(vote_count=PollOption.vote_count + delta)
+    )
+
+
+def reaction_counts(post_id: int) -> dict:
+    """Map emoji to count for one post (at most one row per emoji)."""
+    rows = db.session.query(PostReactionCount.emoji, PostReactionCount.count).filter(
+        PostReactionCount.post_id == post_id,
+        PostReactionCount.count > 0
+    ).all()
+    return dict(rows)
+
+
+def comment_reaction_counts(comment_id: int) -> dict:
+    """Map emoji to count for one comment (at most one row per emoji)."""
+    rows = db.session.query(CommentReactionCount.emoji, CommentReactionCount.count).filter(
+        CommentReactionCount.comment_id == comment_id,
+        CommentReactionCount.count > 0
+    ).all()
+    return dict(rows)
+
+
+def _reconcile_column(model, column, actual, scope=None) -> int:
+    stmt = db.update(model).where(column != actual).values({column: actual})
+    if scope is not None:
+        stmt = stmt.where(scope)
+    return db.session.execute(stmt, execution_options={'synchronize_session': False}).rowcount or 0
+
+
+def _reconcile_emoji_counts(reaction_model, count_model, target: str, target_ids) -> int:
+    reaction_target = getattr(reaction_model, target)
+    actual = dict(
+        ((target_id, emoji), count) for target_id, emoji, count in
+        db.session.query(reaction_target, reaction_model.emoji, db.func.count(reaction_model.id))
+        .filter(reaction_target.in_(target_ids))
+        .group_by(reaction_target, reaction_model.emoji)
+        .all()
+    )
+    stored = {
+        (getattr(row, target), row.emoji): row
+        for row in count_model.query.filter(getattr(count_model, target).in_(target_ids)).all()
+    }
+    fixed = 0
+    for key, row in stored.items():
+        count = actual.get(key, 0)
+        if row.count != count:
+            row.count = count
+            fixed += 1
+    for (target_id, emoji), count in actual.items():
+        if (target_id, emoji) not in stored:
+            db.session.add(count_model(**{target: target_id, 'emoji': emoji, 'count': count}))
+            fixed += 1
+    return fixed
+
+
+def reconcile_counters(post_ids=None, batch_size: int = 1000) -> dict:
+    """Recompute counters from raw rows and return how many were corrected.
+
+    Restricted to ``post_ids`` when given; otherwise walks all posts in
+    batches, committing after each one.
+    """
+    fixed = {'comments': 0, 'bookmarks': 0, 'reactions': 0, 'comment_reactions': 0, 'votes': 0}
+
+    def run(ids):
+        scope = Post.id.in_(ids)
+        comment_total = db.select(db.func.count(Comment.id)).where(
+            Comment.post_id == Post.id, Comment.is_approved == True
+        ).correlate(Post).scalar_subquery()
+        bookmark_total = db.select(db.func.count(Bookmark.id)).where(
+            Bookmark.post_id == Post.id
+        ).correlate(Post).scalar_subquery()
+        vote_total = db.select(db.func.count(PollVote.id)).where(
+            PollVote.option_id == PollOption.id
+        ).correlate(PollOption).scalar_subquery()
+        poll_options = PollOption.poll_id.in_(db.select(Poll.id).where(Poll.post_id.in_(ids)))
+
+        fixed['comments'] += _reconcile_column(Post, Post.comment_count, comment_total, scope)
+        fixed['bookmarks'] += _reconcile_column(Post, Post.bookmark_count, bookmark_total, scope)
+        fixed['votes'] += _reconcile_column(PollOption, PollOption.vote_count, vote_total, poll_options)
+        fixed['reactions'] += _reconcile_emoji_counts(Reaction, PostReactionCount, 'post_id', ids)
+        comment_ids = [row[0] for row in db.session.query(Comment.id).filter(Comment.post_id.in_(ids)).all()]
+        if comment_ids:
+            fixed['comment_reactions'] += _reconcile_emoji_counts(
+                CommentReaction, CommentReactionCount, 'comment_id', comment_ids
+            )
+        db.session.commit()
+
+    if post_ids is not None:
+        ids = list(post_ids)
+        if ids:
+            run(ids)
+        return fixed
+
+    last_id = 0
+    while True:
+        ids = [row[0] for row in db.session.query(Post.id).filter(Post.id > last_id)
+               .order_by(Post.id.asc()).limit(batch_size).all()]
+        if not ids:
+            break
+        run(ids)
+        last_id = ids[-1]
+    return fixed
@@ -0,0 +1,151 @@
+"""Background and CPU-bound work without stalling the eventlet hub.
+
+Production runs a single eventlet worker, so any CPU-bound call in a request
+(Markdown highlighting, image resizing, password hashing) freezes every
+other request and websocket of the process while it runs.
+
+- ``run_blocking(label, func, ...)`` runs such a call in eventlet's native
+  thread pool (``CPU_POOL_SIZE`` threads) and only blocks the calling green
+  thread. Without monkey-patching it simply calls ``func``.
+- ``spawn(target, ...)`` starts a long-running background loop: a green
+  thread under eventlet, a daemon thread otherwise.
+- ``map_concurrent(func, items, limit)`` runs I/O-bound calls with at most
+  ``limit`` in flight: green threads under eventlet, threads otherwise.
+- A monitor green thread measures how late the hub wakes it up; the lag is
+  time during which the hub was blocked. ``executor_stats`` reports it
+  together with the time spent in offloaded calls per label.
+"""
+import threading
+import time
+
+DEFAULT_POOL_SIZE = 4
+MONITOR_INTERVAL = 0.1
+BLOCK_THRESHOLD = 0.02  # lag below this is scheduling noise, not blocking
+DEFAULT_BLOCK_WARN_MS = 500
+
+_lock = threading.Lock()
+_configured = False
+_monitor_started = False
+_offloaded = {}
+_hub = {'blocked_ms': 0.0, 'blocks': 0, 'max_block_ms': 0.0}
+
+
+def _eventlet_patched() -> bool:
+    try:
+        from eventlet import patcher
+    except ImportError:
+        return False
+    return patcher.is_monkey_patched('thread')
+
+
+def spawn(target, *args, name: str = 'chronicle-worker'):
+    """Run ``target(*args)`` in the background (green thread under eventlet)."""
+    if _eventlet_patched():
+        import eventlet
+        return eventlet.spawn(target, *args)
+    thread = threading.Thread(target=target, args=args, name=name, daemon=True)
+    thread.start()
+    return thread
+
+
+def map_concurrent(func, items, limit: int) -> list:
+    """``[func(item) for item in items]`` with up to ``limit`` calls running at once, in order.
+
+    For I/O-bound calls (network requests); CPU-bound work belongs in ``run_blocking``.
+    """
+    items = list(items)
+    limit = max(1, min(limit, len(items)))
+    if limit == 1:
+        return [func(item) for item in items]
+    if _eventlet_patched():
+        import eventlet
+        return list(eventlet.GreenPool(limit).imap(func, items))
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=limit, thread_name_prefix='chronicle-io') as pool:
+        return list(pool.map(func, items))
+
+
+def _record(label: str, seconds: float) -> None:
+    with _lock:
+        stats = _offloaded.setdefault(label, {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+        stats['count'] += 1
+        stats['total_ms'] += seconds * 1000
+        stats['max_ms'] = max(stats['max_ms'], seconds * 1000)
+
+
+def _call(func, args, kwargs):
+    # Exceptions are handed back instead of raised, tpool would print them to stderr
+    try:
+        return True, func(*args, **kwargs)
+    except BaseException as exc:
+        return False, exc
+
+
+def run_blocking(label: str, func, *args, **kwargs):
+    """Call a CPU-bound ``func`` off the eventlet hub; ``label`` groups it in ``executor_stats``.
+
+    ``func`` runs in a native thread without Flask's request or app context.
+    """
+    started = time.perf_counter()
+    try:
+        if not _eventlet_patched():
+            return func(*args, **kwargs)
+        from eventlet import tpool
+        ok, result = tpool.execute(_call, func, args, kwargs)
+        if not ok:
+            raise result
+        return result
+    finally:
+        _record(label, time.perf_counter() - started)
+
+
+def _monitor_hub(warn_ms: float, logger) -> None:
+    import eventlet
+    while True:
+        started = time.monotonic()
+        eventlet.sleep(MONITOR_INTERVAL)
+        lag = time.monotonic() - started - MONITOR_INTERVAL
+        if lag < BLOCK_THRESHOLD:
+            continue
+        lag_ms = lag * 1000
+        with _lock:
+            _hub['blocked_ms'] += lag_ms
+            _hub['blocks'] += 1
+            _hub['max_block_ms'] = max(_hub['max_block_ms'], lag_ms)
+        if lag_ms >= warn_ms:
+            logger.warning('eventlet hub was blocked for %.0f ms', lag_ms)
+
+
+def start_executor(app) -> None:
+    """Size the native thread pool and start the hub monitor (once per process, eventlet only)."""
+    global _configured, _monitor_started
+    with _lock:
+        if _configured:
+            return
+        _configured = True
+    if not _eventlet_patched():
+        return
+    from eventlet import tpool
+    tpool.set_num_threads(max(1, app.config.get('CPU_POOL_SIZE', DEFAULT_POOL_SIZE)))
+    if not app.config.get('TESTING'):
+        _monitor_started = True
+        spawn(_monitor_hub, app.config.get('HUB_BLOCK_WARN_MS', DEFAULT_BLOCK_WARN_MS), app.logger)
+
+
+def init_executor(app) -> None:
+    """Start the executor with the first request, like the scheduler."""
+    @app.before_request
+    def _ensure_executor_started():
+        if not _configured:
+            start_executor(app)
+
+
+def executor_stats() -> dict:
+    with _lock:
+        offloaded = {
+            label: {'count': s['count'], 'total_ms': round(s['total_ms'], 1), 'max_ms': round(s['max_ms'], 1)}
+            for label, s in _offloaded.items()
+        }
+        hub = {key: round(value, 1) if isinstance(value, float) else value for key, value in _hub.items()}
+    hub['monitoring'] = _monitor_started
+    return {'offloaded': offloaded, 'hub': hub}
@@ -0,0 +1,238 @@
+"""Shared outbound HTTP client for fetching third-party pages (link previews).
+
+All fetches go through one ``OutboundClient`` per process:
+
+- Host names are resolved once per ``OUTBOUND_DNS_TTL`` and every address is
+  checked to be public. The connection is then made to exactly that address
+  (with ``Host`` header, SNI and certificate checks for the name), so a
+  second lookup can no longer return a private address after validation.
+- Connections are kept alive in urllib3 pools keyed by scheme, host, port and
+  pinned address. Each pool holds at most ``OUTBOUND_HTTP_PER_HOST``
+  connections and further requests wait for a free one.
+- Under eventlet, DNS lookups run in the native thread pool and sockets are
+  green, so a slow site never blocks the hub.
+
+``client_stats`` reports request, DNS and connection counters of the process.
+"""
+import ipaddress
+import socket
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlsplit
+
+import certifi
+import urllib3
+from flask import current_app, has_app_context
+
+DEFAULT_DNS_TTL = 300
+DEFAULT_MAX_PER_HOST = 4
+MAX_POOLS = 256
+MAX_DNS_ENTRIES = 4096
+KEEPALIVE_DRAIN_BYTES = 64 * 1024  # unread rest of a response read to keep its connection
+USER_AGENT = 'Mozilla/5.0 (compatible; ChronicleBot/1.0)'
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+BLOCKED_HOSTNAMES = {'localhost', 'localhost.localdomain'}
+
+
+class OutboundError(Exception):
+    """An outbound request failed; ``reason`` is e.g. ``blocked_host``, ``dns_error`` or ``timeout``."""
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+def _is_public_ip(address: str) -> bool:
+    try:
+        ip = ipaddress.ip_address(address.split('%', 1)[0])
+    except ValueError:
+        return False
+    return not (ip.is_private or ip.is_loopback or ip.is_link_local or ip.is_reserved or ip.is_multicast)
+
+
+def _getaddrinfo(host: str, port: int):
+    """``socket.getaddrinfo`` that runs in eventlet's native thread pool when monkey-patched."""
+    try:
+        from eventlet import patcher
+        if patcher.is_monkey_patched('socket'):
+            from eventlet import tpool
+            original = patcher.original('socket')
+            return tpool.execute(original.getaddrinfo, host, port, 0, original.SOCK_STREAM)
+    except ImportError:
+        pass
+    return socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)
+
+
+class OutboundResponse:
+    """A streamed response; ``close`` returns the connection to its pool when that is cheap."""
+
+    def __init__(self, response):
+        self._response = response
+        self.status_code = response.status
+        self.headers = response.headers
+
+    def iter_content(self, chunk_size: int = 8192):
+        try:
+            yield from self._response.stream(chunk_size, decode_content=True)
+        except urllib3.exceptions.TimeoutError as exc:
+            raise OutboundError('timeout') from exc
+        except urllib3.exceptions.HTTPError as exc:
+            raise OutboundError('connection_error') from exc
+
+    def close(self) -> None:
+        response = self._response
+        remaining = response.length_remaining
+        try:
+            if remaining is not None and remaining <= KEEPALIVE_DRAIN_BYTES:
+                response.drain_conn()
+            else:
+                response.close()
+        finally:
+            response.release_conn()
+
+
+class OutboundClient:
+    def __init__(self, max_per_host: int = DEFAULT_MAX_PER_HOST, dns_ttl: float = DEFAULT_DNS_TTL):
+        self.max_per_host = max_per_host
+        self.dns_ttl = dns_ttl
+        self._dns = OrderedDict()
+        self._pools = OrderedDict()
+        self._lock = threading.Lock()
+        self._closed_connections = 0
+        self._stats = {'requests': 0, 'errors': 0, 'blocked': 0, 'dns_hits': 0, 'dns_misses': 0}
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+
+    def resolve(self, host: str, port: int) -> str:
+        """A validated public address of ``host``, cached for ``dns_ttl`` seconds."""
+        host = host.lower()
+        now = time.monotonic()
+        with self._lock:
+            cached = self._dns.get(host)
+            if cached and cached[1] > now:
+                self._stats['dns_hits'] += 1
+                return cached[0]
+            self._stats['dns_misses'] += 1
+
+        if host in BLOCKED_HOSTNAMES:
+            raise OutboundError('blocked_host')
+        try:
+            ipaddress.ip_address(host)
+            addresses = [host]
+        except ValueError:
+            try:
+                addresses = [info[4][0] for info in _getaddrinfo(host, port)]
+            except (OSError, UnicodeError) as exc:
+                raise OutboundError('dns_error') from exc
+        # One private address is enough to refuse the host (DNS rebinding)
+        if not addresses or not all(_is_public_ip(address) for address in addresses):
+            raise OutboundError('blocked_host')
+
+        with self._lock:
+            self._dns[host] = (addresses[0], now + self.dns_ttl)
+            self._dns.move_to_end(host)
+            while len(self._dns) > MAX_DNS_ENTRIES:
+                self._dns.popitem(last=False)
+        return addresses[0]
+
+    def _pool(self, scheme: str, host: str, port: int, address: str):
+        key = (scheme, host, port, address)
+        with self._lock:
+            pool = self._pools.get(key)
+            if pool is not None:
+                self._pools.move_to_end(key)
+                return pool
+            if scheme == 'https':
+                pool = urllib3.HTTPSConnectionPool(
+                    address, port, maxsize=self.max_per_host, block=True,
+                    cert_reqs='CERT_REQUIRED', ca_certs=certifi.where(),
+                    server_hostname=host, assert_hostname=host,
+                )
+            else:
+                pool = urllib3.HTTPConnectionPool(address, port, maxsize=self.max_per_host, block=True)
+            self._pools[key] = pool
+            while len(self._pools) > MAX_POOLS:
+                _key, evicted = self._pools.popitem(last=False)
+                self._closed_connections += evicted.num_connections
+                evicted.close()
+            return pool
+
+    def get(self, url: str, headers: dict | None = None, timeout: float = 5) -> OutboundResponse:
+        """GET ``url`` without following redirects; the body is streamed, the caller closes the response."""
+        parts = urlsplit(url)
+        scheme = parts.scheme.lower()
+        host = parts.hostname
+        if scheme not in DEFAULT_PORTS or not host:
+            raise OutboundError('invalid_url')
+        try:
+            port = parts.port or DEFAULT_PORTS[scheme]
+        except ValueError as exc:
+            raise OutboundError('invalid_url') from exc
+
+        try:
+            address = self.resolve(host, port)
+        except OutboundError as exc:
+            if exc.reason == 'blocked_host':
+                self._count('blocked')
+            raise
+
+        host_header = f'[{host}]' if ':' in host else host
+        if port != DEFAULT_PORTS[scheme]:
+            host_header = f'{host_header}:{port}'
+        path = (parts.path or '/') + (f'?{parts.query}' if parts.query else '')
+        request_headers = {'User-Agent': USER_AGENT, **(headers or {}), 'Host': host_header}
+
+        self._count('requests')
+        try:
+            response = self._pool(scheme, host, port, address).urlopen(
+                'GET', path,
+                headers=request_headers,
+                redirect=False,
+                retries=urllib3.Retry(total=1, connect=1, read=0, redirect=False, status=0),
+                preload_content=False,
+                assert_same_host=False,
+                timeout=urllib3.Timeout(connect=timeout, read=timeout),
+                pool_timeout=timeout,
+            )
+        except (urllib3.exceptions.TimeoutError, urllib3.exceptions.EmptyPoolError) as exc:
+            self._count('errors')
+            raise OutboundError('timeout') from exc
+        except urllib3.exceptions.HTTPError as exc:
+            self._count('errors')
+            raise OutboundError('connection_error') from exc
+        return OutboundResponse(response)
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            opened = self._closed_connections + sum(pool.num_connections for pool in self._pools.values())
+            stats['pools'] = len(self._pools)
+            stats['dns_entries'] = len(self._dns)
+        stats['connections_opened'] = opened
+        stats['connections_reused'] = max(stats['requests'] - stats['errors'] - opened, 0)
+        return stats
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def outbound_client() -> OutboundClient:
+    """The process-wide client, configured from the app on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                config = current_app.config if has_app_context() else {}
+                _client = OutboundClient(
+                    max_per_host=config.get('OUTBOUND_HTTP_PER_HOST', DEFAULT_MAX_PER_HOST),
+                    dns_ttl=config.get('OUTBOUND_DNS_TTL', DEFAULT_DNS_TTL),
+                )
+    return _client
+
+
+def client_stats() -> dict:
+    return _client.stats() if _client is not None else {}
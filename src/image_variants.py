@@ -0,0 +1,562 @@
+"""Responsive image variants, created in the background instead of in the request.
+
+An upload is stored unchanged as original outside ``static``
+(``IMAGE_ORIGINALS_FOLDER``, originals may carry EXIF location data and are
+never served). A small pool of workers (``IMAGE_PROCESSING_WORKERS``) decodes
+it once (JPEGs at a reduced scale, see ``open_scaled``), applies the EXIF
+orientation and writes next to the public path
+``<dir>/<stem>.jpg``:
+
+- ``<stem>.jpg``: the largest size as JPEG, the ``src`` fallback
+- ``<stem>-<width>.<ext>``: every size of the image's profile as JPEG and
+  WebP, for post images also AVIF when Pillow supports it
+
+Every variant is encoded in memory, at a lower quality if it exceeds its
+byte budget (``encode``), and written once by renaming a temporary file.
+
+Post images get a pending ``Media`` row that records size, widths and
+formats once processed. Avatars, covers and group icons keep their previous
+image until the new one is ready, then their URL is switched; they always get
+all widths of their profile in JPEG and WebP, so templates only check whether
+the smallest one exists. With ``IMAGE_PROCESSING_MODE=inline`` (and in tests)
+jobs run synchronously. ``chronicle backfill-image-variants`` processes
+existing uploads and rows left pending by a restart.
+"""
+import glob
+import io
+import json
+import os
+import queue
+import threading
+import uuid
+
+from flask import current_app, url_for
+from PIL import ExifTags, Image, features
+from sqlalchemy import inspect as sa_inspect
+from werkzeug.utils import secure_filename
+
+from extensions import db
+from executor import run_blocking, spawn
+from models import Media
+
+# Longest side in pixels per kind of image, smallest first
+PROFILES = {
+    'post': (160, 320, 640, 1280, 1920),
+    'cover': (640, 1280, 1920),
+    'avatar': (48, 96, 192, 512),
+    'icon': (48, 96, 256),
+}
+PROFILE_FORMATS = ('webp',)
+DEFAULT_POST_FORMATS = ('avif', 'webp')
+ENCODERS = {
+    'jpg': ('JPEG', {'quality': 85, 'optimize': True, 'progressive': True}),
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'avif': ('AVIF', {'quality': 60, 'speed': 6}),
+}
+# Lowest quality the byte budget may push an encoder to, and the budget per
+# pixel (a 1920x1280 JPEG gets about 500 KB), never below MIN_BYTE_BUDGET
+MIN_QUALITY = {'jpg': 60, 'webp': 50, 'avif': 35}
+BYTES_PER_PIXEL = {'jpg': 0.2, 'webp': 0.15, 'avif': 0.1}
+MIN_BYTE_BUDGET = 8 * 1024
+QUALITY_SEARCH_STEPS = 4
+MIME_TYPES = {'jpg': 'image/jpeg', 'webp': 'image/webp', 'avif': 'image/avif'}
+UPLOAD_FORMATS = {'JPEG': 'jpg', 'PNG': 'png', 'GIF': 'gif', 'WEBP': 'webp'}
+MAX_KNOWN_VARIANTS = 10000
+EXIF_TRANSPOSE = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+# Larger uploads are rejected; a 50 MP PNG still decodes to 150 MB of RGB
+MAX_SOURCE_PIXELS = 50_000_000
+# Variants for avatars and galleries built in JavaScript (about 2x their rendered size)
+AVATAR_THUMB_WIDTH = 96
+MEDIA_THUMB_WIDTH = 256
+
+_jobs = queue.Queue()
+_started = False
+_start_lock = threading.Lock()
+_known_variants = set()
+_stats_lock = threading.Lock()
+_stats = {'images': 0, 'variants': 0, 'bytes_written': 0, 'encodes': 0, 'reduced': 0, 'over_budget': 0}
+
+
+class InvalidImage(ValueError):
+    """The upload is not an image format we accept."""
+
+
+class _Job:
+    """Create the variants of ``rel_path``; then update a ``Media`` row or switch ``model.attr`` to the image."""
+
+    def __init__(self, kind: str, rel_path: str, media_id: int | None = None, target=None):
+        self.kind = kind
+        self.rel_path = rel_path
+        self.media_id = media_id
+        self.target = target  # (model class, id, attribute) for avatars, covers and icons
+
+
+def _split(rel_path: str) -> tuple[str, str]:
+    rel_dir, filename = os.path.split(rel_path)
+    return rel_dir, os.path.splitext(filename)[0]
+
+
+def _static_path(rel_path: str) -> str:
+    return os.path.join(current_app.static_folder, rel_path)
+
+
+def _originals_dir(rel_dir: str) -> str:
+    return os.path.join(current_app.config['IMAGE_ORIGINALS_FOLDER'], rel_dir)
+
+
+def _find_original(rel_path: str) -> str | None:
+    rel_dir, stem = _split(rel_path)
+    matches = glob.glob(os.path.join(glob.escape(_originals_dir(rel_dir)), glob.escape(stem) + '.*'))
+    return matches[0] if matches else None
+
+
+def post_formats() -> tuple[str, ...]:
+    """Extra formats of post images (``IMAGE_VARIANT_FORMATS``) that this Pillow can encode."""
+    configured = current_app.config.get('IMAGE_VARIANT_FORMATS', DEFAULT_POST_FORMATS)
+    return tuple(fmt for fmt in configured if fmt in ('avif', 'webp') and features.check(fmt))
+
+
+def store_original(file, rel_dir: str, stem: str) -> str:
+    """Save an upload unchanged as original; returns its path.
+
+    Only the header is read here, decoding happens in the background.
+    """
+    try:
+        with Image.open(file) as img:
+            ext = UPLOAD_FORMATS.get(img.format)
+            pixels = img.width * img.height
+    except (OSError, Image.DecompressionBombError) as exc:
+        raise InvalidImage(str(exc)) from exc
+    if ext is None:
+        raise InvalidImage('unsupported image format')
+    if pixels > MAX_SOURCE_PIXELS:
+        raise InvalidImage(f'image too large ({pixels} pixels)')
+    file.seek(0)
+    directory = _originals_dir(rel_dir)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'{stem}.{ext}')
+    file.save(path)
+    return path
+
+
+def open_scaled(source: str, longest: int | None) -> Image.Image:
+    """Decode ``source`` as upright RGB image, JPEGs at a reduced scale if possible.
+
+    The JPEG decoder can scale by 1/2, 1/4 or 1/8 while decoding (``draft``);
+    the smallest scale that keeps the longest side at ``longest`` or above is
+    used, so a 24 MP phone photo needs 18 MB instead of 72 MB for a 1920 px
+    variant. The EXIF orientation is applied afterwards, on the smaller image.
+    ``longest=None`` decodes at full size.
+    """
+    with Image.open(source) as opened:
+        if opened.width * opened.height > MAX_SOURCE_PIXELS:
+            raise InvalidImage(f'image too large ({opened.width}x{opened.height})')
+        transpose = EXIF_TRANSPOSE.get(opened.getexif().get(ExifTags.Base.Orientation, 1))
+        if longest and opened.format == 'JPEG':
+            scale = min(1.0, longest / max(opened.size))
+            opened.draft('RGB', (max(1, round(opened.width * scale)), max(1, round(opened.height * scale))))
+        img = opened.convert('RGB')
+    if transpose is not None:
+        img = img.transpose(transpose)
+    return img
+
+
+def encoder_stats() -> dict:
+    """Encoder counters of this process since it started."""
+    with _stats_lock:
+        stats = dict(_stats)
+    stats['avg_variant_bytes'] = round(stats['bytes_written'] / stats['variants']) if stats['variants'] else None
+    return stats
+
+
+def byte_budget(ext: str, size: tuple[int, int]) -> int:
+    return max(MIN_BYTE_BUDGET, int(size[0] * size[1] * BYTES_PER_PIXEL[ext]))
+
+
+def _encode_once(img: Image.Image, ext: str, quality: int) -> bytes:
+    encoder, options = ENCODERS[ext]
+    buffer = io.BytesIO()
+    img.save(buffer, encoder, **{**options, 'quality': quality})
+    return buffer.getvalue()
+
+
+def encode(img: Image.Image, ext: str, budget: int) -> tuple[bytes, int]:
+    """Encode ``img`` in memory at the highest quality that fits ``budget`` bytes.
+
+    Starts at the configured quality; only images above the budget are
+    searched (bisection down to ``MIN_QUALITY``). Returns data and quality;
+    if even the minimum quality is too large, that result is returned.
+    """
+    quality = ENCODERS[ext][1]['quality']
+    data = _encode_once(img, ext, quality)
+    encodes = 1
+    if len(data) > budget:
+        low, high = MIN_QUALITY[ext], quality - 1
+        best = None
+        for _ in range(QUALITY_SEARCH_STEPS):
+            if low > high:
+                break
+            candidate = (low + high) // 2
+            attempt = _encode_once(img, ext, candidate)
+            encodes += 1
+            if len(attempt) <= budget:
+                best = (attempt, candidate)
+                low = candidate + 1
+            else:
+                high = candidate - 1
+        if best is None:
+            # Nothing fits: settle for the smallest file
+            if candidate != MIN_QUALITY[ext]:
+                attempt, candidate = _encode_once(img, ext, MIN_QUALITY[ext]), MIN_QUALITY[ext]
+                encodes += 1
+            best = (attempt, candidate)
+        data, quality = best
+    with _stats_lock:
+        _stats['encodes'] += encodes
+        if encodes > 1:
+            _stats['reduced'] += 1
+        if len(data) > budget:
+            _stats['over_budget'] += 1
+    return data, quality
+
+
+def write_atomic(path: str, data: bytes) -> None:
+    """Write ``data`` next to ``path`` and rename it into place, so readers never see partial files."""
+    temp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+    try:
+        with open(temp_path, 'wb') as handle:
+            handle.write(data)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def render_variants(source: str, target_dir: str, stem: str, sizes, formats, fixed: bool,
+                    write_fallback: bool = True, draft: bool = True) -> dict:
+    """Decode ``source`` once and write all variants; runs without app context.
+
+    ``fixed`` variants are named after their profile size (and never upscaled),
+    others after their actual width, skipping sizes above the original.
+    ``draft=False`` decodes JPEGs at full size (for ``scripts/benchmark_image_decode.py``).
+    """
+    img = open_scaled(source, max(sizes) if draft else None)
+    width, height = img.size
+    longest = max(width, height)
+
+    steps = []
+    for size in sorted(sizes, reverse=True):
+        if not fixed and size >= longest and steps:
+            continue
+        scale = min(1.0, size / longest)
+        steps.append((size, (max(1, round(width * scale)), max(1, round(height * scale)))))
+    if not fixed:
+        steps = [(dims[0], dims) for index, (_size, dims) in enumerate(steps)
+                 if index == 0 or dims[0] != steps[index - 1][1][0]]
+
+    os.makedirs(target_dir, exist_ok=True)
+    current = img
+    names = []
+    written = 0
+    variants = 0
+    for index, (name, dims) in enumerate(steps):
+        # Each size is scaled down from the previous, larger one
+        if current.size != dims:
+            current = current.resize(dims, Image.Resampling.LANCZOS)
+        for ext in ('jpg', *formats):
+            if ext == 'jpg' and index == 0:
+                if not write_fallback:
+                    continue
+                path = os.path.join(target_dir, f'{stem}.jpg')
+            else:
+                path = os.path.join(target_dir, f'{stem}-{name}.{ext}')
+            data, _quality = encode(current, ext, byte_budget(ext, current.size))
+            write_atomic(path, data)
+            written += len(data)
+            variants += 1
+        names.append(name)
+    with _stats_lock:
+        _stats['images'] += 1
+        _stats['variants'] += variants
+        _stats['bytes_written'] += written
+
+    return {
+        'width': steps[0][1][0],
+        'height': steps[0][1][1],
+        'widths': sorted(names),
+        'formats': list(formats),
+        'file_size': os.path.getsize(os.path.join(target_dir, f'{stem}.jpg')),
+        'bytes_written': written,
+    }
+
+
+def _process(app, job: _Job) -> dict:
+    _rel_dir, stem = _split(job.rel_path)
+    fallback = _static_path(job.rel_path)
+    source = _find_original(job.rel_path)
+    if source is None:
+        # Uploads from before originals were kept: their JPEG is the best source left
+        if not os.path.exists(fallback):
+            raise FileNotFoundError(job.rel_path)
+        source = fallback
+    formats = post_formats() if job.kind == 'post' else PROFILE_FORMATS
+    return run_blocking(
+        'image', render_variants, source, os.path.dirname(fallback), stem, PROFILES[job.kind], formats,
+        job.kind != 'post', source != fallback,
+    )
+
+
+def _complete_media(app, job: _Job) -> None:
+    media = db.session.get(Media, job.media_id)
+    if media is None:
+        return
+    try:
+        result = _process(app, job)
+    except Exception:
+        app.logger.exception('Image variants for %s failed', job.rel_path)
+        media.status = 'failed'
+        db.session.commit()
+        return
+    media.width = result['width']
+    media.height = result['height']
+    media.file_size = result['file_size']
+    media.variants = json.dumps({'widths': result['widths'], 'formats': result['formats']})
+    media.status = 'ready'
+    db.session.commit()
+
+
+def _complete_profile_image(app, job: _Job) -> None:
+    _process(app, job)
+    model, object_id, attr = job.target
+    obj = db.session.get(model, object_id)
+    if obj is not None:
+        setattr(obj, attr, f'{app.static_url_path}/{job.rel_path}')
+        db.session.commit()
+
+
+def _run(app, job: _Job) -> None:
+    try:
+        if job.media_id is not None:
+            _complete_media(app, job)
+        else:
+            _complete_profile_image(app, job)
+    except Exception:
+        app.logger.exception('Image variants for %s failed', job.rel_path)
+        db.session.rollback()
+
+
+def _worker(app) -> None:
+    while True:
+        job = _jobs.get()
+        with app.app_context():
+            try:
+                _run(app, job)
+            finally:
+                db.session.remove()
+
+
+def _inline(app) -> bool:
+    return app.config.get('TESTING') or app.config.get('IMAGE_PROCESSING_MODE') == 'inline'
+
+
+def _ensure_workers(app) -> None:
+    global _started
+    if _started:
+        return
+    with _start_lock:
+        if _started:
+            return
+        for _ in range(max(1, app.config.get('IMAGE_PROCESSING_WORKERS', 2))):
+            spawn(_worker, app, name='chronicle-image-variants')
+        _started = True
+
+
+def _submit(job: _Job) -> None:
+    app = current_app._get_current_object()
+    if _inline(app):
+        _run(app, job)
+        return
+    _ensure_workers(app)
+    _jobs.put(job)
+
+
+def add_post_image(post, file, user_id: int, alt_text: str | None = None, order: int = 0) -> Media:
+    """Store an uploaded post image and add its pending ``Media`` row (raises ``InvalidImage``).
+
+    Hand the rows to ``enqueue_media`` after the commit.
+    """
+    if post.group_id:
+        rel_dir = f'uploads/groups/{post.group_id}/posts/{post.id}'
+    else:
+        rel_dir = f'uploads/users/{user_id}/posts/{post.id}'
+    stem = uuid.uuid4().hex
+    original = store_original(file, rel_dir, stem)
+    media = Media(
+        user_id=user_id,
+        post_id=post.id,
+        filename=f'{stem}.jpg',
+        original_filename=secure_filename(file.filename or '') or f'{stem}.jpg',
+        file_path=f'{rel_dir}/{stem}.jpg',
+        file_type='image/jpeg',
+        file_size=os.path.getsize(original),
+        alt_text=alt_text,
+        order=order,
+        status='pending',
+    )
+    db.session.add(media)
+    return media
+
+
+def enqueue_media(rows) -> None:
+    """Create the variants of committed pending ``Media`` rows in the background."""
+    for row in rows:
+        _submit(_Job('post', row.file_path, media_id=row.id))
+
+
+def replace_profile_image(obj, attr: str, file, kind: str, rel_dir: str, prefix: str) -> None:
+    """Store a new avatar, cover or icon; ``obj.attr`` points to it once its variants exist.
+
+    ``obj`` must already have an id. Raises ``InvalidImage``.
+    """
+    stem = f'{prefix}_{uuid.uuid4().hex[:8]}'
+    store_original(file, rel_dir, stem)
+    _submit(_Job(kind, f'{rel_dir}/{stem}.jpg', target=(sa_inspect(obj).mapper.class_, obj.id, attr)))
+
+
+def static_rel_path(url: str | None) -> str | None:
+    """The path below ``static`` of a local static URL, None for external ones."""
+    if not url:
+        return None
+    prefix = current_app.static_url_path.rstrip('/') + '/'
+    if url.startswith(prefix):
+        return url[len(prefix):]
+    return None
+
+
+def delete_image_files(rel_path: str | None) -> None:
+    """Remove an image, its variants and its original."""
+    if not rel_path:
+        return
+    rel_dir, stem = _split(rel_path)
+    pattern = glob.escape(stem)
+    static_dir = os.path.dirname(_static_path(rel_path))
+    paths = [_static_path(rel_path)]
+    paths += glob.glob(os.path.join(glob.escape(static_dir), pattern + '-*.*'))
+    paths += glob.glob(os.path.join(glob.escape(_originals_dir(rel_dir)), pattern + '.*'))
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _srcset(rel_dir: str, stem: str, widths, ext: str) -> str:
+    largest = max(widths)
+    entries = []
+    for width in widths:
+        filename = f'{stem}.jpg' if ext == 'jpg' and width == largest else f'{stem}-{width}.{ext}'
+        entries.append(f"{url_for('static', filename=f'{rel_dir}/{filename}')} {width}w")
+    return ', '.join(entries)
+
+
+def _picture(rel_path: str, widths, formats, width=None, height=None) -> dict:
+    rel_dir, stem = _split(rel_path)
+    return {
+        'pending': False,
+        'src': url_for('static', filename=rel_path),
+        'srcset': _srcset(rel_dir, stem, widths, 'jpg') if widths else '',
+        'sources': [
+            {'type': MIME_TYPES[ext], 'srcset': _srcset(rel_dir, stem, widths, ext)}
+            for ext in formats
+        ] if widths else [],
+        'width': width,
+        'height': height,
+    }
+
+
+def media_image(media) -> dict:
+    """``src``, ``srcset`` and ``<source>`` entries of a post image (see components/picture.html)."""
+    if media.status != 'ready':
+        return {'pending': True, 'failed': media.status == 'failed', 'src': None}
+    info = media.variant_info or {}
+    widths = info.get('widths') or []
+    return _picture(media.file_path, widths, info.get('formats') or [], media.width, media.height)
+
+
+def _has_profile_variants(rel_path: str, kind: str) -> bool:
+    if rel_path in _known_variants:
+        return True
+    rel_dir, stem = _split(rel_path)
+    smallest = os.path.join(current_app.static_folder, rel_dir, f'{stem}-{PROFILES[kind][0]}.webp')
+    if not os.path.exists(smallest):
+        return False
+    if len(_known_variants) >= MAX_KNOWN_VARIANTS:
+        _known_variants.clear()
+    _known_variants.add(rel_path)
+    return True
+
+
+def profile_image(url: str | None, kind: str) -> dict | None:
+    """Like ``media_image`` for an avatar, cover or group icon URL; plain ``src`` without variants."""
+    if not url:
+        return None
+    rel_path = static_rel_path(url)
+    if rel_path is None or not _has_profile_variants(rel_path, kind):
+        return {'pending': False, 'src': url, 'srcset': '', 'sources': [], 'width': None, 'height': None}
+    return _picture(rel_path, PROFILES[kind], PROFILE_FORMATS)
+
+
+def variant_url(url: str | None, kind: str, min_width: int) -> str | None:
+    """URL of the smallest WebP variant at least ``min_width`` wide, for markup built in JavaScript."""
+    rel_path = static_rel_path(url)
+    if rel_path is None or not _has_profile_variants(rel_path, kind):
+        return url
+    rel_dir, stem = _split(rel_path)
+    width = next((w for w in PROFILES[kind] if w >= min_width), PROFILES[kind][-1])
+    return url_for('static', filename=f'{rel_dir}/{stem}-{width}.webp')
+
+
+def media_thumb_path(media, min_width: int) -> str | None:
+    """Path below ``static`` of a post image's smallest WebP (else JPEG) variant at least ``min_width`` wide."""
+    if media.status != 'ready':
+        return None
+    info = media.variant_info
+    if not info or not info.get('widths'):
+        return media.file_path
+    rel_dir, stem = _split(media.file_path)
+    widths = info['widths']
+    width = next((w for w in widths if w >= min_width), widths[-1])
+    if 'webp' in info.get('formats', []):
+        return f'{rel_dir}/{stem}-{width}.webp'
+    return media.file_path if width == widths[-1] else f'{rel_dir}/{stem}-{width}.jpg'
+
+
+def pending_media():
+    """Media rows without variants: legacy uploads and jobs lost to a restart."""
+    return Media.query.filter(
+        Media.file_type.like('image/%'),
+        db.or_(Media.variants.is_(None), Media.status != 'ready'),
+    ).order_by(Media.id.asc())
+
+
+def backfill_media(media) -> None:
+    """Create the variants of one ``Media`` row synchronously."""
+    _run(current_app._get_current_object(), _Job('post', media.file_path, media_id=media.id))
+
+
+def backfill_profile_image(obj, attr: str, kind: str) -> bool:
+    """Create variants for an existing avatar, cover or icon; False when there is nothing to do."""
+    rel_path = static_rel_path(getattr(obj, attr))
+    if rel_path is None or _has_profile_variants(rel_path, kind):
+        return False
+    _run(current_app._get_current_object(), _Job(kind, rel_path, target=(sa_inspect(obj).mapper.class_, obj.id, attr)))
+    return True
@@ -0,0 +1,222 @@
+"""Link previews fetched in the background instead of inside the request.
+
+Saving a post stores one ``LinkPreview`` row per URL with ``status='pending'``
+(embeds such as YouTube get their ``embed_type``/``embed_id`` right away, as
+that needs no network). After the commit the rows are handed to a small pool
+of workers that looks the URL up in the shared metadata cache (see
+url_metadata.py, fetching it on a miss), links the row to it and notifies
+viewers of the post room; previews that yield nothing are removed again.
+
+Concurrency is bounded globally by the number of workers
+(``LINK_PREVIEW_WORKERS``) and per host (``LINK_PREVIEW_PER_HOST``). Jobs for
+a host that already has that many jobs in flight wait in a per-host queue
+and only move to the shared queue when one of them finishes, so workers
+never sit on a job they cannot start and a post full of links to one slow
+site cannot occupy the whole pool. The editor
+preview (``/api/link-preview``) goes through the same pool and waits for its
+result. With ``LINK_PREVIEW_MODE=inline`` (and in tests) jobs run
+synchronously instead.
+"""
+import queue
+import threading
+from collections import deque
+from urllib.parse import urlparse
+
+from flask import current_app
+
+from extensions import db
+from executor import spawn
+from models import LinkPreview
+from content_utils import extract_urls, detect_embed_type, build_link_preview
+from url_metadata import cached_metadata, refresh_metadata
+from serializers import link_preview_payload
+
+MAX_PREVIEWS_PER_POST = 5
+EDITOR_PREVIEW_TIMEOUT = 15
+
+_jobs = queue.Queue()
+_started = False
+_start_lock = threading.Lock()
+
+# Jobs queued or running per host, and the jobs waiting for one of them to finish
+_host_active = {}
+_host_waiting = {}
+_host_lock = threading.Lock()
+
+
+class _Job:
+    """A URL to fetch; either for a stored preview row or for a waiting caller."""
+
+    def __init__(self, url: str, preview_id: int | None = None):
+        self.url = url
+        self.host = (urlparse(url).hostname or '').lower()
+        self.preview_id = preview_id
+        self.result = None
+        self.done = threading.Event()
+
+
+def _enqueue(job: _Job, limit: int) -> None:
+    """Queue ``job`` for the workers if its host has a free slot, else park it."""
+    with _host_lock:
+        if _host_active.get(job.host, 0) >= limit:
+            _host_waiting.setdefault(job.host, deque()).append(job)
+            return
+        _host_active[job.host] = _host_active.get(job.host, 0) + 1
+    _jobs.put(job)
+
+
+def _release(host: str) -> None:
+    """Hand the finished job's slot to the next parked job of ``host``, if any."""
+    with _host_lock:
+        waiting = _host_waiting.get(host)
+        if waiting:
+            job = waiting.popleft()
+            if not waiting:
+                del _host_waiting[host]
+        else:
+            job = None
+            remaining = _host_active[host] - 1
+            if remaining:
+                _host_active[host] = remaining
+            else:
+                del _host_active[host]
+    if job is not None:
+        _jobs.put(job)
+
+
+def _fetch(app, url: str):
+    """Preview data for ``url`` and its ``UrlMetadata`` entry."""
+    entry = cached_metadata(url) or refresh_metadata(url)
+    return build_link_preview(url, entry.og_data()), entry
+
+
+def _is_useful(data) -> bool:
+    return bool(data and (data.get('title') or data.get('embed_type')))
+
+
+def _notify(post_id: int, payload: dict) -> None:
+    try:
+        from websocket import emit_link_preview
+        emit_link_preview(post_id, payload)
+    except Exception:
+        current_app.logger.debug('Link preview push for post %s skipped', post_id, exc_info=True)
+
+
+def _complete_preview(app, preview_id: int) -> None:
+    preview = LinkPreview.query.get(preview_id)
+    if preview is None or preview.status != 'pending':
+        return
+    data, entry = _fetch(app, preview.url)
+    if _is_useful(data):
+        preview.url_metadata = entry if entry.status == 'ok' else None
+        preview.embed_type = data.get('embed_type')
+        preview.embed_id = data.get('embed_id')
+        preview.status = 'ready'
+        payload = {'id': preview.id, **link_preview_payload(preview)}
+    else:
+        payload = {'id': preview.id, 'status': 'removed', 'url': preview.url}
+        db.session.delete(preview)
+    post_id = preview.post_id
+    db.session.commit()
+    _notify(post_id, payload)
+
+
+def _run(app, job: _Job) -> None:
+    try:
+        if job.preview_id is not None:
+            _complete_preview(app, job.preview_id)
+        else:
+            job.result, _entry = _fetch(app, job.url)
+            db.session.commit()
+    except Exception:
+        app.logger.exception('Link preview for %s failed', job.url)
+        db.session.rollback()
+    finally:
+        job.done.set()
+
+
+def _worker(app) -> None:
+    while True:
+        job = _jobs.get()
+        with app.app_context():
+            try:
+                _run(app, job)
+            finally:
+                _release(job.host)
+                db.session.remove()
+
+
+def _inline(app) -> bool:
+    return app.config.get('TESTING') or app.config.get('LINK_PREVIEW_MODE') == 'inline'
+
+
+def _ensure_workers(app) -> None:
+    global _started
+    if _started:
+        return
+    with _start_lock:
+        if _started:
+            return
+        for _ in range(max(1, app.config.get('LINK_PREVIEW_WORKERS', 4))):
+            spawn(_worker, app, name='chronicle-link-previews')
+        _started = True
+
+
+def _submit(job: _Job) -> None:
+    app = current_app._get_current_object()
+    if _inline(app):
+        _run(app, job)
+        return
+    _ensure_workers(app)
+    _enqueue(job, app.config.get('LINK_PREVIEW_PER_HOST', 2))
+
+
+def _preview_urls(content) -> list[str]:
+    return list(dict.fromkeys(extract_urls(content or '')))[:MAX_PREVIEWS_PER_POST]
+
+
+def _pending_row(post_id: int, url: str) -> LinkPreview:
+    embed = detect_embed_type(url)
+    return LinkPreview(
+        post_id=post_id,
+        url=url,
+        status='pending',
+        embed_type=embed['type'] if embed else None,
+        embed_id=embed['id'] if embed else None
+    )
+
+
+def add_pending_previews(post, content) -> list[LinkPreview]:
+    """Add pending preview rows for the URLs in ``content`` (caller commits, then enqueues)."""
+    rows = [_pending_row(post.id, url) for url in _preview_urls(content)]
+    db.session.add_all(rows)
+    return rows
+
+
+def sync_pending_previews(post, content) -> list[LinkPreview]:
+    """Match a post's previews to edited ``content``: drop removed URLs, add pending rows for new ones."""
+    urls = _preview_urls(content)
+    existing = {}
+    for preview in list(post.link_previews):
+        if preview.url in urls and preview.url not in existing:
+            existing[preview.url] = preview
+        else:
+            post.link_previews.remove(preview)
+    rows = [_pending_row(post.id, url) for url in urls if url not in existing]
+    db.session.add_all(rows)
+    return rows
+
+
+def enqueue_previews(rows) -> None:
+    """Fetch committed pending previews in the background."""
+    for row in rows:
+        _submit(_Job(row.url, preview_id=row.id))
+
+
+def fetch_preview(url: str, timeout: float = EDITOR_PREVIEW_TIMEOUT):
+    """Fetch preview data for the editor through the pool; None on failure or timeout."""
+    job = _Job(url)
+    _submit(job)
+    if not job.done.wait(timeout):
+        return None
+    return job.result
@@ -1,9 +1,12 @@
 from flask_login import UserMixin
 from datetime import datetime, timezone, timedelta
+import json
 import uuid
 import secrets
 from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy.orm.attributes import set_committed_value
 from extensions import db
+from executor import run_blocking
 
 
 class User(UserMixin, db.Model):
@@ -51,12 +54,12 @@ class User(UserMixin, db.Model):
     session_token = db.Column(db.String(64), nullable=True)
     
     # Relationships
-    posts = db.relationship('Post', backref='author', lazy='dynamic', cascade='all, delete-orphan')
-    pages = db.relationship('Page', backref='owner', lazy='dynamic', cascade='all, delete-orphan')
-    media = db.relationship('Media', backref='owner', lazy='dynamic', cascade='all, delete-orphan')
+    posts = db.relationship('Post', backref='author', lazy='write_only', cascade='all, delete-orphan', passive_deletes=True)
+    pages = db.relationship('Page', backref='owner', lazy='write_only', cascade='all, delete-orphan', passive_deletes=True)
+    media = db.relationship('Media', backref='owner', lazy='write_only', cascade='all, delete-orphan', passive_deletes=True)
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = run_blocking('password', generate_password_hash, password)
 
     def ensure_session_token(self):
         if not self.session_token:
@@ -72,7 +75,7 @@ class User(UserMixin, db.Model):
     def check_password(self, password):
         if not self.password_hash:
             return False
-        return check_password_hash(self.password_hash, password)
+        return run_blocking('password', check_password_hash, self.password_hash, password)
 
     def __repr__(self):
         return f'<User {self.username}>'
@@ -88,7 +91,7 @@ class PasswordResetToken(db.Model):
     expires_at = db.Column(db.DateTime, nullable=False, index=True)
     used_at = db.Column(db.DateTime, nullable=True)
 
-    user = db.relationship('User', backref=db.backref('password_reset_tokens', lazy='dynamic', cascade='all, delete-orphan'))
+    user = db.relationship('User', backref=db.backref('password_reset_tokens', lazy='write_only', cascade='all, delete-orphan', passive_deletes=True))
 
     @staticmethod
     def generate_token() -> str:
@@ -129,12 +132,12 @@ class Invite(db.Model):
         return created_at + timedelta(days=7)
 
     def set_code(self, code: str) -> None:
-        self.code_hash = generate_password_hash(code)
+        self.code_hash = run_blocking('password', generate_password_hash, code)
 
     def check_code(self, code: str) -> bool:
         if not self.code_hash:
             return False
-        return check_password_hash(self.code_hash, code)
+        return run_blocking('password', check_password_hash, self.code_hash, code)
 
     def is_expired(self) -> bool:
         if not self.expires_at:
@@ -163,7 +166,7 @@ class Page(db.Model):
     updated_at = db.Column(db.DateTime, server_default=db.func.now(), onupdate=db.func.now())
     
     # Relationships
-    posts = db.relationship('Post', backref='page', lazy='dynamic', cascade='all, delete-orphan')
+    posts = db.relationship('Post', backref='page', lazy='write_only', cascade='all, delete-orphan', passive_deletes=True)
 
     __table_args__ = (db.UniqueConstraint('user_id', 'slug', name='unique_user_page_slug'),)
 
@@ -191,19 +194,52 @@ class Post(db.Model):
     post_type = db.Column(db.String(20), default='text')  # text, image, gallery
     is_published = db.Column(db.Boolean, default=True)
     show_in_feed = db.Column(db.Boolean, default=True)
-    scheduled_at = db.Column(db.DateTime, nullable=True)
+    scheduled_at = db.Column(db.DateTime, nullable=True, index=True)
     published_at = db.Column(db.DateTime, nullable=True)
+    # Stored COALESCE(scheduled_at, published_at, created_at); timelines sort on it
+    effective_at = db.Column(db.DateTime, nullable=True)
     view_count = db.Column(db.Integer, default=0)
+    # Denormalized counters, maintained by counters.py
+    comment_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    bookmark_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     created_at = db.Column(db.DateTime, server_default=db.func.now())
     updated_at = db.Column(db.DateTime, server_default=db.func.now(), onupdate=db.func.now())
     
     # Relationships
-    media_items = db.relationship('Media', backref='post', lazy='dynamic')
+    media_items = db.relationship('Media', backref='post', lazy='selectin', order_by='Media.order')
+
+    __table_args__ = (
+        db.Index('ix_posts_published_effective_at', 'is_published', effective_at.desc(), 'id'),
+        db.Index('ix_posts_user_effective_at', 'user_id', 'effective_at'),
+        db.Index('ix_posts_group_effective_at', 'group_id', 'effective_at'),
+    )
+
+    def compute_effective_at(self):
+        return self.scheduled_at or self.published_at or self.created_at or datetime.utcnow()
 
     def __repr__(self):
         return f'<Post {self.id}>'
 
 
+@db.event.listens_for(Post, 'before_insert')
+@db.event.listens_for(Post, 'before_update')
+def _sync_post_effective_at(mapper, connection, target):
+    target.effective_at = target.compute_effective_at()
+
+
+class RenderedContent(db.Model):
+    """Rendered Markdown keyed by a hash of the source text and renderer version (see render_cache.py)."""
+    __tablename__ = 'rendered_content'
+
+    content_hash = db.Column(db.String(64), primary_key=True)
+    html = db.Column(db.Text, nullable=False)
+    toc = db.Column(db.Text, nullable=True)  # JSON list of headings
+    created_at = db.Column(db.DateTime, server_default=db.func.now())
+
+    def __repr__(self):
+        return f'<RenderedContent {self.content_hash[:12]}>'
+
+
 class Media(db.Model):
     __tablename__ = 'media'
 
@@ -219,26 +255,93 @@ class Media(db.Model):
     caption = db.Column(db.Text, nullable=True)
     order = db.Column(db.Integer, default=0)
     created_at = db.Column(db.DateTime, server_default=db.func.now())
+    # Responsive variants, created in the background (see image_variants.py)
+    status = db.Column(db.String(20), nullable=False, default='ready', server_default='ready')  # pending, ready, failed
+    width = db.Column(db.Integer, nullable=True)
+    height = db.Column(db.Integer, nullable=True)
+    variants = db.Column(db.Text, nullable=True)  # JSON: {"widths": [...], "formats": [...]}
+
+    @property
+    def variant_info(self) -> dict | None:
+        if not self.variants:
+            return None
+        try:
+            return json.loads(self.variants)
+        except ValueError:
+            return None
 
     def __repr__(self):
         return f'<Media {self.filename}>'
 
 
-class LinkPreview(db.Model):
-    __tablename__ = 'link_previews'
+class UrlMetadata(db.Model):
+    """Fetched page metadata shared by all link previews of a normalized URL (see url_metadata.py)."""
+    __tablename__ = 'url_metadata'
 
     id = db.Column(db.Integer, primary_key=True)
-    post_id = db.Column(db.Integer, db.ForeignKey('posts.id'), nullable=False)
-    url = db.Column(db.String(2000), nullable=False)
+    url_hash = db.Column(db.String(64), unique=True, nullable=False)  # sha256 of the normalized URL
+    url = db.Column(db.String(2000), nullable=False)  # as first posted; fetched as is
+    status = db.Column(db.String(20), nullable=False, default='ok')  # ok, failed
+    failure_reason = db.Column(db.String(50), nullable=True)  # timeout, not_html, blocked_host, ...
     title = db.Column(db.String(500), nullable=True)
     description = db.Column(db.Text, nullable=True)
     image_url = db.Column(db.String(2000), nullable=True)
     site_name = db.Column(db.String(200), nullable=True)
+    fetched_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+    def og_data(self):
+        """Metadata in the shape of ``content_utils.fetch_open_graph``, None for failed fetches."""
+        if self.status != 'ok':
+            return None
+        return {
+            'url': self.url,
+            'title': self.title,
+            'description': self.description,
+            'image_url': self.image_url,
+            'site_name': self.site_name
+        }
+
+    def __repr__(self):
+        return f'<UrlMetadata {self.url[:50]}>'
+
+
+class LinkPreview(db.Model):
+    __tablename__ = 'link_previews'
+
+    id = db.Column(db.Integer, primary_key=True)
+    post_id = db.Column(db.Integer, db.ForeignKey('posts.id'), nullable=False)
+    url = db.Column(db.String(2000), nullable=False)
+    url_metadata_id = db.Column(db.Integer, db.ForeignKey('url_metadata.id'), nullable=True, index=True)
+    # Inline metadata of previews created before url_metadata existed; newer rows only reference url_metadata
+    _title = db.Column('title', db.String(500), nullable=True)
+    _description = db.Column('description', db.Text, nullable=True)
+    _image_url = db.Column('image_url', db.String(2000), nullable=True)
+    _site_name = db.Column('site_name', db.String(200), nullable=True)
     embed_type = db.Column(db.String(50), nullable=True)  # youtube, spotify, twitter, instagram, link
     embed_id = db.Column(db.String(200), nullable=True)  # Video/track/post ID for embeds
+    # pending until the metadata was fetched in the background (see link_previews.py)
+    status = db.Column(db.String(20), nullable=False, default='ready', server_default='ready')
     created_at = db.Column(db.DateTime, server_default=db.func.now())
 
-    post = db.relationship('Post', backref=db.backref('link_previews', lazy='dynamic', cascade='all, delete-orphan'))
+    post = db.relationship('Post', backref=db.backref('link_previews', lazy='selectin', cascade='all, delete-orphan', order_by='LinkPreview.id'))
+    url_metadata = db.relationship('UrlMetadata', lazy='joined')
+
+    @property
+    def title(self):
+        return self.url_metadata.title if self.url_metadata else self._title
+
+    @property
+    def description(self):
+        return self.url_metadata.description if self.url_metadata else self._description
+
+    @property
+    def image_url(self):
+        return self.url_metadata.image_url if self.url_metadata else self._image_url
+
+    @property
+    def site_name(self):
+        return self.url_metadata.site_name if self.url_metadata else self._site_name
 
     def __repr__(self):
         return f'<LinkPreview {self.url[:50]}>'
@@ -261,7 +364,7 @@ class Tag(db.Model):
     color = db.Column(db.String(7), default='#4da9a4')
     created_at = db.Column(db.DateTime, server_default=db.func.now())
 
-    posts = db.relationship('Post', secondary=post_tags, backref=db.backref('tags', lazy='dynamic'))
+    posts = db.relationship('Post', secondary=post_tags, backref=db.backref('tags', lazy='selectin'))
 
     __table_args__ = (db.UniqueConstraint('user_id', 'slug', name='unique_user_tag_slug'),)
 
@@ -299,7 +402,7 @@ class Reaction(db.Model):
     emoji = db.Column(db.String(10), nullable=False)  # 👍 ❤️ 😂 😮 😢 🎉
     created_at = db.Column(db.DateTime, server_default=db.func.now())
 
-    post = db.relationship('Post', backref=db.backref('reactions', lazy='dynamic', cascade='all, delete-orphan'))
+    post = db.relationship('Post', backref=db.backref('reactions', lazy='write_only', cascade='all, delete-orphan', passive_deletes=True))
 
     __table_args__ = (db.UniqueConstraint('post_id', 'user_id', 'emoji', name='unique_user_reaction'),)
 
@@ -307,6 +410,18 @@ class Reaction(db.Model):
         return f'<Reaction {self.emoji}>'
 
 
+class PostReactionCount(db.Model):
+    """Per-emoji reaction total of a post, maintained by counters.py."""
+    __tablename__ = 'post_reaction_counts'
+
+    post_id = db.Column(db.Integer, db.ForeignKey('posts.id'), primary_key=True)
+    emoji = db.Column(db.String(10), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<PostReactionCount {self.post_id} {self.emoji}={self.count}>'
+
+
 class Bookmark(db.Model):
     __tablename__ = 'bookmarks'
 
@@ -315,8 +430,8 @@ class Bookmark(db.Model):
     post_id = db.Column(db.Integer, db.ForeignKey('posts.id'), nullable=False)
     created_at = db.Column(db.DateTime, server_default=db.func.now())
 
-    post = db.relationship('Post', backref=db.backref('bookmarks', lazy='dynamic', cascade='all, delete-orphan'))
-    user = db.relationship('User', backref=db.backref('bookmarks', lazy='dynamic'))
+    post = db.relationship('Post', backref=db.backref('bookmarks', lazy='write_only', cascade='all, delete-orphan', passive_deletes=True))
+    user = db.relationship('User', backref=db.backref('bookmarks', lazy='write_only', passive_deletes=True))
 
     __table_args__ = (db.UniqueConstraint('user_id', 'post_id', name='unique_user_bookmark'),)
 
@@ -335,15 +450,51 @@ class Comment(db.Model):
     is_approved = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, server_default=db.func.now())
     updated_at = db.Column(db.DateTime, server_default=db.func.now(), onupdate=db.func.now())
+    # Set after insert (see _set_comment_path): nesting level and the zero-padded ids from the
+    # top-level comment down, e.g. "0000000012.0000000034". Sorting by path yields the thread depth-first.
+    depth = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    path = db.Column(db.String(255), nullable=True)
 
-    post = db.relationship('Post', backref=db.backref('comments', lazy='dynamic', cascade='all, delete-orphan'))
-    author = db.relationship('User', backref=db.backref('comments', lazy='dynamic'))
-    replies = db.relationship('Comment', backref=db.backref('parent', remote_side=[id]), lazy='dynamic')
+    __table_args__ = (
+        # Thread loading: all comments of a post, top-level ones paged by id
+        db.Index('ix_comments_post_parent_id', 'post_id', 'parent_id', 'id'),
+        db.Index('ix_comments_post_path', 'post_id', 'path'),
+    )
+
+    post = db.relationship('Post', backref=db.backref('comments', lazy='write_only', cascade='all, delete-orphan', passive_deletes=True))
+    author = db.relationship('User', backref=db.backref('comments', lazy='write_only', passive_deletes=True))
+    replies = db.relationship('Comment', backref=db.backref('parent', remote_side=[id]), lazy='write_only', passive_deletes=True)
 
     def __repr__(self):
         return f'<Comment {self.id}>'
 
 
+COMMENT_PATH_WIDTH = 10
+
+
+def comment_path_segment(comment_id: int) -> str:
+    return str(comment_id).zfill(COMMENT_PATH_WIDTH)
+
+
+def comment_subtree_range(path: str):
+    """``(low, high)`` bounds of ``path`` and all its descendants ('/' sorts right after '.')."""
+    return path, path + '/'
+
+
+@db.event.listens_for(Comment, 'after_insert')
+def _set_comment_path(mapper, connection, target):
+    depth, path = 0, comment_path_segment(target.id)
+    if target.parent_id:
+        parent = connection.execute(
+            db.select(Comment.depth, Comment.path).where(Comment.id == target.parent_id)
+        ).first()
+        if parent is not None and parent.path:
+            depth, path = parent.depth + 1, f'{parent.path}.{path}'
+    connection.execute(db.update(Comment).where(Comment.id == target.id).values(depth=depth, path=path))
+    set_committed_value(target, 'depth', depth)
+    set_committed_value(target, 'path', path)
+
+
 class CommentReaction(db.Model):
     __tablename__ = 'comment_reactions'
 
@@ -353,8 +504,8 @@ class CommentReaction(db.Model):
     emoji = db.Column(db.String(10), nullable=False)
     created_at = db.Column(db.DateTime, server_default=db.func.now())
 
-    comment = db.relationship('Comment', backref=db.backref('reactions', lazy='dynamic', cascade='all, delete-orphan'))
-    user = db.relationship('User', backref=db.backref('comment_reactions', lazy='dynamic'))
+    comment = db.relationship('Comment', backref=db.backref('reactions', lazy='write_only', cascade='all, delete-orphan', passive_deletes=True))
+    user = db.relationship('User', backref=db.backref('comment_reactions', lazy='write_only', passive_deletes=True))
 
     __table_args__ = (db.UniqueConstraint('comment_id', 'user_id', name='unique_user_comment_reaction'),)
 
@@ -362,6 +513,18 @@ class CommentReaction(db.Model):
         return f'<CommentReaction {self.emoji}>'
 
 
+class CommentReactionCount(db.Model):
+    """Per-emoji reaction total of a comment, maintained by counters.py."""
+    __tablename__ = 'comment_reaction_counts'
+
+    comment_id = db.Column(db.Integer, db.ForeignKey('comments.id'), primary_key=True)
+    emoji = db.Column(db.String(10), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<CommentReactionCount {self.comment_id} {self.emoji}={self.count}>'
+
+
 class Notification(db.Model):
     __tablename__ = 'notifications'
 
@@ -380,14 +543,42 @@ class Notification(db.Model):
     
     created_at = db.Column(db.DateTime, server_default=db.func.now())
 
-    user = db.relationship('User', foreign_keys=[user_id], backref=db.backref('notifications', lazy='dynamic', cascade='all, delete-orphan'))
+    user = db.relationship('User', foreign_keys=[user_id], backref=db.backref('notifications', lazy='write_only', cascade='all, delete-orphan', passive_deletes=True))
     actor = db.relationship('User', foreign_keys=[actor_id])
-    post = db.relationship('Post', backref=db.backref('notifications', lazy='dynamic'))
+    post = db.relationship('Post', backref=db.backref('notifications', lazy='write_only', passive_deletes=True))
 
     def __repr__(self):
         return f'<Notification {self.id} type={self.type}>'
 
 
+class NotificationOutbox(db.Model):
+    """Pending push delivery of a notification, committed with it (see notification_outbox.py)."""
+    __tablename__ = 'notification_outbox'
+
+    id = db.Column(db.Integer, primary_key=True)
+    notification_id = db.Column(db.Integer, db.ForeignKey('notifications.id', ondelete='CASCADE'), nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, sent, skipped, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    # Dispatcher that currently delivers the row; claims expire so other processes take over
+    claim_token = db.Column(db.String(32), nullable=True)
+    claimed_until = db.Column(db.DateTime, nullable=True)
+    retry_endpoints = db.Column(db.Text, nullable=True)  # JSON list; None means all subscriptions
+    last_error = db.Column(db.String(300), nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    delivered_at = db.Column(db.DateTime, nullable=True)
+
+    notification = db.relationship('Notification', backref=db.backref('outbox_entries', lazy='write_only', cascade='all, delete-orphan', passive_deletes=True))
+
+    __table_args__ = (
+        db.Index('ix_notification_outbox_due', 'status', 'next_attempt_at'),
+    )
+
+    def __repr__(self):
+        return f'<NotificationOutbox {self.id} status={self.status}>'
+
+
 class PushSubscription(db.Model):
     __tablename__ = 'push_subscriptions'
 
@@ -399,7 +590,7 @@ class PushSubscription(db.Model):
     created_at = db.Column(db.DateTime, server_default=db.func.now())
     updated_at = db.Column(db.DateTime, server_default=db.func.now(), onupdate=db.func.now())
 
-    user = db.relationship('User', backref=db.backref('push_subscriptions', lazy='dynamic', cascade='all, delete-orphan'))
+    user = db.relationship('User', backref=db.backref('push_subscriptions', lazy='write_only', cascade='all, delete-orphan', passive_deletes=True))
 
     def __repr__(self):
         return f'<PushSubscription {self.endpoint[:20]}...>'
@@ -413,8 +604,8 @@ class Follow(db.Model):
     followed_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     created_at = db.Column(db.DateTime, server_default=db.func.now())
 
-    follower = db.relationship('User', foreign_keys=[follower_id], backref=db.backref('following', lazy='dynamic'))
-    followed = db.relationship('User', foreign_keys=[followed_id], backref=db.backref('followers', lazy='dynamic'))
+    follower = db.relationship('User', foreign_keys=[follower_id], backref=db.backref('following', lazy='write_only', passive_deletes=True))
+    followed = db.relationship('User', foreign_keys=[followed_id], backref=db.backref('followers', lazy='write_only', passive_deletes=True))
 
     __table_args__ = (db.UniqueConstraint('follower_id', 'followed_id', name='unique_follow'),)
 
@@ -433,7 +624,7 @@ class Poll(db.Model):
     created_at = db.Column(db.DateTime, server_default=db.func.now())
 
     post = db.relationship('Post', backref=db.backref('poll', uselist=False, cascade='all, delete-orphan'))
-    options = db.relationship('PollOption', backref='poll', lazy='dynamic', cascade='all, delete-orphan')
+    options = db.relationship('PollOption', backref='poll', lazy='selectin', cascade='all, delete-orphan', order_by='PollOption.order')
 
     def __repr__(self):
         return f'<Poll {self.id}>'
@@ -446,8 +637,9 @@ class PollOption(db.Model):
     poll_id = db.Column(db.Integer, db.ForeignKey('polls.id'), nullable=False)
     text = db.Column(db.String(200), nullable=False)
     order = db.Column(db.Integer, default=0)
+    vote_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # see counters.py
 
-    votes = db.relationship('PollVote', backref='option', lazy='dynamic', cascade='all, delete-orphan')
+    votes = db.relationship('PollVote', backref='option', lazy='write_only', cascade='all, delete-orphan', passive_deletes=True)
 
     def __repr__(self):
         return f'<PollOption {self.text}>'
@@ -462,7 +654,7 @@ class PollVote(db.Model):
     session_id = db.Column(db.String(100), nullable=True)  # For anonymous votes
     created_at = db.Column(db.DateTime, server_default=db.func.now())
 
-    user = db.relationship('User', backref=db.backref('poll_votes', lazy='dynamic'))
+    user = db.relationship('User', backref=db.backref('poll_votes', lazy='write_only', passive_deletes=True))
 
     def __repr__(self):
         return f'<PollVote option={self.option_id}>'
@@ -479,7 +671,7 @@ class PostVersion(db.Model):
     edited_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     created_at = db.Column(db.DateTime, server_default=db.func.now())
 
-    post = db.relationship('Post', backref=db.backref('versions', lazy='dynamic', cascade='all, delete-orphan'))
+    post = db.relationship('Post', backref=db.backref('versions', lazy='write_only', cascade='all, delete-orphan', passive_deletes=True))
     editor = db.relationship('User')
 
     def __repr__(self):
@@ -501,9 +693,9 @@ class Group(db.Model):
     is_private = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, server_default=db.func.now())
 
-    creator = db.relationship('User', backref=db.backref('created_groups', lazy='dynamic'))
-    posts = db.relationship('Post', backref='group', lazy='dynamic')
-    members = db.relationship('GroupMembership', backref='group', lazy='dynamic', cascade='all, delete-orphan')
+    creator = db.relationship('User', backref=db.backref('created_groups', lazy='write_only', passive_deletes=True))
+    posts = db.relationship('Post', backref='group', lazy='write_only', passive_deletes=True)
+    members = db.relationship('GroupMembership', backref='group', lazy='write_only', cascade='all, delete-orphan', passive_deletes=True)
 
     def __repr__(self):
         return f'<Group {self.name}>'
@@ -518,7 +710,7 @@ class GroupMembership(db.Model):
     role = db.Column(db.String(20), default='member')  # admin, member
     joined_at = db.Column(db.DateTime, server_default=db.func.now())
 
-    user = db.relationship('User', backref=db.backref('group_memberships', lazy='dynamic'))
+    user = db.relationship('User', backref=db.backref('group_memberships', lazy='write_only', passive_deletes=True))
 
     __table_args__ = (db.UniqueConstraint('group_id', 'user_id', name='unique_group_member'),)
 
@@ -540,8 +732,8 @@ class GroupFile(db.Model):
     description = db.Column(db.Text, nullable=True)
     created_at = db.Column(db.DateTime, server_default=db.func.now())
 
-    group = db.relationship('Group', backref=db.backref('files', lazy='dynamic', cascade='all, delete-orphan'))
-    uploader = db.relationship('User', backref=db.backref('group_files', lazy='dynamic'))
+    group = db.relationship('Group', backref=db.backref('files', lazy='write_only', cascade='all, delete-orphan', passive_deletes=True))
+    uploader = db.relationship('User', backref=db.backref('group_files', lazy='write_only', passive_deletes=True))
 
     def __repr__(self):
         return f'<GroupFile {self.original_filename}>'
@@ -580,8 +772,8 @@ class GroupAnnouncement(db.Model):
     created_at = db.Column(db.DateTime, server_default=db.func.now())
     updated_at = db.Column(db.DateTime, server_default=db.func.now(), onupdate=db.func.now())
 
-    group = db.relationship('Group', backref=db.backref('announcements', lazy='dynamic', cascade='all, delete-orphan'))
-    author = db.relationship('User', backref=db.backref('group_announcements', lazy='dynamic'))
+    group = db.relationship('Group', backref=db.backref('announcements', lazy='write_only', cascade='all, delete-orphan', passive_deletes=True))
+    author = db.relationship('User', backref=db.backref('group_announcements', lazy='write_only', passive_deletes=True))
 
     def __repr__(self):
         return f'<GroupAnnouncement {self.id}>'
@@ -0,0 +1,319 @@
+"""Push delivery of notifications through a transactional outbox.
+
+``social.create_notification`` adds the notification and a
+``NotificationOutbox`` row to the caller's transaction, so a push is queued
+exactly when the action behind it is committed and the request never waits
+for a push service. A dispatcher in every web process
+(``NOTIFICATION_DISPATCH_MODE=embedded``) or ``flask chronicle
+notification-dispatcher`` claims due rows in batches and sends one push per
+recipient and batch (the newest notification with the unread count, which
+is what the service worker shows anyway) through ``push.PushSender``,
+concurrently and over kept-alive connections. Expired subscriptions are
+deleted in one statement per batch. Endpoints that fail are retried
+with exponential backoff; the time from commit to delivery is recorded.
+Claims expire, so rows of a process that died are taken over by another.
+"""
+import json
+import threading
+import uuid
+from collections import deque
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import DateTime, event, insert, literal, or_, select
+from sqlalchemy.orm import Session
+
+from extensions import db
+from executor import spawn
+from models import Notification, NotificationOutbox, PushSubscription
+from push import FAILED, GONE, RETRY, SENT, encode_payload, push_configured, push_sender, subscription_info
+
+MAX_ATTEMPTS = 6
+RETRY_BASE_SECONDS = 30
+RETRY_MAX_SECONDS = 3600
+CLAIM_SECONDS = 120
+RETENTION = timedelta(days=7)
+PURGE_INTERVAL = timedelta(hours=1)
+LATENCY_SAMPLES = 1000
+
+_SESSION_FLAG = 'notification_outbox_pending'
+
+_wakeup = threading.Event()
+_started = False
+_start_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_stats = {'batches': 0, 'delivered': 0, 'pushes': 0, 'retried': 0, 'failed': 0, 'skipped': 0, 'gone_subscriptions': 0}
+_latencies = deque(maxlen=LATENCY_SAMPLES)
+
+
+def enqueue_push(notification: Notification) -> None:
+    """Queue a push for ``notification`` in the current transaction (no-op without VAPID keys)."""
+    if not push_configured():
+        return
+    db.session.add(NotificationOutbox(notification=notification, user_id=notification.user_id))
+    db.session.info[_SESSION_FLAG] = True
+
+
+def enqueue_pushes(*criteria) -> int:
+    """Queue pushes for all notifications matching ``criteria`` with one INSERT ... SELECT."""
+    if not push_configured():
+        return 0
+    now = datetime.utcnow()
+    queued = db.session.execute(
+        insert(NotificationOutbox).from_select(
+            ['notification_id', 'user_id', 'status', 'attempts', 'next_attempt_at', 'created_at'],
+            select(
+                Notification.id, Notification.user_id, literal('pending'), literal(0),
+                literal(now, DateTime), literal(now, DateTime),
+            ).where(*criteria),
+        )
+    ).rowcount
+    if queued:
+        db.session.info[_SESSION_FLAG] = True
+    return queued
+
+
+@event.listens_for(Session, 'after_commit')
+def _wake_after_commit(session):
+    if session.info.pop(_SESSION_FLAG, False):
+        _wakeup.set()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_after_rollback(session):
+    session.info.pop(_SESSION_FLAG, None)
+
+
+def outbox_stats() -> dict:
+    """Delivery counters and latency percentiles (ms) of this process since it started."""
+    with _stats_lock:
+        stats = dict(_stats)
+        latencies = sorted(_latencies)
+    if latencies:
+        stats['latency_p50_ms'] = latencies[len(latencies) // 2]
+        stats['latency_p95_ms'] = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    else:
+        stats['latency_p50_ms'] = stats['latency_p95_ms'] = None
+    return stats
+
+
+def _count(**increments) -> None:
+    with _stats_lock:
+        for key, value in increments.items():
+            _stats[key] += value
+
+
+def _backoff(attempts: int) -> timedelta:
+    return timedelta(seconds=min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2 ** (attempts - 1)))
+
+
+def _claim(batch_size: int) -> list[NotificationOutbox]:
+    now = datetime.utcnow()
+    claimable = (
+        NotificationOutbox.status == 'pending',
+        NotificationOutbox.next_attempt_at <= now,
+        or_(NotificationOutbox.claimed_until.is_(None), NotificationOutbox.claimed_until < now),
+    )
+    due_ids = [row[0] for row in db.session.query(NotificationOutbox.id).filter(*claimable)
+               .order_by(NotificationOutbox.id.asc()).limit(batch_size).all()]
+    if not due_ids:
+        return []
+    token = uuid.uuid4().hex
+    # Conditional update: rows another dispatcher claimed in the meantime are skipped
+    NotificationOutbox.query.filter(NotificationOutbox.id.in_(due_ids), *claimable).update(
+        {NotificationOutbox.claim_token: token, NotificationOutbox.claimed_until: now + timedelta(seconds=CLAIM_SECONDS)},
+        synchronize_session=False,
+    )
+    db.session.commit()
+    return NotificationOutbox.query.filter_by(claim_token=token).order_by(NotificationOutbox.id.asc()).all()
+
+
+def _finish(row: NotificationOutbox, status: str, now: datetime, error: str | None = None) -> None:
+    row.status = status
+    row.claim_token = None
+    row.claimed_until = None
+    row.last_error = error
+    if status == 'sent':
+        row.delivered_at = now
+        row.retry_endpoints = None
+        with _stats_lock:
+            _latencies.append(int((now - row.created_at).total_seconds() * 1000))
+
+
+def _retry(row: NotificationOutbox, endpoints: list[str], now: datetime, error: str | None) -> None:
+    row.attempts += 1
+    if row.attempts >= MAX_ATTEMPTS:
+        _finish(row, 'failed', now, error)
+        _count(failed=1)
+        return
+    row.retry_endpoints = json.dumps(endpoints)
+    row.next_attempt_at = now + _backoff(row.attempts)
+    row.claim_token = None
+    row.claimed_until = None
+    row.last_error = error
+    _count(retried=1)
+
+
+def dispatch_due(batch_size: int | None = None) -> int:
+    """Deliver one batch of due outbox rows; returns the number of rows handled."""
+    if batch_size is None:
+        batch_size = current_app.config.get('NOTIFICATION_DISPATCH_BATCH_SIZE', 100)
+    rows = _claim(batch_size)
+    if not rows:
+        return 0
+
+    notifications = {n.id: n for n in Notification.query.filter(
+        Notification.id.in_({row.notification_id for row in rows})
+    ).all()}
+    user_ids = {row.user_id for row in rows}
+    subscriptions = {}
+    for sub in PushSubscription.query.filter(PushSubscription.user_id.in_(user_ids)).all():
+        subscriptions.setdefault(sub.user_id, []).append(sub)
+    unread = dict(db.session.query(Notification.user_id, db.func.count(Notification.id)).filter(
+        Notification.user_id.in_(user_ids), Notification.is_read.is_(False)
+    ).group_by(Notification.user_id).all())
+
+    now = datetime.utcnow()
+    by_user = {}
+    for row in rows:
+        if row.notification_id not in notifications or not subscriptions.get(row.user_id):
+            # Deleted notification or nobody to push to
+            _finish(row, 'skipped', now)
+            _count(skipped=1)
+            continue
+        by_user.setdefault(row.user_id, []).append(row)
+
+    sender = push_sender()
+    groups = list(by_user.items())
+    gone_ids = set()
+    # Recipients are sent in chunks of the sender's concurrency; stop early
+    # rather than let the claim expire while still sending
+    deadline = now + timedelta(seconds=CLAIM_SECONDS - 2 * sender.timeout)
+    for start in range(0, len(groups), sender.concurrency):
+        chunk = groups[start:start + sender.concurrency]
+        if datetime.utcnow() > deadline:
+            for _user_id, user_rows in groups[start:]:
+                for row in user_rows:
+                    row.claim_token = None
+                    row.claimed_until = None
+            break
+
+        messages = []
+        for user_id, user_rows in chunk:
+            newest = notifications[max(row.notification_id for row in user_rows)]
+            data = encode_payload({
+                'title': newest.title,
+                'message': newest.message,
+                'type': newest.type,
+                'link': newest.link,
+                'unread_count': unread.get(user_id, 0),
+            })
+            # Retries only go to the endpoints that failed before, unless a new row wants all of them
+            targets = None
+            for row in user_rows:
+                if row.retry_endpoints is None:
+                    targets = None
+                    break
+                targets = (targets or set()) | set(json.loads(row.retry_endpoints))
+            messages.extend(
+                (user_id, sub, data) for sub in subscriptions[user_id]
+                if targets is None or sub.endpoint in targets
+            )
+        outcomes = sender.send_many([(subscription_info(sub), data) for _user_id, sub, data in messages])
+        _count(pushes=len(messages))
+
+        results = {user_id: {'failed_endpoints': [], 'errors': [], 'rejected': False, 'sent': False}
+                   for user_id, _user_rows in chunk}
+        for (user_id, sub, _data), (outcome, error) in zip(messages, outcomes):
+            result = results[user_id]
+            if outcome == SENT:
+                result['sent'] = True
+            elif outcome == GONE:
+                gone_ids.add(sub.id)
+            elif outcome == RETRY:
+                result['failed_endpoints'].append(sub.endpoint)
+                result['errors'].append(error)
+            elif outcome == FAILED:
+                result['rejected'] = True
+                result['errors'].append(error)
+
+        now = datetime.utcnow()
+        for user_id, user_rows in chunk:
+            result = results[user_id]
+            for row in user_rows:
+                if result['failed_endpoints']:
+                    _retry(row, result['failed_endpoints'], now, result['errors'][0])
+                elif result['rejected']:
+                    _finish(row, 'failed', now, result['errors'][0])
+                    _count(failed=1)
+                elif result['sent']:
+                    _finish(row, 'sent', now)
+                    _count(delivered=1)
+                else:
+                    # All subscriptions were gone
+                    _finish(row, 'skipped', now)
+                    _count(skipped=1)
+
+    if gone_ids:
+        PushSubscription.query.filter(PushSubscription.id.in_(gone_ids)).delete(synchronize_session=False)
+        _count(gone_subscriptions=len(gone_ids))
+    db.session.commit()
+    _count(batches=1)
+    return len(rows)
+
+
+def purge_finished(older_than: timedelta = RETENTION) -> int:
+    """Delete delivered, skipped and failed rows older than ``older_than``."""
+    deleted = NotificationOutbox.query.filter(
+        NotificationOutbox.status != 'pending',
+        NotificationOutbox.created_at < datetime.utcnow() - older_than,
+    ).delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
+
+
+def run_dispatcher(app, stop_event: threading.Event | None = None) -> None:
+    """Deliver due rows until ``stop_event`` is set.
+
+    Wakes up right after a commit that queued a push in this process and
+    otherwise polls every ``NOTIFICATION_DISPATCH_POLL_SECONDS`` for retries
+    and for rows committed by other processes.
+    """
+    stop_event = stop_event or threading.Event()
+    poll = float(app.config.get('NOTIFICATION_DISPATCH_POLL_SECONDS', 5))
+    batch_size = app.config.get('NOTIFICATION_DISPATCH_BATCH_SIZE', 100)
+    last_purge = None
+    while not stop_event.is_set():
+        _wakeup.clear()
+        try:
+            with app.app_context():
+                while dispatch_due(batch_size) >= batch_size and not stop_event.is_set():
+                    pass
+                if last_purge is None or datetime.utcnow() - last_purge > PURGE_INTERVAL:
+                    purge_finished()
+                    last_purge = datetime.utcnow()
+                db.session.remove()
+        except Exception:
+            app.logger.exception('Notification dispatch failed')
+        _wakeup.wait(poll)
+
+
+def start_dispatcher(app) -> bool:
+    """Start the embedded dispatcher once per process (green thread under eventlet)."""
+    global _started
+    if app.config.get('NOTIFICATION_DISPATCH_MODE') != 'embedded' or app.config.get('TESTING'):
+        return False
+    with _start_lock:
+        if _started:
+            return False
+        _started = True
+    spawn(run_dispatcher, app, name='chronicle-notification-dispatcher')
+    return True
+
+
+def init_dispatcher(app) -> None:
+    """Start the embedded dispatcher lazily with the first request (not for CLI commands)."""
+    @app.before_request
+    def _ensure_dispatcher_started():
+        if not _started:
+            start_dispatcher(app)
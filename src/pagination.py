@@ -0,0 +1,72 @@
+"""Keyset (cursor) pagination for post timelines.
+
+Timelines are ordered by ``(sort key DESC, id DESC)``. A cursor is the
+opaque, URL-safe encoding of the last row's ``(sort key, id)``; the next page
+continues strictly after it, so pages stay stable when new posts arrive
+mid-scroll and deep pages cost the same as the first one. ``has_more`` is
+derived from fetching one extra row instead of a ``count()``.
+"""
+import base64
+import json
+from datetime import datetime
+
+from extensions import db
+from models import Post
+
+POSTS_PER_PAGE = 10
+
+
+def encode_cursor(sort_value: datetime | None, post_id: int) -> str:
+    raw = json.dumps([sort_value.isoformat() if sort_value else None, post_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str | None):
+    """Return ``(sort_value, post_id)`` or None for a missing/invalid cursor."""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        sort_raw, post_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+        sort_value = datetime.fromisoformat(sort_raw) if sort_raw else None
+        return sort_value, int(post_id)
+    except (ValueError, TypeError, json.JSONDecodeError):
+        return None
+
+
+def paginate_posts(posts_query, cursor=None, page=None, per_page=POSTS_PER_PAGE,
+                   sort_expr=None, sort_value_of=None):
+    """Fetch one timeline page.
+
+    ``cursor`` takes precedence; ``page`` (1-based) is still honoured for
+    clients that have not switched to cursors yet. ``posts_query`` must not
+    be ordered yet. Returns ``(posts, has_more, next_cursor)``.
+    """
+    if sort_expr is None:
+        sort_expr, sort_value_of = Post.effective_at, (lambda p: p.effective_at)
+
+    position = decode_cursor(cursor)
+    if position is not None:
+        sort_value, last_id = position
+        if sort_value is None:
+            posts_query = posts_query.filter(Post.id < last_id)
+        else:
+            posts_query = posts_query.filter(
+                db.or_(
+                    sort_expr < sort_value,
+                    db.and_(sort_expr == sort_value, Post.id < last_id)
+                )
+            )
+
+    posts_query = posts_query.order_by(sort_expr.desc(), Post.id.desc())
+    if position is None and page and page > 1:
+        posts_query = posts_query.offset((page - 1) * per_page)
+
+    rows = posts_query.limit(per_page + 1).all()
+    has_more = len(rows) > per_page
+    posts = rows[:per_page]
+    next_cursor = None
+    if has_more and posts:
+        last = posts[-1]
+        next_cursor = encode_cursor(sort_value_of(last), last.id)
+    return posts, has_more, next_cursor
@@ -1,49 +1,181 @@
+"""Web push delivery for the notification outbox (notification_outbox.py).
+
+All pushes of a process go through one ``PushSender``:
+
+- one ``requests.Session`` per push service origin (FCM, Mozilla, Apple, ...),
+  so connections and TLS sessions are kept alive between messages
+- the VAPID key is parsed once and the signed ``Authorization`` header of
+  each push service (the JWT audience) is reused until an hour before it
+  expires, instead of signing a JWT per message
+- ``send_many`` sends with at most ``PUSH_CONCURRENCY`` requests in flight
+
+Only the payload encryption remains per message, it is bound to the
+subscription's keys. ``push_stats`` reports counters of the process.
+"""
 import json
+import threading
+import time
 from typing import Any
+from urllib.parse import urlsplit
 
+import requests
 from flask import current_app
-from pywebpush import webpush, WebPushException
+from py_vapid import Vapid
+from pywebpush import WebPusher, WebPushException
+
+from executor import map_concurrent
+
+# Seconds per push service request
+PUSH_TIMEOUT = 10
+DEFAULT_PUSH_CONCURRENCY = 16
+# Lifetime of a signed VAPID token and how long before expiry it is replaced
+VAPID_TOKEN_LIFETIME = 12 * 3600
+VAPID_REFRESH_MARGIN = 3600
+MAX_SESSIONS = 64
+
+# Outcomes of PushSender.send
+SENT = 'sent'
+GONE = 'gone'  # subscription expired or revoked, delete it
+RETRY = 'retry'  # network errors, 429 and 5xx
+FAILED = 'failed'  # rejected by the push service, retrying will not help
+
+
+def push_configured() -> bool:
+    return bool(current_app.config.get("VAPID_PRIVATE_KEY") and current_app.config.get("VAPID_PUBLIC_KEY"))
+
+
+def encode_payload(payload: dict[str, Any]) -> str:
+    return json.dumps(payload)
+
+
+def subscription_info(subscription) -> dict:
+    """The ``PushSubscription`` in the shape pywebpush expects (plain data, safe to hand to threads)."""
+    return {
+        "endpoint": subscription.endpoint,
+        "keys": {
+            "p256dh": subscription.p256dh,
+            "auth": subscription.auth,
+        },
+    }
 
-from extensions import db
-from models import PushSubscription
 
+def _origin(endpoint: str) -> str:
+    parts = urlsplit(endpoint)
+    return f"{parts.scheme}://{parts.netloc}"
 
-def _get_vapid_claims() -> dict[str, str]:
-    subject = current_app.config.get("VAPID_SUBJECT") or "mailto:admin@example.com"
-    return {"sub": subject}
 
+def _outcome(status: int | None, error: str | None) -> tuple[str, str | None]:
+    if status is not None and status <= 202:
+        return SENT, None
+    if status in (404, 410):
+        return GONE, f"HTTP {status}"
+    if status and 400 <= status < 500 and status != 429:
+        return FAILED, f"HTTP {status}"
+    return RETRY, f"HTTP {status}" if status else error
 
-def send_push_notification(user_id: int, payload: dict[str, Any]) -> None:
-    """Send a push notification payload to all subscriptions of a user."""
-    vapid_private = current_app.config.get("VAPID_PRIVATE_KEY")
-    vapid_public = current_app.config.get("VAPID_PUBLIC_KEY")
-    if not vapid_private or not vapid_public:
-        return
 
-    subscriptions = PushSubscription.query.filter_by(user_id=user_id).all()
-    if not subscriptions:
-        return
+class PushSender:
+    def __init__(self, private_key: str, subject: str, concurrency: int = DEFAULT_PUSH_CONCURRENCY,
+                 timeout: float = PUSH_TIMEOUT):
+        self.private_key = private_key
+        self.subject = subject
+        self.concurrency = max(1, concurrency)
+        self.timeout = timeout
+        self._vapid = Vapid.from_string(private_key=private_key)
+        self._headers = {}  # audience -> (headers, valid until)
+        self._sessions = {}  # origin -> requests.Session
+        self._lock = threading.Lock()
+        self._sign_lock = threading.Lock()
+        self._stats = {'sent': 0, 'gone': 0, 'failed': 0, 'retry': 0, 'vapid_signatures': 0}
 
-    data = json.dumps(payload)
-    for sub in subscriptions:
-        subscription_info = {
-            "endpoint": sub.endpoint,
-            "keys": {
-                "p256dh": sub.p256dh,
-                "auth": sub.auth,
-            },
-        }
+    def _session(self, origin: str) -> requests.Session:
+        with self._lock:
+            session = self._sessions.get(origin)
+            if session is None:
+                if len(self._sessions) >= MAX_SESSIONS:
+                    self._sessions.pop(next(iter(self._sessions))).close()
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=self.concurrency)
+                session.mount(origin, adapter)
+                self._sessions[origin] = session
+            return session
+
+    def vapid_headers(self, audience: str) -> dict:
+        """Signed VAPID headers for ``audience``, cached until shortly before they expire."""
+        with self._sign_lock:  # one signature per audience, even when the first sends run concurrently
+            now = time.time()
+            with self._lock:
+                cached = self._headers.get(audience)
+                if cached and cached[1] > now:
+                    return cached[0]
+            expires = int(now) + VAPID_TOKEN_LIFETIME
+            headers = self._vapid.sign({'sub': self.subject, 'aud': audience, 'exp': expires})
+            with self._lock:
+                self._headers[audience] = (headers, expires - VAPID_REFRESH_MARGIN)
+                self._stats['vapid_signatures'] += 1
+        return headers
+
+    def send(self, info: dict, data: str) -> tuple[str, str | None]:
+        """Send ``data`` to one subscription (``subscription_info``); returns an outcome and an error text."""
+        origin = _origin(info["endpoint"])
+        status, error = None, None
         try:
-            webpush(
-                subscription_info=subscription_info,
-                data=data,
-                vapid_private_key=vapid_private,
-                vapid_claims=_get_vapid_claims(),
+            response = WebPusher(info, requests_session=self._session(origin)).send(
+                data,
+                dict(self.vapid_headers(origin)),
+                ttl=0,
+                content_encoding="aes128gcm",
+                timeout=self.timeout,
             )
+            status = response.status_code
         except WebPushException as exc:  # pragma: no cover - network
             status = getattr(exc.response, "status_code", None)
-            if status in (404, 410):
-                db.session.delete(sub)
-                db.session.commit()
-        except Exception:  # pragma: no cover
-            current_app.logger.exception("Error sending push notification")
+            error = str(exc)[:300]
+        except Exception as exc:  # pragma: no cover
+            error = f"{type(exc).__name__}: {exc}"[:300]
+        outcome, error = _outcome(status, error)
+        with self._lock:
+            self._stats[outcome] += 1
+        return outcome, error
+
+    def send_many(self, messages: list[tuple[dict, str]]) -> list[tuple[str, str | None]]:
+        """Send ``(subscription_info, data)`` pairs concurrently; outcomes in the same order."""
+        return map_concurrent(lambda message: self.send(*message), messages, self.concurrency)
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['sessions'] = len(self._sessions)
+            stats['cached_vapid_audiences'] = len(self._headers)
+        return stats
+
+    def close(self) -> None:
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+
+
+_sender = None
+_sender_lock = threading.Lock()
+
+
+def push_sender() -> PushSender:
+    """The process-wide sender, created from the app config (again if the VAPID key changed)."""
+    global _sender
+    config = current_app.config
+    private_key = config.get("VAPID_PRIVATE_KEY")
+    with _sender_lock:
+        if _sender is None or _sender.private_key != private_key:
+            if _sender is not None:
+                _sender.close()
+            _sender = PushSender(
+                private_key,
+                config.get("VAPID_SUBJECT") or "mailto:admin@example.com",
+                concurrency=config.get("PUSH_CONCURRENCY", DEFAULT_PUSH_CONCURRENCY),
+            )
+        return _sender
+
+
+def push_stats() -> dict:
+    return _sender.stats() if _sender is not None else {}
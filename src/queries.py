@@ -0,0 +1,262 @@
+"""Explicit queries for the write-only relationships in models.py.
+
+Unbounded collections (reactions, comments, votes, group members, ...) are
+``lazy='write_only'``: they are never loaded implicitly and the ORM does not
+cascade deletes into them (``passive_deletes=True``). Counting them and
+removing dependent rows before a parent is deleted goes through here, as
+bulk statements instead of one query per child.
+"""
+from datetime import datetime
+
+from extensions import db
+from models import (
+    Post, Comment, CommentReaction, CommentReactionCount, Reaction, PostReactionCount, Bookmark, PostVersion,
+    Notification, Poll, PollOption, PollVote, GroupMembership, GroupAnnouncement, User, NotificationOutbox,
+    comment_path_segment
+)
+from notification_outbox import enqueue_pushes
+
+
+def count_of(collection) -> int:
+    """COUNT(*) of a write-only collection, e.g. ``count_of(post.comments)``."""
+    return db.session.scalar(
+        db.select(db.func.count()).select_from(collection.select().subquery())
+    ) or 0
+
+
+def group_post_counts(group_ids) -> dict:
+    """Map group id to number of posts, for a list of groups in one query."""
+    if not group_ids:
+        return {}
+    return dict(
+        db.session.query(Post.group_id, db.func.count(Post.id))
+        .filter(Post.group_id.in_(group_ids))
+        .group_by(Post.group_id)
+        .all()
+    )
+
+
+def group_member_counts(group_ids) -> dict:
+    """Map group id to number of members, for a list of groups in one query."""
+    if not group_ids:
+        return {}
+    return dict(
+        db.session.query(GroupMembership.group_id, db.func.count(GroupMembership.id))
+        .filter(GroupMembership.group_id.in_(group_ids))
+        .group_by(GroupMembership.group_id)
+        .all()
+    )
+
+
+def visible_post_ids(posts, user_id) -> set:
+    """Ids of ``posts`` that ``user_id`` (None when anonymous) may see, with one membership query.
+
+    Same rules as ``blog.view_post``: unpublished or future-scheduled posts
+    only for their author, group posts only for group members.
+    """
+    now = datetime.utcnow()
+    group_ids = {p.group_id for p in posts if p.group_id}
+    member_of = set()
+    if group_ids and user_id:
+        member_of = {row[0] for row in db.session.query(GroupMembership.group_id).filter(
+            GroupMembership.user_id == user_id,
+            GroupMembership.group_id.in_(group_ids)
+        )}
+    visible = set()
+    for p in posts:
+        if p.user_id != user_id and (not p.is_published or (p.scheduled_at and p.scheduled_at > now)):
+            continue
+        if p.group_id and p.group_id not in member_of:
+            continue
+        visible.add(p.id)
+    return visible
+
+
+def delete_comment_dependents(comment_ids) -> None:
+    """Remove reactions of the given comments and detach their notifications.
+
+    ``comment_ids`` is a list of ids or a SELECT returning them.
+    """
+    if isinstance(comment_ids, (list, tuple, set)) and not comment_ids:
+        return
+    CommentReaction.query.filter(CommentReaction.comment_id.in_(comment_ids)).delete(synchronize_session=False)
+    CommentReactionCount.query.filter(CommentReactionCount.comment_id.in_(comment_ids)).delete(synchronize_session=False)
+    Notification.query.filter(Notification.comment_id.in_(comment_ids)).update(
+        {Notification.comment_id: None}, synchronize_session=False
+    )
+
+
+def delete_post_dependents(post_ids) -> None:
+    """Remove rows of the write-only post collections before deleting posts.
+
+    Link previews, the poll and its options are regular collections and are
+    still deleted by the ORM cascade together with the post.
+    """
+    if not post_ids:
+        return
+    comment_ids = db.select(Comment.id).where(Comment.post_id.in_(post_ids))
+    delete_comment_dependents(comment_ids)
+    Comment.query.filter(Comment.post_id.in_(post_ids)).delete(synchronize_session=False)
+
+    option_ids = db.select(PollOption.id).join(Poll, Poll.id == PollOption.poll_id).where(Poll.post_id.in_(post_ids))
+    PollVote.query.filter(PollVote.option_id.in_(option_ids)).delete(synchronize_session=False)
+
+    Reaction.query.filter(Reaction.post_id.in_(post_ids)).delete(synchronize_session=False)
+    PostReactionCount.query.filter(PostReactionCount.post_id.in_(post_ids)).delete(synchronize_session=False)
+    Bookmark.query.filter(Bookmark.post_id.in_(post_ids)).delete(synchronize_session=False)
+    PostVersion.query.filter(PostVersion.post_id.in_(post_ids)).delete(synchronize_session=False)
+    Notification.query.filter(Notification.post_id.in_(post_ids)).update(
+        {Notification.post_id: None}, synchronize_session=False
+    )
+
+
+def delete_posts(posts) -> None:
+    """Delete posts together with their dependent rows (caller commits)."""
+    posts = list(posts)
+    delete_post_dependents([post.id for post in posts])
+    for post in posts:
+        db.session.delete(post)
+
+
+def backfill_comment_paths(batch_size: int = 1000) -> int:
+    """Fill ``depth``/``path`` of comments created before those columns existed.
+
+    Works top-down: each batch takes comments whose parent already has a path
+    (or that have no parent), so a thread is completed level by level.
+    Comments whose parent row is gone are treated as top-level.
+    """
+    parent = db.aliased(Comment)
+    filled = 0
+    while True:
+        rows = (
+            db.session.query(Comment.id, parent.id, parent.depth, parent.path)
+            .outerjoin(parent, parent.id == Comment.parent_id)
+            .filter(
+                Comment.path.is_(None),
+                db.or_(Comment.parent_id.is_(None), parent.id.is_(None), parent.path.isnot(None))
+            )
+            .order_by(Comment.id.asc())
+            .limit(batch_size)
+            .all()
+        )
+        if not rows:
+            return filled
+        updates = []
+        for comment_id, parent_id, parent_depth, parent_path in rows:
+            segment = comment_path_segment(comment_id)
+            if parent_id is None:
+                updates.append({'id': comment_id, 'depth': 0, 'path': segment})
+            else:
+                updates.append({'id': comment_id, 'depth': parent_depth + 1, 'path': f'{parent_path}.{segment}'})
+        db.session.execute(db.update(Comment), updates)
+        db.session.commit()
+        filled += len(rows)
+
+
+EFFECTIVE_AT_BATCH_SIZE = 5000
+_FILL_EFFECTIVE_AT = db.text(
+    'UPDATE posts SET effective_at = COALESCE(scheduled_at, published_at, created_at) '
+    'WHERE id > :low AND id <= :high AND effective_at IS NULL'
+)
+
+
+def backfill_effective_at(batch_size: int = EFFECTIVE_AT_BATCH_SIZE, bind=None, batch_block=None) -> int:
+    """Fill ``posts.effective_at`` of rows written before the column existed.
+
+    Works in id ranges, each in its own short transaction, so the table is
+    never locked as a whole. Runs through the session (committing every
+    range) unless the migration passes its connection and
+    ``autocommit_block``.
+    """
+    if bind is None:
+        bind, batch_block = db.session, None
+    max_id = bind.execute(db.select(db.func.max(Post.id))).scalar() or 0
+    filled = 0
+    for low in range(0, max_id, batch_size):
+        params = {'low': low, 'high': low + batch_size}
+        if batch_block is None:
+            filled += bind.execute(_FILL_EFFECTIVE_AT, params).rowcount
+            db.session.commit()
+        else:
+            with batch_block():
+                filled += bind.execute(_FILL_EFFECTIVE_AT, params).rowcount
+    return filled
+
+
+def delete_group_dependents(group_id: int) -> None:
+    """Remove memberships and announcements of a group before deleting it."""
+    GroupMembership.query.filter_by(group_id=group_id).delete(synchronize_session=False)
+    GroupAnnouncement.query.filter_by(group_id=group_id).delete(synchronize_session=False)
+
+
+def add_all_users_to_group(group_id: int, actor_id: int, title: str, link: str) -> tuple[int, datetime]:
+    """Add every active user who is not a member yet, with a ``group_invite`` notification.
+
+    Memberships and notifications are inserted with one INSERT ... SELECT
+    each and their pushes queued in the outbox with a third; the caller
+    commits. All rows share the returned timestamp, which identifies this
+    run (see ``invite_delivery_progress``). Returns the number of new members.
+    """
+    marker = datetime.utcnow()
+    already_member = db.select(GroupMembership.id).where(
+        GroupMembership.group_id == group_id,
+        GroupMembership.user_id == User.id,
+    ).exists()
+    added = db.session.execute(
+        db.insert(GroupMembership).from_select(
+            ['group_id', 'user_id', 'role', 'joined_at'],
+            db.select(db.literal(group_id), User.id, db.literal('member'), db.literal(marker, db.DateTime))
+            .where(User.is_deleted.is_(False), User.is_active.is_(True), ~already_member),
+        )
+    ).rowcount
+    if not added:
+        return 0, marker
+
+    db.session.execute(
+        db.insert(Notification).from_select(
+            ['user_id', 'type', 'title', 'link', 'actor_id', 'is_read', 'created_at'],
+            db.select(
+                GroupMembership.user_id, db.literal('group_invite'), db.literal(title), db.literal(link),
+                db.literal(actor_id), db.literal(False), db.literal(marker, db.DateTime),
+            ).where(
+                GroupMembership.group_id == group_id,
+                GroupMembership.joined_at == marker,
+                GroupMembership.user_id != actor_id,
+            ),
+        )
+    )
+    enqueue_pushes(*_invite_notifications(link, actor_id, marker))
+    return added, marker
+
+
+def _invite_notifications(link: str, actor_id: int, marker: datetime) -> tuple:
+    return (
+        Notification.type == 'group_invite',
+        Notification.link == link,
+        Notification.actor_id == actor_id,
+        Notification.created_at == marker,
+    )
+
+
+def invite_recipients(link: str, actor_id: int, marker: datetime) -> list[int]:
+    """User ids notified by one ``add_all_users_to_group`` run."""
+    return [row[0] for row in db.session.query(Notification.user_id)
+            .filter(*_invite_notifications(link, actor_id, marker)).all()]
+
+
+def invite_delivery_progress(link: str, actor_id: int, marker: datetime) -> dict:
+    """Outbox rows by status for the notifications of one ``add_all_users_to_group`` run."""
+    counts = dict(
+        db.session.query(NotificationOutbox.status, db.func.count(NotificationOutbox.id))
+        .join(Notification, Notification.id == NotificationOutbox.notification_id)
+        .filter(*_invite_notifications(link, actor_id, marker))
+        .group_by(NotificationOutbox.status)
+        .all()
+    )
+    return {
+        'total': sum(counts.values()),
+        'pending': counts.get('pending', 0),
+        'sent': counts.get('sent', 0),
+        'skipped': counts.get('skipped', 0),
+        'failed': counts.get('failed', 0),
+    }
@@ -0,0 +1,108 @@
+"""Cached reaction summaries for posts and comments.
+
+Counts come from the stored per-emoji counters of posts and comments (see
+counters.py). Reactor names are only resolved for the
+owner view, in one join capped at ``REACTOR_NAMES_LIMIT`` names per emoji.
+Both are cached per target through Flask-Caching (when installed) and
+dropped by the toggle endpoints via ``invalidate_post_reactions`` /
+``invalidate_comment_reactions``.
+"""
+from extensions import db, cache
+from models import Reaction, CommentReaction, PostReactionCount, User
+from counters import reaction_counts, comment_reaction_counts
+
+ALLOWED_EMOJIS = ['👍', '❤️', '😂', '😮', '😢', '🎉']
+REACTOR_NAMES_LIMIT = 20
+SUMMARY_CACHE_TIMEOUT = 300
+
+
+def _cached(key, compute):
+    if cache is None:
+        return compute()
+    value = cache.get(key)
+    if value is None:
+        value = compute()
+        cache.set(key, value, timeout=SUMMARY_CACHE_TIMEOUT)
+    return value
+
+
+def _reactor_names(model, target_column, target_ids) -> dict:
+    """Map target id to ``{emoji: names}`` of the most recent reactors (REACTOR_NAMES_LIMIT per emoji)."""
+    rank = db.func.row_number().over(
+        partition_by=(target_column, model.emoji), order_by=model.id.desc()
+    ).label('rank')
+    ranked = (
+        db.select(target_column.label('target_id'), model.emoji, User.display_name, User.username, rank)
+        .join(User, User.id == model.user_id)
+        .where(target_column.in_(target_ids))
+        .subquery()
+    )
+    rows = db.session.execute(
+        db.select(ranked.c.target_id, ranked.c.emoji, ranked.c.display_name, ranked.c.username)
+        .where(ranked.c.rank <= REACTOR_NAMES_LIMIT)
+        .order_by(ranked.c.target_id, ranked.c.emoji, ranked.c.rank)
+    ).all()
+    names = {}
+    for target_id, emoji, display_name, username in rows:
+        names.setdefault(target_id, {}).setdefault(emoji, []).append(display_name or username)
+    return names
+
+
+def _summary(counts: dict, names: dict | None) -> dict:
+    result = {}
+    for emoji in ALLOWED_EMOJIS:
+        count = counts.get(emoji, 0)
+        users = (names or {}).get(emoji, [])
+        result[emoji] = {'count': count, 'users': users, 'more': max(count - len(users), 0) if names is not None else 0}
+    return result
+
+
+def post_reaction_summary(post_id: int, with_names: bool = False) -> dict:
+    """``{emoji: {'count', 'users', 'more'}}`` for a post; names only with ``with_names``."""
+    counts = _cached(f'reactions:post:{post_id}', lambda: reaction_counts(post_id))
+    names = None
+    if with_names and counts:
+        names = _cached(f'reactions:post:{post_id}:names',
+                        lambda: _reactor_names(Reaction, Reaction.post_id, [post_id]).get(post_id, {}))
+    return _summary(counts, names)
+
+
+def comment_reaction_summary(comment_id: int, with_names: bool = False) -> dict:
+    """Same shape as ``post_reaction_summary`` for a comment."""
+    counts = _cached(f'reactions:comment:{comment_id}', lambda: comment_reaction_counts(comment_id))
+    names = None
+    if with_names and counts:
+        names = _cached(f'reactions:comment:{comment_id}:names',
+                        lambda: _reactor_names(CommentReaction, CommentReaction.comment_id, [comment_id]).get(comment_id, {}))
+    return _summary(counts, names)
+
+
+def post_reaction_summaries(post_ids, with_names_for=()) -> dict:
+    """``post_reaction_summary`` for a page of posts in at most two queries (uncached).
+
+    Names are resolved for the posts in ``with_names_for`` only.
+    """
+    counts = {post_id: {} for post_id in post_ids}
+    if post_ids:
+        for post_id, emoji, count in (
+            db.session.query(PostReactionCount.post_id, PostReactionCount.emoji, PostReactionCount.count)
+            .filter(PostReactionCount.post_id.in_(post_ids), PostReactionCount.count > 0)
+            .all()
+        ):
+            counts[post_id][emoji] = count
+    named = [post_id for post_id in with_names_for if counts.get(post_id)]
+    names = _reactor_names(Reaction, Reaction.post_id, named) if named else {}
+    return {
+        post_id: _summary(counts[post_id], names.get(post_id, {}) if post_id in with_names_for else None)
+        for post_id in post_ids
+    }
+
+
+def invalidate_post_reactions(post_id: int) -> None:
+    if cache is not None:
+        cache.delete_many(f'reactions:post:{post_id}', f'reactions:post:{post_id}:names')
+
+
+def invalidate_comment_reactions(comment_id: int) -> None:
+    if cache is not None:
+        cache.delete_many(f'reactions:comment:{comment_id}', f'reactions:comment:{comment_id}:names')
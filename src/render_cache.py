@@ -0,0 +1,224 @@
+"""Persisted, content-hashed cache for rendered Markdown.
+
+Rendered HTML (and TOC) is stored once per source text in the
+``rendered_content`` table, keyed by a hash of the source and
+``RENDERER_VERSION``. A bounded in-process LRU sits in front of the table,
+so unchanged posts, comments and announcements are rendered only once.
+Because the key is derived from the content itself, an edit can never serve
+stale HTML; ``invalidate_rendered`` only keeps the table from accumulating
+entries for text that no longer exists.
+"""
+import hashlib
+import json
+import queue
+import threading
+from collections import OrderedDict
+
+from flask import current_app, has_app_context, has_request_context
+from sqlalchemy.exc import IntegrityError
+
+from content_utils import render_markdown, RENDERER_VERSION
+from extensions import db
+from executor import run_blocking, spawn
+
+DEFAULT_LRU_SIZE = 2048
+WRITE_BATCH_SIZE = 200
+
+
+class _LRU:
+    """Thread-safe bounded mapping with least-recently-used eviction."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+_lru = _LRU(DEFAULT_LRU_SIZE)
+_pending = queue.Queue()
+_writer_lock = threading.Lock()
+_writer_started = False
+
+
+def content_hash(text: str) -> str:
+    """Cache key for a source text under the current renderer version."""
+    digest = hashlib.sha256()
+    digest.update(RENDERER_VERSION.encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(text.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _load(keys: list[str]) -> dict:
+    from models import RenderedContent
+    rows = db.session.query(
+        RenderedContent.content_hash, RenderedContent.html, RenderedContent.toc
+    ).filter(RenderedContent.content_hash.in_(keys)).all()
+    return {row.content_hash: (row.html, json.loads(row.toc) if row.toc else []) for row in rows}
+
+
+def _store(entries: dict) -> None:
+    """Insert rendered entries (``key -> (html, toc)``) on their own connection."""
+    from models import RenderedContent
+    values = [
+        {'content_hash': key, 'html': html, 'toc': json.dumps(toc) if toc else None}
+        for key, (html, toc) in entries.items()
+    ]
+    dialect = db.engine.dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        stmt = insert(RenderedContent).values(values).on_conflict_do_nothing(index_elements=['content_hash'])
+        with db.engine.begin() as conn:
+            conn.execute(stmt)
+        return
+    for row in values:
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(RenderedContent.__table__.insert().values(**row))
+        except IntegrityError:
+            pass
+
+
+def _writer(app) -> None:
+    while True:
+        entries = dict([_pending.get()])
+        while len(entries) < WRITE_BATCH_SIZE:
+            try:
+                key, entry = _pending.get_nowait()
+            except queue.Empty:
+                break
+            entries[key] = entry
+        with app.app_context():
+            try:
+                _store(entries)
+            except Exception:
+                app.logger.exception('Could not persist rendered content')
+
+
+def _persist(entries: dict) -> None:
+    """Persist new renders without holding up the request.
+
+    A request already holds a pooled connection through its session; taking
+    a second one here would let enough concurrent requests drain the pool
+    and wait on each other. Requests therefore hand the entries to a single
+    writer (one connection per process); the CLI and tests write directly.
+    The request session must not be committed from here either, rendering
+    usually happens while a template is being rendered.
+    """
+    app = current_app._get_current_object()
+    if not has_request_context() or app.config.get('TESTING'):
+        try:
+            _store(entries)
+        except Exception:
+            app.logger.exception('Could not persist rendered content')
+        return
+    global _writer_started
+    if not _writer_started:
+        with _writer_lock:
+            if not _writer_started:
+                spawn(_writer, app, name='chronicle-render-cache')
+                _writer_started = True
+    for item in entries.items():
+        _pending.put(item)
+
+
+def _resize_lru() -> None:
+    size = current_app.config.get('RENDER_CACHE_LRU_SIZE', DEFAULT_LRU_SIZE)
+    if size != _lru.maxsize:
+        _lru.maxsize = size
+
+
+def render_many(texts) -> dict:
+    """Render several texts at once, with a single lookup for LRU misses.
+
+    Returns a mapping of source text to ``(html, toc)``.
+    """
+    result = {}
+    missing = {}
+    for text in texts:
+        if not text or text in result:
+            continue
+        key = content_hash(text)
+        cached = _lru.get(key)
+        if cached is not None:
+            result[text] = cached
+        else:
+            missing[key] = text
+
+    if not missing or not has_app_context():
+        for key, text in missing.items():
+            result[text] = run_blocking('markdown', render_markdown, text, with_toc=True)
+        return result
+
+    _resize_lru()
+    stored = _load(list(missing))
+    rendered = {}
+    for key, text in missing.items():
+        entry = stored.get(key)
+        if entry is None:
+            entry = rendered[key] = run_blocking('markdown', render_markdown, text, with_toc=True)
+        _lru.set(key, entry)
+        result[text] = entry
+    if rendered:
+        _persist(rendered)
+    return result
+
+
+def render_markdown_cached(text, with_toc=False):
+    """Drop-in replacement for ``content_utils.render_markdown`` backed by the cache."""
+    if not text:
+        return '' if not with_toc else ('', [])
+    html, toc = render_many([text])[text]
+    if with_toc:
+        return html, toc
+    return html
+
+
+def invalidate_rendered(*texts) -> None:
+    """Forget cached renders of texts that were replaced (edit, version restore)."""
+    from models import RenderedContent
+    keys = [content_hash(t) for t in texts if t]
+    if not keys:
+        return
+    for key in keys:
+        _lru.pop(key)
+    RenderedContent.query.filter(RenderedContent.content_hash.in_(keys)).delete(synchronize_session=False)
+
+
+def prerender_posts(sender, post_ids, **extra) -> None:
+    """Render posts that just went live ahead of the first feed request.
+
+    Connected to ``scheduler.post_published``; the rendered rows are shared
+    with the other processes through the table.
+    """
+    from models import Post
+    render_many([content for content, in db.session.query(Post.content).filter(Post.id.in_(post_ids))])
+
+
+def clear_lru() -> None:
+    _lru.clear()
@@ -0,0 +1,287 @@
+"""Scheduled-post publishing outside of the request path.
+
+A single scheduler per deployment tracks the next due ``Post.scheduled_at`` and
+sleeps until exactly that moment, then publishes every due post in batches.
+Leadership between processes is coordinated with a Postgres advisory lock
+(or an OS file lock next to the SQLite database), so any number of web
+processes and ``flask chronicle scheduler`` workers can run side by side.
+
+The leader usually runs in a different process than the request that
+changed a publish time, so wakeups are published on a Redis channel when
+``SCHEDULER_WAKEUP_URL`` is set. Without it only the in-process scheduler
+is woken; others notice new times after ``SCHEDULER_MAX_SLEEP_SECONDS``.
+"""
+import os
+import threading
+from datetime import datetime
+from functools import lru_cache
+
+from blinker import Namespace
+from flask import current_app
+from sqlalchemy import text
+
+from extensions import db
+from executor import spawn
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+_signals = Namespace()
+
+# Sent with ``post_ids`` after each batch of scheduled posts was published and committed.
+post_published = _signals.signal('post-published')
+
+# Arbitrary but stable key for pg_try_advisory_lock ("CHRNSCHD").
+ADVISORY_LOCK_KEY = 0x4348524E53434844 & 0x7FFFFFFFFFFFFFFF
+
+WAKEUP_CHANNEL = 'chronicle:scheduler-wakeup'
+
+_wakeup = threading.Event()
+_started = False
+_start_lock = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def _redis(url: str):
+    import redis
+    return redis.Redis.from_url(url)
+
+
+def notify_schedule_changed() -> None:
+    """Wake the scheduler, in this or any other process, to re-read the next due time."""
+    _wakeup.set()
+    url = current_app.config.get('SCHEDULER_WAKEUP_URL')
+    if url:
+        try:
+            _redis(url).publish(WAKEUP_CHANNEL, '1')
+        except Exception:
+            current_app.logger.warning('Could not publish scheduler wakeup', exc_info=True)
+
+
+def next_due_at():
+    """Return the earliest pending ``scheduled_at`` or None."""
+    from models import Post
+    return db.session.query(db.func.min(Post.scheduled_at)).filter(
+        Post.scheduled_at.isnot(None)
+    ).scalar()
+
+
+def autopublish_due_posts(batch_size: int | None = None) -> list[int]:
+    """Publish all posts whose scheduled time has passed.
+
+    Works in batches so a burst of due posts never turns into one huge
+    write. Returns the IDs of the posts that were published.
+    """
+    from models import Post
+
+    if batch_size is None:
+        batch_size = current_app.config.get('SCHEDULER_BATCH_SIZE', 100)
+
+    published_ids = []
+    while True:
+        now = datetime.utcnow()
+        due_ids = [row[0] for row in db.session.query(Post.id).filter(
+            Post.scheduled_at.isnot(None),
+            Post.scheduled_at <= now
+        ).order_by(Post.scheduled_at.asc(), Post.id.asc()).limit(batch_size).all()]
+        if not due_ids:
+            break
+
+        Post.query.filter(
+            Post.id.in_(due_ids),
+            Post.scheduled_at.isnot(None)
+        ).update(
+            {
+                Post.is_published: True,
+                Post.published_at: Post.scheduled_at,
+                Post.effective_at: Post.scheduled_at,
+                Post.scheduled_at: None
+            },
+            synchronize_session=False
+        )
+        db.session.commit()
+        published_ids.extend(due_ids)
+        try:
+            post_published.send(current_app._get_current_object(), post_ids=due_ids)
+        except Exception:
+            current_app.logger.exception('post_published receiver failed')
+
+        if len(due_ids) < batch_size:
+            break
+
+    if published_ids:
+        current_app.logger.info('Auto-published %s scheduled posts', len(published_ids))
+    return published_ids
+
+
+class SchedulerLock:
+    """Cross-process leadership lock for the scheduler.
+
+    Uses a session-level Postgres advisory lock held on a dedicated
+    connection. Other dialects (SQLite) fall back to an exclusive file lock
+    in the instance folder, which is sufficient because SQLite deployments
+    are single-host.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._conn = None
+        self._fh = None
+
+    def acquire(self) -> bool:
+        if self.held:
+            return True
+        if db.engine.dialect.name == 'postgresql':
+            conn = db.engine.connect()
+            try:
+                got = conn.execute(text('SELECT pg_try_advisory_lock(:key)'), {'key': ADVISORY_LOCK_KEY}).scalar()
+                conn.commit()
+            except Exception:
+                conn.close()
+                raise
+            if got:
+                self._conn = conn
+                return True
+            conn.close()
+            return False
+
+        if fcntl is None:
+            # No cross-process locking available; assume a single local process.
+            self._fh = True
+            return True
+        lock_path = os.path.join(self.app.instance_path, 'scheduler.lock')
+        os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+        fh = open(lock_path, 'a+')
+        try:
+            fcntl.flock(fh.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            fh.close()
+            return False
+        self._fh = fh
+        return True
+
+    @property
+    def held(self) -> bool:
+        return self._conn is not None or self._fh is not None
+
+    def release(self) -> None:
+        if self._conn is not None:
+            try:
+                self._conn.execute(text('SELECT pg_advisory_unlock(:key)'), {'key': ADVISORY_LOCK_KEY})
+                self._conn.commit()
+            except Exception:
+                pass
+            finally:
+                self._conn.close()
+                self._conn = None
+        if self._fh is not None:
+            if self._fh is not True:
+                try:
+                    fcntl.flock(self._fh.fileno(), fcntl.LOCK_UN)
+                finally:
+                    self._fh.close()
+            self._fh = None
+
+
+def _seconds_until(due, max_sleep: float) -> float:
+    if due is None:
+        return max_sleep
+    delta = (due - datetime.utcnow()).total_seconds()
+    return max(0.0, min(delta, max_sleep))
+
+
+def _subscribe(app):
+    """Subscribe to cross-process wakeups, or return None to rely on the in-process event."""
+    url = app.config.get('SCHEDULER_WAKEUP_URL')
+    if not url:
+        return None
+    try:
+        subscription = _redis(url).pubsub(ignore_subscribe_messages=True)
+        subscription.subscribe(WAKEUP_CHANNEL)
+        return subscription
+    except Exception:
+        app.logger.warning('Scheduler wakeups via Redis unavailable', exc_info=True)
+        return None
+
+
+def _wait_for_wakeup(app, subscription, timeout: float):
+    """Sleep up to ``timeout`` seconds or until the schedule changes.
+
+    Returns the subscription to keep using (None after it failed).
+    """
+    if subscription is not None:
+        try:
+            if subscription.get_message(timeout=timeout) is not None:
+                # One re-read covers every change that arrived meanwhile.
+                while subscription.get_message(timeout=0) is not None:
+                    pass
+            _wakeup.clear()
+            return subscription
+        except Exception:
+            app.logger.warning('Scheduler wakeup subscription lost', exc_info=True)
+            subscription.close()
+            subscription = None
+    _wakeup.wait(timeout)
+    _wakeup.clear()
+    return subscription
+
+
+def run_scheduler(app, stop_event: threading.Event | None = None) -> None:
+    """Run the scheduler loop until ``stop_event`` is set.
+
+    Non-leaders retry the lock every ``SCHEDULER_MAX_SLEEP_SECONDS`` so a
+    standby process takes over when the leader goes away.
+    """
+    stop_event = stop_event or threading.Event()
+    max_sleep = float(app.config.get('SCHEDULER_MAX_SLEEP_SECONDS', 30))
+    lock = SchedulerLock(app)
+    subscription = None
+
+    try:
+        while not stop_event.is_set():
+            if subscription is None:
+                subscription = _subscribe(app)
+            timeout = max_sleep
+            try:
+                with app.app_context():
+                    if lock.acquire():
+                        autopublish_due_posts()
+                        timeout = _seconds_until(next_due_at(), max_sleep)
+                    db.session.remove()
+            except Exception:
+                app.logger.exception('Scheduler iteration failed')
+                lock.release()
+
+            subscription = _wait_for_wakeup(app, subscription, timeout)
+    finally:
+        if subscription is not None:
+            subscription.close()
+        with app.app_context():
+            lock.release()
+
+
+def start_scheduler(app) -> bool:
+    """Start the embedded scheduler once per process (green thread under eventlet)."""
+    global _started
+    if app.config.get('SCHEDULER_MODE') != 'embedded' or app.config.get('TESTING'):
+        return False
+    with _start_lock:
+        if _started:
+            return False
+        _started = True
+    spawn(run_scheduler, app, name='chronicle-scheduler')
+    return True
+
+
+def init_scheduler(app) -> None:
+    """Start the embedded scheduler lazily with the first request.
+
+    Starting on first request (instead of in create_app) keeps CLI commands
+    such as ``flask db upgrade`` from spawning a scheduler.
+    """
+    @app.before_request
+    def _ensure_scheduler_started():
+        if not _started:
+            start_scheduler(app)
@@ -0,0 +1,182 @@
+"""JSON serialization of post timelines.
+
+A page of posts is loaded in a fixed number of queries, independent of how
+many images, tags, link previews or poll options it contains: media, link
+previews, tags and poll options are ``selectin`` collections (see
+models.py), poll vote counts come with the options, and
+``with_post_relations`` adds author, group, page and poll to the timeline
+query.
+
+The ``serialize_*`` helpers build the JSON shapes of the infinite-scroll
+endpoints. Images come with a small variant (``avatar_thumb_url``,
+``thumb_url``) for the gallery and avatar markup built in JavaScript.
+"""
+from datetime import timezone
+
+from flask_babel import gettext as _
+from flask_login import current_user
+from sqlalchemy.orm import selectinload
+
+from models import Post
+from render_cache import render_markdown_cached, render_many
+from image_variants import AVATAR_THUMB_WIDTH, MEDIA_THUMB_WIDTH, media_thumb_path, variant_url
+
+
+def with_post_relations(posts_query, with_polls: bool = True):
+    """Eager-load the to-one relations used when rendering posts."""
+    options = [selectinload(Post.author), selectinload(Post.group), selectinload(Post.page)]
+    if with_polls:
+        options.append(selectinload(Post.poll))
+    return posts_query.options(*options)
+
+
+def _format_dt(dt):
+    from blog import format_datetime_i18n
+    return format_datetime_i18n(dt)
+
+
+def _iso_utc(dt):
+    return dt.replace(tzinfo=timezone.utc).isoformat().replace('+00:00', 'Z') if dt else None
+
+
+def _is_edited(post) -> bool:
+    return bool(post.updated_at and post.created_at and post.updated_at > post.created_at)
+
+
+def link_preview_payload(preview) -> dict:
+    return {
+        'status': preview.status,
+        'embed_type': preview.embed_type,
+        'embed_id': preview.embed_id,
+        'url': preview.url,
+        'title': preview.title,
+        'description': preview.description,
+        'image_url': preview.image_url,
+        'site_name': preview.site_name
+    }
+
+
+def _tag_payload(tag) -> dict:
+    return {'name': tag.name, 'slug': tag.slug, 'color': tag.color}
+
+
+def _author_payload(author) -> dict:
+    if getattr(author, 'is_deleted', False):
+        # Keep stable JSON shape, but do not leak profile-identifying fields into UI.
+        return {
+            'id': author.id,
+            'is_deleted': True,
+            'username': None,
+            'display_name': None,
+            'avatar_url': None,
+            'avatar_thumb_url': None,
+            'theme_color': '#6b7280'
+        }
+    return {
+        'id': author.id,
+        'is_deleted': False,
+        'username': author.username,
+        'display_name': author.display_name,
+        'avatar_url': author.avatar_url,
+        'avatar_thumb_url': variant_url(author.avatar_url, 'avatar', AVATAR_THUMB_WIDTH),
+        'theme_color': author.theme_color or '#4da9a4'
+    }
+
+
+def _poll_payload(poll) -> dict:
+    options = list(poll.options)
+    counts = [opt.vote_count for opt in options]
+    total_votes = sum(counts)
+    return {
+        'id': poll.id,
+        'question': poll.question,
+        'allows_multiple': poll.allows_multiple,
+        'total_votes': total_votes,
+        'options': [{
+            'id': opt.id,
+            'text': opt.text,
+            'votes': votes,
+            'percentage': round((votes / total_votes * 100) if total_votes > 0 else 0, 1)
+        } for opt, votes in zip(options, counts)]
+    }
+
+
+def serialize_feed_posts(posts) -> list[dict]:
+    """Posts for ``/feed/api``."""
+    render_many([post.content for post in posts])
+    posts_data = []
+    for post in posts:
+        group_payload = None
+        if post.group:
+            group_payload = {
+                'id': post.group.id,
+                'slug': post.group.slug,
+                'name': post.group.name,
+                'color': post.group.color or '#6366f1'
+            }
+
+        posts_data.append({
+            'id': post.id,
+            'content': post.content,
+            'content_html': render_markdown_cached(post.content) if post.content else '',
+            'created_at': _format_dt(post.scheduled_at or post.created_at),
+            'updated_at': post.updated_at.isoformat() if post.updated_at else None,
+            'is_edited': _is_edited(post),
+            'is_owner': current_user.is_authenticated and current_user.id == post.user_id,
+            'author': _author_payload(post.author),
+            'media': [{'url': m.file_path, 'thumb_url': media_thumb_path(m, MEDIA_THUMB_WIDTH),
+                       'file_type': m.file_type, 'alt_text': m.alt_text}
+                      for m in post.media_items if m.status == 'ready'],
+            'tags': [_tag_payload(t) for t in post.tags],
+            'poll': _poll_payload(post.poll) if post.poll else None,
+            'group': group_payload,
+            'link_previews': [link_preview_payload(lp) for lp in post.link_previews]
+        })
+    return posts_data
+
+
+def serialize_profile_posts(posts, is_own_profile: bool) -> list[dict]:
+    """Posts for ``/u/<username>/api``."""
+    render_many([post.content for post in posts])
+    return [{
+        'id': post.id,
+        'title': post.title,
+        'content': post.content,
+        'content_html': render_markdown_cached(post.content) if post.content else '',
+        'created_at': _format_dt(post.scheduled_at or post.published_at or post.created_at),
+        'updated_at': post.updated_at.isoformat() if post.updated_at else None,
+        'is_edited': _is_edited(post),
+        'is_owner': is_own_profile,
+        'page_title': post.page.title if post.page else None,
+        'page_slug': post.page.slug if post.page else None,
+        'media': [{'url': m.file_path, 'thumb_url': media_thumb_path(m, MEDIA_THUMB_WIDTH), 'alt_text': m.alt_text}
+                  for m in post.media_items if m.status == 'ready'],
+        'tags': [_tag_payload(t) for t in post.tags]
+    } for post in posts]
+
+
+def serialize_own_posts(posts, now) -> list[dict]:
+    """Posts for ``/api/posts`` (the owner's view, including drafts and scheduled posts)."""
+    render_many([post.content for post in posts])
+    return [{
+        'id': post.id,
+        'title': post.title,
+        'content': render_markdown_cached(post.content) if post.content else '',
+        'created_at': _format_dt(post.scheduled_at or post.published_at or post.created_at),
+        'updated_at': post.updated_at.isoformat() if post.updated_at else None,
+        'scheduled_at': _iso_utc(post.scheduled_at),
+        'published_at': _iso_utc(post.published_at),
+        'is_scheduled_future': bool(post.scheduled_at and post.scheduled_at > now),
+        'is_published': post.is_published,
+        'is_unpublished': not post.is_published,
+        'is_edited': _is_edited(post),
+        'page_title': post.page.title if post.page else None,
+        'page_slug': post.page.slug if post.page else None,
+        'group_name': post.group.name if post.group else None,
+        'group_slug': post.group.slug if post.group else None,
+        'group_color': post.group.color if post.group else None,
+        'media_items': [{'file_path': m.file_path, 'thumb_path': media_thumb_path(m, MEDIA_THUMB_WIDTH),
+                         'alt_text': m.alt_text or _('Image')}
+                        for m in post.media_items if m.status == 'ready'],
+        'link_previews': [link_preview_payload(lp) for lp in post.link_previews]
+    } for post in posts]
@@ -1,10 +1,11 @@
 """Social features: reactions, comments, bookmarks, tags, search, archive."""
 import uuid
 from datetime import datetime, timedelta, timezone
-from flask import Blueprint, request, jsonify, render_template, redirect, url_for, flash, current_app, session
+from flask import Blueprint, request, jsonify, render_template, redirect, url_for, flash, current_app, session, abort
 from flask_login import login_required, current_user
 from flask_babel import gettext as _
-from sqlalchemy import func, extract
+from sqlalchemy import func
+from sqlalchemy.orm import joinedload
 from slugify import slugify
 from extensions import db, limiter
 from models import (
@@ -27,12 +28,34 @@ from models import (
     GroupFile,
     GroupAnnouncement,
     PushSubscription,
+    comment_subtree_range,
+    COMMENT_PATH_WIDTH,
 )
 import os
 import shutil
 from werkzeug.utils import secure_filename
 from content_utils import extract_mentions
-from push import send_push_notification
+from render_cache import invalidate_rendered
+from image_variants import InvalidImage, replace_profile_image, delete_image_files, variant_url, AVATAR_THUMB_WIDTH
+from pagination import encode_cursor, decode_cursor
+from queries import (
+    delete_comment_dependents, delete_post_dependents, delete_group_dependents, group_member_counts, visible_post_ids,
+    add_all_users_to_group, invite_delivery_progress, invite_recipients
+)
+from counters import (
+    adjust_reaction_count, adjust_comment_reaction_count, adjust_comment_count, adjust_bookmark_count,
+    adjust_vote_count
+)
+from reactions import (
+    ALLOWED_EMOJIS, post_reaction_summary, post_reaction_summaries, comment_reaction_summary,
+    invalidate_post_reactions, invalidate_comment_reactions
+)
+from notification_outbox import enqueue_push
+from executor import spawn
+from websocket import (
+    emit_comment_deleted, emit_comment_edited, emit_new_comment, emit_notifications_changed, emit_unread_count,
+    queue_notification, queue_reaction_change, serialize_notification
+)
 
 try:
     from zoneinfo import ZoneInfo
@@ -101,12 +124,7 @@ def _delete_static_file(static_url: str | None):
         rel = static_url.split('/static/', 1)[1]
     if not rel:
         return
-    abs_path = os.path.join(current_app.root_path, 'static', rel)
-    try:
-        if os.path.exists(abs_path):
-            os.remove(abs_path)
-    except Exception:
-        pass
+    delete_image_files(rel)
 
 
 def _delete_group_and_related(group: Group):
@@ -124,21 +142,20 @@ def _delete_group_and_related(group: Group):
         db.session.delete(gf)
 
     try:
-        group_upload_dir = os.path.join(current_app.root_path, 'static', 'uploads', 'groups', str(group.id))
-        if os.path.exists(group_upload_dir):
-            shutil.rmtree(group_upload_dir, ignore_errors=True)
+        for group_upload_dir in (
+            os.path.join(current_app.root_path, 'static', 'uploads', 'groups', str(group.id)),
+            os.path.join(current_app.config['IMAGE_ORIGINALS_FOLDER'], 'uploads', 'groups', str(group.id)),
+        ):
+            if os.path.exists(group_upload_dir):
+                shutil.rmtree(group_upload_dir, ignore_errors=True)
     except Exception:
         pass
 
     group_posts = Post.query.filter_by(group_id=group.id).all()
+    delete_post_dependents([post.id for post in group_posts])
     for post in group_posts:
-        for media in post.media_items.all() if hasattr(post.media_items, 'all') else list(post.media_items):
-            try:
-                media_abs = os.path.join(current_app.root_path, 'static', media.file_path)
-                if os.path.exists(media_abs):
-                    os.remove(media_abs)
-            except Exception:
-                pass
+        for media in list(post.media_items):
+            delete_image_files(media.file_path)
             try:
                 db.session.delete(media)
             except Exception:
@@ -151,36 +168,25 @@ def _delete_group_and_related(group: Group):
 
         db.session.delete(post)
 
+    delete_group_dependents(group.id)
     db.session.delete(group)
     db.session.commit()
 
 
 # ============== Reactions ==============
 
-ALLOWED_EMOJIS = ['👍', '❤️', '😂', '😮', '😢', '🎉']
 
 @social_bp.route('/api/posts/<int:post_id>/reactions', methods=['GET'])
 @exempt_from_limiter
 def get_reactions(post_id):
     """Get reaction counts for a post with user details for owner view."""
     post = Post.query.get_or_404(post_id)
-    
-    # Get all reactions with user info
-    all_reactions = Reaction.query.filter_by(post_id=post_id).all()
-    
-    result = {emoji: {'count': 0, 'users': []} for emoji in ALLOWED_EMOJIS}
-    for reaction in all_reactions:
-        if reaction.emoji in result:
-            result[reaction.emoji]['count'] += 1
-            if reaction.user_id:
-                user = User.query.get(reaction.user_id)
-                if user:
-                    result[reaction.emoji]['users'].append(user.display_name or user.username)
+    is_owner = current_user.is_authenticated and post.user_id == current_user.id
+    result = post_reaction_summary(post_id, with_names=is_owner)
     
     # Check if current user has reacted
     user_reactions = []
-    is_owner = current_user.is_authenticated and post.user_id == current_user.id
-    if current_user.is_authenticated:
+    if current_user.is_authenticated and not is_owner:
         user_reacts = Reaction.query.filter_by(post_id=post_id, user_id=current_user.id).all()
         user_reactions = [r.emoji for r in user_reacts]
     
@@ -190,10 +196,100 @@ def get_reactions(post_id):
         'reactions': result,
         'user_reactions': user_reactions,
         'total': total,
+        'comment_count': post.comment_count,
         'is_owner': is_owner
     })
 
 
+INTERACTIONS_MAX_POSTS = 50
+INTERACTIONS_MAX_COMMENTS = 10
+
+
+def _latest_comment_threads(post_ids, per_post: int) -> dict:
+    """Newest ``per_post`` top-level comments of each post with their replies, in two queries."""
+    rank = db.func.row_number().over(partition_by=Comment.post_id, order_by=Comment.id.desc()).label('rank')
+    ranked = db.select(Comment.id, rank).where(
+        Comment.post_id.in_(post_ids),
+        Comment.parent_id.is_(None),
+        Comment.is_approved == True
+    ).subquery()
+    roots = Comment.query.options(joinedload(Comment.author)).join(
+        ranked, ranked.c.id == Comment.id
+    ).filter(ranked.c.rank <= per_post).order_by(Comment.id.asc()).all()
+    if not roots:
+        return {}
+    root_paths = [root.path for root in roots]
+    replies = Comment.query.options(joinedload(Comment.author)).filter(
+        Comment.post_id.in_(post_ids),
+        Comment.parent_id.isnot(None),
+        Comment.is_approved == True,
+        db.func.substr(Comment.path, 1, COMMENT_PATH_WIDTH).in_(root_paths)
+    ).order_by(Comment.path.asc()).all()
+    threads = {}
+    for root in roots:
+        threads.setdefault(root.post_id, []).append(root)
+    return {post_id: _comment_thread(post_roots, replies) for post_id, post_roots in threads.items()}
+
+
+@social_bp.route('/api/posts/interactions', methods=['GET'])
+@exempt_from_limiter
+def get_post_interactions():
+    """Reactions, bookmark state and comment counts for several posts at once.
+
+    ``ids`` is a comma-separated list (at most INTERACTIONS_MAX_POSTS);
+    ``comments=N`` adds the newest N top-level comments with replies.
+    Posts that do not exist or are not visible are left out.
+    """
+    try:
+        post_ids = list(dict.fromkeys(
+            int(part) for part in (request.args.get('ids') or '').split(',') if part.strip()
+        ))[:INTERACTIONS_MAX_POSTS]
+    except ValueError:
+        return jsonify({'error': 'Ungültige Post-IDs'}), 400
+    comments_per_post = max(0, min(request.args.get('comments', 0, type=int), INTERACTIONS_MAX_COMMENTS))
+
+    if not post_ids:
+        return jsonify({'posts': {}})
+
+    posts = Post.query.filter(Post.id.in_(post_ids)).all()
+    visible = visible_post_ids(posts, current_user.id if current_user.is_authenticated else None)
+    posts = [p for p in posts if p.id in visible]
+    ids = [p.id for p in posts]
+
+    user_id = current_user.id if current_user.is_authenticated else None
+    owned = {p.id for p in posts if p.user_id == user_id}
+    summaries = post_reaction_summaries(ids, with_names_for=owned)
+
+    user_reactions = {}
+    bookmarked = set()
+    if user_id and ids:
+        for post_id, emoji in db.session.query(Reaction.post_id, Reaction.emoji).filter(
+            Reaction.user_id == user_id, Reaction.post_id.in_(ids)
+        ):
+            user_reactions.setdefault(post_id, []).append(emoji)
+        bookmarked = {row[0] for row in db.session.query(Bookmark.post_id).filter(
+            Bookmark.user_id == user_id, Bookmark.post_id.in_(ids)
+        )}
+
+    threads = _latest_comment_threads(ids, comments_per_post) if comments_per_post and ids else {}
+
+    result = {}
+    for p in posts:
+        reactions = summaries[p.id]
+        entry = {
+            'reactions': reactions,
+            'user_reactions': user_reactions.get(p.id, []),
+            'total': sum(info['count'] for info in reactions.values()),
+            'is_owner': p.id in owned,
+            'bookmarked': p.id in bookmarked,
+            'comment_count': p.comment_count
+        }
+        if comments_per_post:
+            entry['comments'] = threads.get(p.id, [])
+        result[str(p.id)] = entry
+    return jsonify({'posts': result})
+
+
 @social_bp.route('/api/posts/<int:post_id>/reactions', methods=['POST'])
 @optional_limit("30 per minute")
 @login_required
@@ -218,12 +314,15 @@ def toggle_reaction(post_id):
     
     if existing:
         db.session.delete(existing)
+        adjust_reaction_count(post_id, emoji, -1)
         db.session.commit()
+        invalidate_post_reactions(post_id)
+        queue_reaction_change(post_id, emoji, -1)
         return jsonify({'action': 'removed', 'emoji': emoji})
     else:
         reaction = Reaction(post_id=post_id, user_id=current_user.id, emoji=emoji)
         db.session.add(reaction)
-        db.session.commit()
+        adjust_reaction_count(post_id, emoji, 1)
         
         # Create notification for post owner
         create_notification(
@@ -234,6 +333,9 @@ def toggle_reaction(post_id):
             actor_id=current_user.id,
             post_id=post_id
         )
+        db.session.commit()
+        invalidate_post_reactions(post_id)
+        queue_reaction_change(post_id, emoji, 1)
         
         return jsonify({'action': 'added', 'emoji': emoji})
 
@@ -243,18 +345,10 @@ def toggle_reaction(post_id):
 @social_bp.route('/api/comments/<int:comment_id>/reactions', methods=['GET'])
 @exempt_from_limiter
 def get_comment_reactions(comment_id):
-    """Get reaction counts for a comment."""
+    """Get reaction counts for a comment (reactor names for the comment author and post owner)."""
     comment = Comment.query.get_or_404(comment_id)
-    all_reactions = CommentReaction.query.filter_by(comment_id=comment_id).all()
-
-    result = {emoji: {'count': 0, 'users': []} for emoji in ALLOWED_EMOJIS}
-    for r in all_reactions:
-        if r.emoji in result:
-            result[r.emoji]['count'] += 1
-            if r.user_id:
-                u = User.query.get(r.user_id)
-                if u:
-                    result[r.emoji]['users'].append(u.display_name or u.username)
+    names_visible = current_user.is_authenticated and current_user.id in (comment.user_id, comment.post.user_id)
+    result = comment_reaction_summary(comment_id, with_names=names_visible)
 
     user_reaction = None
     if current_user.is_authenticated:
@@ -262,7 +356,7 @@ def get_comment_reactions(comment_id):
         user_reaction = existing.emoji if existing else None
 
     total = sum(info['count'] for info in result.values())
-    return jsonify({'reactions': result, 'user_reaction': user_reaction, 'total': total})
+    return jsonify({'reactions': result, 'user_reaction': user_reaction, 'total': total, 'names_visible': names_visible})
 
 
 @social_bp.route('/api/comments/<int:comment_id>/reactions', methods=['POST'])
@@ -282,34 +376,43 @@ def toggle_comment_reaction(comment_id):
     # Same emoji => remove
     if existing and existing.emoji == emoji:
         db.session.delete(existing)
+        adjust_comment_reaction_count(comment_id, emoji, -1)
         db.session.commit()
+        invalidate_comment_reactions(comment_id)
+        queue_reaction_change(comment.post_id, emoji, -1, comment_id=comment_id)
         return jsonify({'action': 'removed', 'emoji': emoji})
 
     # Different emoji => change
     if existing:
+        previous = existing.emoji
         existing.emoji = emoji
+        adjust_comment_reaction_count(comment_id, previous, -1)
+        adjust_comment_reaction_count(comment_id, emoji, 1)
         db.session.commit()
+        invalidate_comment_reactions(comment_id)
+        queue_reaction_change(comment.post_id, previous, -1, comment_id=comment_id)
+        queue_reaction_change(comment.post_id, emoji, 1, comment_id=comment_id)
         return jsonify({'action': 'changed', 'emoji': emoji})
 
     # None => add
     r = CommentReaction(comment_id=comment_id, user_id=current_user.id, emoji=emoji)
     db.session.add(r)
-    db.session.commit()
+    adjust_comment_reaction_count(comment_id, emoji, 1)
 
     # Optional notification for comment author
     if comment.user_id != current_user.id:
-        try:
-            create_notification(
-                user_id=comment.user_id,
-                type='reaction',
-                title=_('{name} reacted with {emoji} to your comment').format(name=(current_user.display_name or current_user.username), emoji=emoji),
-                link=f'/post/{comment.post.public_id}',
-                actor_id=current_user.id,
-                post_id=comment.post_id,
-                comment_id=comment.id
-            )
-        except Exception:
-            pass
+        create_notification(
+            user_id=comment.user_id,
+            type='reaction',
+            title=_('{name} reacted with {emoji} to your comment').format(name=(current_user.display_name or current_user.username), emoji=emoji),
+            link=f'/post/{comment.post.public_id}',
+            actor_id=current_user.id,
+            post_id=comment.post_id,
+            comment_id=comment.id
+        )
+    db.session.commit()
+    invalidate_comment_reactions(comment_id)
+    queue_reaction_change(comment.post_id, emoji, 1, comment_id=comment_id)
 
     return jsonify({'action': 'added', 'emoji': emoji})
 
@@ -335,13 +438,15 @@ def toggle_bookmark(post_id):
     
     if existing:
         db.session.delete(existing)
+        adjust_bookmark_count(post_id, -1)
         db.session.commit()
-        return jsonify({'bookmarked': False})
+        return jsonify({'bookmarked': False, 'count': post.bookmark_count})
     else:
         bookmark = Bookmark(post_id=post_id, user_id=current_user.id)
         db.session.add(bookmark)
+        adjust_bookmark_count(post_id, 1)
         db.session.commit()
-        return jsonify({'bookmarked': True})
+        return jsonify({'bookmarked': True, 'count': post.bookmark_count})
 
 
 @social_bp.route('/me/bookmarks')
@@ -357,41 +462,112 @@ def my_bookmarks():
 
 # ============== Comments ==============
 
+def _serialize_comment(comment, children):
+    is_edited = comment.updated_at and comment.created_at and comment.updated_at > comment.created_at
+    author = comment.author
+    author_is_deleted = bool(getattr(author, 'is_deleted', False))
+    return {
+        'id': comment.id,
+        'content': comment.content,
+        'author': {
+            'id': author.id,
+            'is_deleted': author_is_deleted,
+            'username': None if author_is_deleted else author.username,
+            'display_name': None if author_is_deleted else author.display_name,
+            'avatar_url': None if author_is_deleted else author.avatar_url,
+            'avatar_thumb_url': None if author_is_deleted else variant_url(author.avatar_url, 'avatar', AVATAR_THUMB_WIDTH),
+            'theme_color': '#6b7280' if author_is_deleted else author.theme_color
+        },
+        'created_at': format_datetime_i18n(comment.created_at),
+        'is_edited': is_edited,
+        'replies': [_serialize_comment(r, children) for r in children.get(comment.id, [])]
+    }
+
+
+def _comment_thread(roots, replies):
+    """Assemble serialized threads for ``roots`` from a flat, ordered list of replies."""
+    children = {}
+    for reply in replies:
+        children.setdefault(reply.parent_id, []).append(reply)
+    return [_serialize_comment(root, children) for root in roots]
+
+
 @social_bp.route('/api/posts/<int:post_id>/comments', methods=['GET'])
 @exempt_from_limiter
 def get_comments(post_id):
-    """Get comments for a post."""
+    """Get comments for a post.
+
+    Without parameters the whole approved thread is returned (oldest first).
+    ``limit`` pages the top-level comments: the newest ``limit`` by default,
+    older ones with ``before=<cursor>``, newer ones with ``after=<cursor>``.
+    Replies always come complete with their top-level comment.
+
+    Comment ids follow creation order, so top-level comments are paged by id
+    (``created_at`` is a server default with only second precision); replies
+    come from one range scan over the materialized ``path``.
+    """
     post = Post.query.get_or_404(post_id)
-    
-    # Get top-level comments only (oldest first, newest at bottom)
-    comments = Comment.query.filter_by(
-        post_id=post_id, parent_id=None, is_approved=True
-    ).order_by(Comment.created_at.asc()).all()
-    
-    def serialize_comment(comment):
-        replies = Comment.query.filter_by(parent_id=comment.id, is_approved=True).order_by(Comment.created_at.asc()).all()
-        is_edited = comment.updated_at and comment.created_at and comment.updated_at > comment.created_at
-        author = comment.author
-        author_is_deleted = bool(getattr(author, 'is_deleted', False))
-        return {
-            'id': comment.id,
-            'content': comment.content,
-            'author': {
-                'id': author.id,
-                'is_deleted': author_is_deleted,
-                'username': None if author_is_deleted else author.username,
-                'display_name': None if author_is_deleted else author.display_name,
-                'avatar_url': None if author_is_deleted else author.avatar_url,
-                'theme_color': '#6b7280' if author_is_deleted else author.theme_color
-            },
-            'created_at': format_datetime_i18n(comment.created_at),
-            'is_edited': is_edited,
-            'replies': [serialize_comment(r) for r in replies]
-        }
-    
+
+    limit = request.args.get('limit', type=int)
+    before = decode_cursor(request.args.get('before'))
+    after = decode_cursor(request.args.get('after'))
+
+    thread = Comment.query.options(joinedload(Comment.author)).filter(
+        Comment.post_id == post_id,
+        Comment.is_approved == True
+    )
+
+    if limit is None and before is None and after is None:
+        comments = thread.order_by(Comment.path.asc()).all()
+        roots = [c for c in comments if c.parent_id is None]
+        return jsonify({
+            'comments': _comment_thread(roots, comments),
+            'total': post.comment_count,
+            'has_more': False,
+            'older_count': 0,
+            'before_cursor': None,
+            'after_cursor': encode_cursor(None, roots[-1].id) if roots else None
+        })
+
+    limit = max(1, min(limit or 50, 100))
+    top_level = Comment.query.options(joinedload(Comment.author)).filter(
+        Comment.post_id == post_id,
+        Comment.parent_id.is_(None),
+        Comment.is_approved == True
+    )
+    if after is not None:
+        roots = top_level.filter(Comment.id > after[1]).order_by(Comment.id.asc()).limit(limit + 1).all()
+        has_more = len(roots) > limit
+        roots = roots[:limit]
+    else:
+        if before is not None:
+            top_level = top_level.filter(Comment.id < before[1])
+        roots = top_level.order_by(Comment.id.desc()).limit(limit + 1).all()
+        has_more = len(roots) > limit
+        roots = list(reversed(roots[:limit]))
+
+    replies = []
+    if roots:
+        low = comment_subtree_range(roots[0].path)[0]
+        high = comment_subtree_range(roots[-1].path)[1]
+        replies = thread.filter(
+            Comment.parent_id.isnot(None),
+            Comment.path > low,
+            Comment.path < high
+        ).order_by(Comment.path.asc()).all()
+
+    # Older top-level comments left out of this page (shown on the "earlier comments" button)
+    older_count = 0
+    if has_more and after is None:
+        older_count = top_level.filter(Comment.id < roots[0].id).count()
+
     return jsonify({
-        'comments': [serialize_comment(c) for c in comments],
-        'total': Comment.query.filter_by(post_id=post_id, is_approved=True).count()
+        'comments': _comment_thread(roots, replies),
+        'total': post.comment_count,
+        'has_more': has_more,
+        'older_count': older_count,
+        'before_cursor': encode_cursor(None, roots[0].id) if roots else None,
+        'after_cursor': encode_cursor(None, roots[-1].id) if roots else None
     })
 
 
@@ -417,16 +593,7 @@ def add_comment(post_id):
             return jsonify({'error': 'Antwort-Kommentar nicht gefunden'}), 400
 
         # Enforce max nesting depth (top-level=0, reply=1, ...). Allow depth up to 3.
-        depth = 0
-        current = parent
-        # Walk up the chain (guard against cycles)
-        while current and current.parent_id:
-            depth += 1
-            if depth >= 50:
-                break
-            current = current.parent
-        # parent depth == depth; new reply depth == parent depth + 1
-        if depth >= 3:
+        if parent.depth >= 3:
             return jsonify({'error': 'Maximale Verschachtelungstiefe erreicht (3)'}), 400
     
     comment = Comment(
@@ -436,7 +603,8 @@ def add_comment(post_id):
         content=content
     )
     db.session.add(comment)
-    db.session.commit()
+    adjust_comment_count(post_id, 1)
+    db.session.flush()
     
     # Create notification for post owner
     if post.user_id != current_user.id:
@@ -480,6 +648,10 @@ def add_comment(post_id):
                 post_id=post.id,
                 comment_id=comment.id
             )
+    db.session.commit()
+    emit_new_comment(post_id, dict(
+        _serialize_comment(comment, {}), post_id=post_id, parent_id=comment.parent_id, comment_count=post.comment_count
+    ))
     
     return jsonify({
         'success': True,
@@ -491,6 +663,7 @@ def add_comment(post_id):
                 'username': current_user.username,
                 'display_name': current_user.display_name,
                 'avatar_url': current_user.avatar_url,
+                'avatar_thumb_url': variant_url(current_user.avatar_url, 'avatar', AVATAR_THUMB_WIDTH),
                 'theme_color': current_user.theme_color
             },
             'parent_id': comment.parent_id,
@@ -509,14 +682,18 @@ def delete_comment(comment_id):
     if comment.user_id != current_user.id and post.user_id != current_user.id:
         return jsonify({'error': 'Keine Berechtigung'}), 403
 
-    def delete_comment_tree(root_comment):
-        replies = Comment.query.filter_by(parent_id=root_comment.id).all()
-        for r in replies:
-            delete_comment_tree(r)
-        db.session.delete(root_comment)
-
-    delete_comment_tree(comment)
+    low, high = comment_subtree_range(comment.path)
+    tree = Comment.query.filter(
+        Comment.post_id == comment.post_id,
+        Comment.path >= low,
+        Comment.path < high
+    ).order_by(Comment.path.asc()).all()
+    delete_comment_dependents([c.id for c in tree])
+    adjust_comment_count(post.id, -sum(1 for c in tree if c.is_approved))
+    for c in reversed(tree):
+        db.session.delete(c)
     db.session.commit()
+    emit_comment_deleted(post.id, comment_id, post.comment_count)
     return jsonify({'success': True})
 
 
@@ -538,9 +715,16 @@ def edit_comment(comment_id):
     if len(content) > 2000:
         return jsonify({'error': 'Kommentar ist zu lang (max. 2000 Zeichen)'}), 400
     
+    if comment.content != content:
+        invalidate_rendered(comment.content)
     comment.content = content
     comment.updated_at = datetime.utcnow()
     db.session.commit()
+    emit_comment_edited(comment.post_id, {
+        'comment_id': comment.id,
+        'content': comment.content,
+        'updated_at': format_datetime_i18n(comment.updated_at)
+    })
     
     return jsonify({
         'success': True,
@@ -704,7 +888,19 @@ def _archive_posts_query():
             )
         )
     )
-    return posts_query.order_by(db.func.coalesce(Post.scheduled_at, Post.published_at, Post.created_at).desc())
+    return posts_query.order_by(Post.effective_at.desc(), Post.id.desc())
+
+
+def _archive_range(year, month=None):
+    """Return the [start, end) datetimes of an archive year or month, or 404."""
+    try:
+        if month is None:
+            return datetime(year, 1, 1), datetime(year + 1, 1, 1)
+        if month == 12:
+            return datetime(year, 12, 1), datetime(year + 1, 1, 1)
+        return datetime(year, month, 1), datetime(year, month + 1, 1)
+    except ValueError:
+        abort(404)
 
 @social_bp.route('/me/archive')
 @login_required
@@ -715,7 +911,7 @@ def archive():
      
     archive_data = {}
     for post in posts:
-        archive_dt = post.scheduled_at or post.created_at
+        archive_dt = post.effective_at or post.created_at
         year = archive_dt.year
         month = archive_dt.month
         
@@ -732,9 +928,11 @@ def archive():
 @login_required
 def archive_year(year):
     """Show posts from a specific year."""
+    start, end = _archive_range(year)
     posts = _archive_posts_query().filter(
-        extract('year', db.func.coalesce(Post.scheduled_at, Post.published_at, Post.created_at)) == year
-    ).order_by(db.func.coalesce(Post.scheduled_at, Post.published_at, Post.created_at).desc()).all()
+        Post.effective_at >= start,
+        Post.effective_at < end
+    ).all()
      
     return render_template('me/archive_year.html', year=year, posts=posts)
 
@@ -743,10 +941,11 @@ def archive_year(year):
 @login_required
 def archive_month(year, month):
     """Show posts from a specific month."""
+    start, end = _archive_range(year, month)
     posts = _archive_posts_query().filter(
-        extract('year', db.func.coalesce(Post.scheduled_at, Post.published_at, Post.created_at)) == year,
-        extract('month', db.func.coalesce(Post.scheduled_at, Post.published_at, Post.created_at)) == month
-    ).order_by(db.func.coalesce(Post.scheduled_at, Post.published_at, Post.created_at).desc()).all()
+        Post.effective_at >= start,
+        Post.effective_at < end
+    ).all()
      
     month_names = ['', 'Januar', 'Februar', 'März', 'April', 'Mai', 'Juni', 
                    'Juli', 'August', 'September', 'Oktober', 'November', 'Dezember']
@@ -766,26 +965,14 @@ def archive_month(year, month):
 def get_notifications():
     """Get notifications for the current user."""
     notifications = Notification.query.filter_by(user_id=current_user.id)\
+        .options(joinedload(Notification.actor))\
         .order_by(Notification.created_at.desc())\
         .limit(20).all()
     
     unread_count = Notification.query.filter_by(user_id=current_user.id, is_read=False).count()
     
     return jsonify({
-        'notifications': [{
-            'id': n.id,
-            'type': n.type,
-            'title': n.title,
-            'message': n.message,
-            'link': n.link,
-            'is_read': n.is_read,
-            'created_at': n.created_at.strftime('%d.%m.%Y %H:%M'),
-            'actor': {
-                'username': n.actor.username if n.actor else None,
-                'display_name': n.actor.display_name if n.actor else None,
-                'avatar_url': n.actor.avatar_url if n.actor else None
-            } if n.actor else None
-        } for n in notifications],
+        'notifications': [serialize_notification(n) for n in notifications],
         'unread_count': unread_count
     })
 
@@ -798,6 +985,7 @@ def mark_notifications_read():
         .update({'is_read': True})
     db.session.commit()
     unread_count = Notification.query.filter_by(user_id=current_user.id, is_read=False).count()
+    emit_unread_count(current_user.id, unread_count)
     return jsonify({'success': True, 'unread_count': unread_count})
 
 
@@ -809,6 +997,7 @@ def mark_notification_read(notification_id):
     notification.is_read = True
     db.session.commit()
     unread_count = Notification.query.filter_by(user_id=current_user.id, is_read=False).count()
+    emit_unread_count(current_user.id, unread_count)
     return jsonify({'success': True, 'unread_count': unread_count})
 
 
@@ -856,7 +1045,12 @@ def unsubscribe_push():
 
 
 def create_notification(user_id, type, title, message=None, link=None, actor_id=None, post_id=None, comment_id=None):
-    """Helper function to create a notification."""
+    """Add a notification and its push (see notification_outbox.py) to the current transaction.
+
+    The caller commits; open tabs of the recipient get it over Socket.IO right
+    after the commit (websocket.queue_notification), nothing else is sent from
+    the request.
+    """
     # Don't notify yourself
     if actor_id and actor_id == user_id:
         return None
@@ -872,21 +1066,8 @@ def create_notification(user_id, type, title, message=None, link=None, actor_id=
         comment_id=comment_id
     )
     db.session.add(notification)
-    db.session.commit()
-    try:
-        unread_count = Notification.query.filter_by(user_id=user_id, is_read=False).count()
-        send_push_notification(
-            user_id,
-            {
-                "title": title,
-                "message": message,
-                "type": type,
-                "link": link,
-                "unread_count": unread_count,
-            },
-        )
-    except Exception:
-        current_app.logger.exception("Error sending push notification")
+    enqueue_push(notification)
+    queue_notification(notification)
     return notification
 
 
@@ -908,7 +1089,6 @@ def follow_user(user_id):
     
     follow = Follow(follower_id=current_user.id, followed_id=user_id)
     db.session.add(follow)
-    db.session.commit()
     
     # Create notification
     create_notification(
@@ -918,6 +1098,7 @@ def follow_user(user_id):
         link=url_for('blog.public_profile', username=current_user.username),
         actor_id=current_user.id
     )
+    db.session.commit()
     
     return jsonify({'success': True, 'following': True})
 
@@ -1015,7 +1196,7 @@ def get_poll(poll_id):
         if session_id:
             user_votes = [v.option_id for v in PollVote.query.filter_by(session_id=session_id).join(PollOption).filter(PollOption.poll_id == poll_id).all()]
     
-    total_votes = sum(opt.votes.count() for opt in poll.options)
+    total_votes = sum(opt.vote_count for opt in poll.options)
     
     is_ended = poll.ends_at < datetime.utcnow() if poll.ends_at else False
     
@@ -1030,9 +1211,9 @@ def get_poll(poll_id):
         'options': [{
             'id': opt.id,
             'text': opt.text,
-            'votes': opt.votes.count(),
-            'percentage': round((opt.votes.count() / total_votes * 100) if total_votes > 0 else 0, 1)
-        } for opt in poll.options.order_by(PollOption.order)]
+            'votes': opt.vote_count,
+            'percentage': round((opt.vote_count / total_votes * 100) if total_votes > 0 else 0, 1)
+        } for opt in poll.options]
     })
 
 
@@ -1060,6 +1241,7 @@ def vote_poll(poll_id):
         # Remove existing votes
         existing = PollVote.query.filter_by(user_id=user_id).join(PollOption).filter(PollOption.poll_id == poll_id).all()
         for v in existing:
+            adjust_vote_count(v.option_id, -1)
             db.session.delete(v)
     else:
         user_id = None
@@ -1067,6 +1249,7 @@ def vote_poll(poll_id):
         # Remove existing votes
         existing = PollVote.query.filter_by(session_id=session_id).join(PollOption).filter(PollOption.poll_id == poll_id).all()
         for v in existing:
+            adjust_vote_count(v.option_id, -1)
             db.session.delete(v)
     
     # Add new votes
@@ -1076,6 +1259,7 @@ def vote_poll(poll_id):
         if option:
             vote = PollVote(option_id=opt_id, user_id=user_id, session_id=session_id)
             db.session.add(vote)
+            adjust_vote_count(option.id, 1)
     
     db.session.commit()
     
@@ -1239,6 +1423,8 @@ def restore_post_version(post_id, version_id):
     db.session.add(current_version)
     
     # Restore old version
+    if post.content != version.content:
+        invalidate_rendered(post.content)
     post.title = version.title
     post.content = version.content
     db.session.commit()
@@ -1254,7 +1440,8 @@ def groups_list():
     """List all groups the user is a member of."""
     memberships = GroupMembership.query.filter_by(user_id=current_user.id).all()
     groups = [m.group for m in memberships]
-    return render_template('groups/list.html', groups=groups)
+    member_counts = group_member_counts([g.id for g in groups])
+    return render_template('groups/list.html', groups=groups, member_counts=member_counts)
 
 
 @social_bp.route('/groups/create', methods=['GET', 'POST'])
@@ -1340,9 +1527,7 @@ def group_detail(slug):
             )
         )
 
-    posts = posts.order_by(
-        db.func.coalesce(Post.scheduled_at, Post.published_at, Post.created_at).desc()
-    ).all()
+    posts = posts.order_by(Post.effective_at.desc(), Post.id.desc()).all()
     members = GroupMembership.query.filter_by(group_id=group.id).all()
     is_admin = membership.role == 'admin'
     
@@ -1353,8 +1538,7 @@ def group_detail(slug):
 @login_required
 def group_settings(slug):
     """Edit group settings (admin only)."""
-    from blog import allowed_file, resize_image, get_upload_folder
-    import os
+    from blog import allowed_file
     
     group = Group.query.filter_by(slug=slug).first_or_404()
     membership = GroupMembership.query.filter_by(group_id=group.id, user_id=current_user.id).first()
@@ -1368,15 +1552,14 @@ def group_settings(slug):
         group.description = request.form.get('description', '').strip()
         group.color = request.form.get('color', group.color)
         
-        # Handle cover image upload
+        # Handle cover image upload (shown once its variants are ready)
         if 'cover_image' in request.files:
             file = request.files['cover_image']
             if file and file.filename and allowed_file(file.filename):
-                filename = f"group_cover_{group.id}_{uuid.uuid4().hex[:8]}.jpg"
-                filepath = os.path.join(get_upload_folder('groups', str(group.id)), filename)
-                img = resize_image(file, max_size=1920)
-                img.save(filepath, 'JPEG', quality=85)
-                group.cover_image_url = url_for('static', filename=f'uploads/groups/{group.id}/{filename}')
+                try:
+                    replace_profile_image(group, 'cover_image_url', file, 'cover', f'uploads/groups/{group.id}', f'group_cover_{group.id}')
+                except InvalidImage:
+                    flash(_('Invalid image file.'), 'error')
         
         # Handle cover image removal
         if request.form.get('remove_cover') == '1':
@@ -1386,11 +1569,10 @@ def group_settings(slug):
         if 'icon_image' in request.files:
             file = request.files['icon_image']
             if file and file.filename and allowed_file(file.filename):
-                filename = f"group_icon_{group.id}_{uuid.uuid4().hex[:8]}.jpg"
-                filepath = os.path.join(get_upload_folder('groups', str(group.id)), filename)
-                img = resize_image(file, max_size=256)
-                img.save(filepath, 'JPEG', quality=90)
-                group.icon_url = url_for('static', filename=f'uploads/groups/{group.id}/{filename}')
+                try:
+                    replace_profile_image(group, 'icon_url', file, 'icon', f'uploads/groups/{group.id}', f'group_icon_{group.id}')
+                except InvalidImage:
+                    flash(_('Invalid image file.'), 'error')
         
         # Handle icon removal
         if request.form.get('remove_icon') == '1':
@@ -1400,7 +1582,9 @@ def group_settings(slug):
         flash(_('Group settings saved.'), 'success')
         return redirect(url_for('social.group_detail', slug=slug))
     
-    return render_template('groups/settings.html', group=group)
+    members = GroupMembership.query.filter_by(group_id=group.id).all()
+    invite_run = session.pop(f'invite_all_{group.id}', None)
+    return render_template('groups/settings.html', group=group, members=members, invite_run=invite_run)
 
 
 @social_bp.route('/groups/<slug>/delete', methods=['POST'])
@@ -1448,7 +1632,6 @@ def invite_to_group(slug):
     
     new_membership = GroupMembership(group_id=group.id, user_id=user.id, role='member')
     db.session.add(new_membership)
-    db.session.commit()
     
     # Notify the invited user
     create_notification(
@@ -1458,6 +1641,7 @@ def invite_to_group(slug):
         link=f'/groups/{group.slug}',
         actor_id=current_user.id
     )
+    db.session.commit()
     
     flash(_('{user} was added to the group.').format(user=(user.display_name or user.username)), 'success')
     return redirect(url_for('social.group_settings', slug=slug))
@@ -1474,34 +1658,38 @@ def invite_all_to_group(slug):
         flash(_('Only admins can invite all users.'), 'error')
         return redirect(url_for('social.group_detail', slug=slug))
     
-    # Get all users who are not already members
-    existing_member_ids = [m.user_id for m in GroupMembership.query.filter_by(group_id=group.id).all()]
-    users_to_invite = User.query.filter(
-        User.is_deleted.is_(False),
-        User.is_active.is_(True),
-        ~User.id.in_(existing_member_ids)
-    ).all()
-    
-    added_count = 0
-    for user in users_to_invite:
-        new_membership = GroupMembership(group_id=group.id, user_id=user.id, role='member')
-        db.session.add(new_membership)
-        
-        # Notify each invited user
-        create_notification(
-            user_id=user.id,
-            type='group_invite',
-            title=_('{name} added you to the group "{group}"').format(name=(current_user.display_name or current_user.username), group=group.name),
-            link=f'/groups/{group.slug}',
-            actor_id=current_user.id
-        )
-        added_count += 1
-    
+    # Memberships, notifications and queued pushes in three set-based statements
+    added_count, marker = add_all_users_to_group(
+        group.id,
+        actor_id=current_user.id,
+        title=_('{name} added you to the group "{group}"').format(name=(current_user.display_name or current_user.username), group=group.name),
+        link=f'/groups/{group.slug}',
+    )
     db.session.commit()
+    if added_count:
+        # Lets the settings page follow push delivery of this run
+        session[f'invite_all_{group.id}'] = marker.isoformat()
+        spawn(emit_notifications_changed, current_app._get_current_object(),
+              invite_recipients(f'/groups/{group.slug}', current_user.id, marker), name='chronicle-invite-emits')
     flash(_('{n} users were added to the group.').format(n=added_count), 'success')
     return redirect(url_for('social.group_settings', slug=slug))
 
 
+@social_bp.route('/groups/<slug>/invite-all/progress')
+@login_required
+def invite_all_progress(slug):
+    """Push delivery progress of an invite-all run (admin only)."""
+    group = Group.query.filter_by(slug=slug).first_or_404()
+    membership = GroupMembership.query.filter_by(group_id=group.id, user_id=current_user.id).first()
+    if not membership or membership.role != 'admin':
+        return jsonify({'error': 'Keine Berechtigung'}), 403
+    try:
+        marker = datetime.fromisoformat(request.args.get('at', ''))
+    except ValueError:
+        return jsonify({'error': 'Ungültiger Zeitpunkt'}), 400
+    return jsonify(invite_delivery_progress(f'/groups/{group.slug}', current_user.id, marker))
+
+
 @social_bp.route('/groups/<slug>/leave', methods=['POST'])
 @login_required
 def leave_group(slug):
@@ -1860,6 +2048,8 @@ def edit_group_announcement(announcement_id):
             flash(_('Please enter content.'), 'error')
             return render_template('groups/announcement_form.html', group=group, announcement=announcement)
         
+        if announcement.content != content:
+            invalidate_rendered(announcement.content)
         announcement.content = content
         announcement.border_color = border_color
         db.session.commit()
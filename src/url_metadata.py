@@ -0,0 +1,155 @@
+"""Shared, expiring cache of fetched page metadata for link previews.
+
+Every URL is normalized (lowercase scheme and host, no default port,
+fragment or tracking parameters, sorted query) and stored once in the
+``url_metadata`` table, keyed by a hash of the normalized form. The
+normalized form is only the key: pages are fetched at the URL as posted,
+since re-encoding the query or dropping the fragment can address a
+different resource. Link previews reference the entry instead of copying
+title, description and image, so a popular URL is fetched and parsed once
+per ``URL_METADATA_TTL`` no matter how many posts link it.
+
+Failed fetches (timeouts, non-HTML responses, blocked hosts, ...) are
+remembered as well, for the shorter ``URL_METADATA_FAILURE_TTL``, so broken
+links are not retried on every post. ``refresh_stale_metadata`` (CLI:
+``flask chronicle refresh-link-metadata``) re-fetches expired entries that
+are still referenced and drops the rest.
+
+Hits and misses are counted per process and reported by ``metadata_stats``.
+"""
+import hashlib
+import threading
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+
+from extensions import db
+from models import UrlMetadata, LinkPreview
+from content_utils import fetch_page_metadata, PreviewUnavailable
+
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600
+DEFAULT_FAILURE_TTL_SECONDS = 3600
+
+TRACKING_PARAMS = {'fbclid', 'gclid', 'dclid', 'msclkid', 'igshid', 'mc_cid', 'mc_eid', 'ref_src'}
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+_stats = {'hits': 0, 'negative_hits': 0, 'misses': 0, 'fetches': 0, 'failures': 0}
+_stats_lock = threading.Lock()
+
+
+def _count(name: str) -> None:
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def metadata_stats() -> dict:
+    """Hit/miss counters of this process since it started."""
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats['hits'] + stats['negative_hits'] + stats['misses']
+    stats['hit_rate'] = round((stats['hits'] + stats['negative_hits']) / lookups, 3) if lookups else None
+    return stats
+
+
+def normalize_url(url: str) -> str:
+    """Canonical form of ``url`` used as the cache key."""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    if parts.port and parts.port != DEFAULT_PORTS.get(scheme):
+        host = f'{host}:{parts.port}'
+    query = sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not key.lower().startswith('utm_') and key.lower() not in TRACKING_PARAMS
+    )
+    return urlunsplit((scheme, host, parts.path or '/', urlencode(query), ''))
+
+
+def url_hash(normalized_url: str) -> str:
+    return hashlib.sha256(normalized_url.encode('utf-8')).hexdigest()
+
+
+def _ttl(failed: bool) -> timedelta:
+    if failed:
+        return timedelta(seconds=current_app.config.get('URL_METADATA_FAILURE_TTL', DEFAULT_FAILURE_TTL_SECONDS))
+    return timedelta(seconds=current_app.config.get('URL_METADATA_TTL', DEFAULT_TTL_SECONDS))
+
+
+def cached_metadata(url: str):
+    """The unexpired ``UrlMetadata`` entry for ``url`` (possibly a remembered failure), or None."""
+    entry = UrlMetadata.query.filter_by(url_hash=url_hash(normalize_url(url))).first()
+    if entry is not None and entry.expires_at > datetime.utcnow():
+        _count('negative_hits' if entry.status != 'ok' else 'hits')
+        return entry
+    _count('misses')
+    return None
+
+
+def refresh_metadata(url: str) -> UrlMetadata:
+    """Fetch ``url`` and store the result (or the failure) in its cache entry; the caller commits.
+
+    A failed re-fetch keeps previously fetched metadata and only retries
+    after the failure TTL.
+    """
+    url = url.strip()
+    key = url_hash(normalize_url(url))
+    _count('fetches')
+    try:
+        data, reason = fetch_page_metadata(url), None
+    except PreviewUnavailable as exc:
+        data, reason = None, exc.reason
+    except Exception:
+        current_app.logger.exception('Fetching metadata for %s failed', url)
+        data, reason = None, 'error'
+    if reason:
+        _count('failures')
+
+    now = datetime.utcnow()
+    entry = UrlMetadata.query.filter_by(url_hash=key).first()
+    if entry is None:
+        entry = UrlMetadata(url_hash=key, url=url[:2000], status='failed', expires_at=now)
+        try:
+            with db.session.begin_nested():
+                db.session.add(entry)
+        except IntegrityError:
+            # Stored concurrently by another worker
+            entry = UrlMetadata.query.filter_by(url_hash=key).one()
+
+    entry.fetched_at = now
+    entry.failure_reason = reason
+    entry.expires_at = now + _ttl(failed=data is None)
+    if data is not None:
+        entry.status = 'ok'
+        entry.title = data.get('title')
+        entry.description = data.get('description')
+        entry.image_url = data.get('image_url')
+        entry.site_name = data.get('site_name')
+    elif entry.status != 'ok' or not (entry.title or entry.description):
+        entry.status = 'failed'
+    db.session.flush()
+    return entry
+
+
+def get_metadata(url: str) -> UrlMetadata:
+    """Cached metadata for ``url``, fetched when missing or expired."""
+    return cached_metadata(url) or refresh_metadata(url)
+
+
+def refresh_stale_metadata(limit: int = 200) -> dict:
+    """Re-fetch expired entries that previews still reference, drop unreferenced expired ones."""
+    now = datetime.utcnow()
+    referenced = db.session.query(LinkPreview.id).filter(LinkPreview.url_metadata_id == UrlMetadata.id).exists()
+    removed = UrlMetadata.query.filter(
+        UrlMetadata.expires_at <= now, ~referenced
+    ).delete(synchronize_session=False)
+    db.session.commit()
+
+    urls = [row.url for row in db.session.query(UrlMetadata.url).filter(
+        UrlMetadata.expires_at <= now
+    ).order_by(UrlMetadata.expires_at.asc()).limit(limit)]
+    for url in urls:
+        refresh_metadata(url)
+        db.session.commit()
+    return {'refreshed': len(urls), 'removed': removed}
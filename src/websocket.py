@@ -1,10 +1,45 @@
-"""WebSocket support for real-time updates."""
+"""WebSocket support for real-time updates.
+
+Every authenticated socket joins the room of its user (``user_room``).
+``queue_notification`` sends a notification to that room once the
+transaction that created it is committed, with the recipient's unread count,
+so open tabs neither poll nor show notifications that were rolled back.
+
+Post pages join ``post_<id>`` rooms (only for posts the user may see) and get
+new, edited and deleted comments right after the commit. Reaction changes are
+coalesced per room: ``queue_reaction_change`` merges the deltas and a
+background loop broadcasts the resulting counts of each changed post at most
+once per ``REACTION_BROADCAST_SECONDS``, however many reactions arrive.
+"""
 import os
+import threading
+import time
+from flask import current_app
 from flask_socketio import SocketIO, emit, join_room, leave_room
 from flask_login import current_user
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from executor import spawn
+from extensions import db
+from models import Notification, Post
+from queries import visible_post_ids
+from reactions import comment_reaction_summary, post_reaction_summary
 
 socketio = SocketIO()
 
+_SESSION_KEY = 'realtime_notifications'
+_PAYLOAD_KEY = 'realtime_notification_payloads'
+
+JOIN_POSTS_LIMIT = 100
+
+# post id -> {'post': {emoji: delta}, 'comments': {comment id: {emoji: delta}}}
+_reaction_changes = {}
+_reaction_lock = threading.Lock()
+_reaction_pending = threading.Event()
+_flusher_started = False
+_broadcast_stats = {'reaction_changes': 0, 'reaction_broadcasts': 0}
+
 
 def init_socketio(app):
     """Initialize SocketIO with the Flask app."""
@@ -14,17 +49,18 @@ def init_socketio(app):
     else:
         cors_allowed = None
 
-    # In development, don't use Redis message queue (local run)
-    # Check for Windows (nt) specifically as user runs locally without Docker
-    if os.getenv('FLASK_ENV') == 'development' or os.name == 'nt':
-        message_queue = None
+    # Several worker processes: websocket transport only, as long-polling requests of one
+    # client could reach different workers; emits travel through the message queue
+    if app.config.get('WEB_WORKERS', 1) > 1:
+        transports = ['websocket']
     else:
-        message_queue = os.getenv('REDIS_URL') or None
+        transports = ['polling', 'websocket']
 
     socketio.init_app(
         app,
         cors_allowed_origins=cors_allowed,
-        message_queue=message_queue,
+        message_queue=app.config.get('SOCKETIO_MESSAGE_QUEUE'),
+        transports=transports,
     )
     return socketio
 
@@ -33,6 +69,7 @@ def init_socketio(app):
 def handle_connect():
     """Handle client connection."""
     if current_user.is_authenticated:
+        join_room(user_room(current_user.id))
         emit('connected', {'user_id': current_user.id})
 
 
@@ -42,15 +79,30 @@ def handle_disconnect():
     pass
 
 
+def _join_visible_posts(post_ids):
+    posts = Post.query.filter(Post.id.in_(post_ids)).all()
+    visible = visible_post_ids(posts, current_user.id if current_user.is_authenticated else None)
+    for post_id in visible:
+        join_room(f'post_{post_id}')
+    return sorted(visible)
+
+
 @socketio.on('join_post')
 def handle_join_post(data):
     """Join a post room for real-time comment updates."""
     post_id = data.get('post_id')
-    if post_id:
-        join_room(f'post_{post_id}')
+    if post_id and _join_visible_posts([post_id]):
         emit('joined', {'post_id': post_id})
 
 
+@socketio.on('join_posts')
+def handle_join_posts(data):
+    """Join the rooms of all posts shown on a page (one visibility check)."""
+    post_ids = [i for i in (data.get('post_ids') or [])[:JOIN_POSTS_LIMIT] if isinstance(i, int)]
+    if post_ids:
+        emit('joined', {'post_ids': _join_visible_posts(post_ids)})
+
+
 @socketio.on('leave_post')
 def handle_leave_post(data):
     """Leave a post room."""
@@ -61,14 +113,178 @@ def handle_leave_post(data):
 
 def emit_new_comment(post_id, comment_data):
     """Emit a new comment to all clients watching the post."""
-    socketio.emit('new_comment', comment_data, room=f'post_{post_id}')
+    _emit('new_comment', comment_data, f'post_{post_id}')
+
+
+def emit_comment_edited(post_id, comment_data):
+    """Emit an edited comment to all clients watching the post."""
+    _emit('comment_edited', comment_data, f'post_{post_id}')
 
 
-def emit_comment_deleted(post_id, comment_id):
+def emit_comment_deleted(post_id, comment_id, comment_count=None):
     """Emit comment deletion to all clients watching the post."""
-    socketio.emit('comment_deleted', {'comment_id': comment_id}, room=f'post_{post_id}')
+    _emit('comment_deleted', {'comment_id': comment_id, 'comment_count': comment_count}, f'post_{post_id}')
 
 
 def emit_reaction_update(post_id, reaction_data):
     """Emit reaction update to all clients watching the post."""
-    socketio.emit('reaction_update', reaction_data, room=f'post_{post_id}')
+    _emit('reaction_update', reaction_data, f'post_{post_id}')
+
+
+def emit_link_preview(post_id, preview_data):
+    """Emit a finished (or dropped) link preview to all clients watching the post."""
+    _emit('link_preview', preview_data, f'post_{post_id}')
+
+
+def user_room(user_id):
+    return f'user_{user_id}'
+
+
+def serialize_notification(notification):
+    """A notification as listed by ``/api/notifications``."""
+    actor = notification.actor
+    return {
+        'id': notification.id,
+        'type': notification.type,
+        'title': notification.title,
+        'message': notification.message,
+        'link': notification.link,
+        'is_read': notification.is_read,
+        'created_at': notification.created_at.strftime('%d.%m.%Y %H:%M'),
+        'actor': {
+            'username': actor.username,
+            'display_name': actor.display_name,
+            'avatar_url': actor.avatar_url
+        } if actor else None
+    }
+
+
+def _emit(event_name, data, room):
+    if socketio.server is None:
+        # Not served through Socket.IO (CLI, tests)
+        return
+    try:
+        socketio.emit(event_name, data, room=room)
+    except Exception:
+        # Clients catch up with their next fetch
+        current_app.logger.warning('Socket.IO emit %s to %s failed', event_name, room, exc_info=True)
+
+
+def emit_notification(user_id, notification_data, unread_count):
+    """Emit a new notification and the unread count to all tabs of the user.
+
+    Without ``notification_data`` (bulk inserts) clients reload their list.
+    """
+    _emit('notification', {'notification': notification_data, 'unread_count': unread_count}, user_room(user_id))
+
+
+def emit_unread_count(user_id, unread_count):
+    """Emit the unread count after notifications were read in another tab."""
+    _emit('unread_count', {'unread_count': unread_count}, user_room(user_id))
+
+
+def emit_notifications_changed(app, user_ids):
+    """Ask the tabs of ``user_ids`` to reload their notifications (one emit per user)."""
+    with app.app_context():
+        for user_id in user_ids:
+            emit_notification(user_id, None, None)
+
+
+def queue_notification(notification):
+    """Emit ``notification`` to its recipient after the current transaction commits."""
+    db.session.info.setdefault(_SESSION_KEY, []).append(notification)
+
+
+@event.listens_for(Session, 'before_commit')
+def _collect_notifications(session):
+    notifications = session.info.pop(_SESSION_KEY, None)
+    if not notifications:
+        return
+    session.flush()
+    user_ids = {n.user_id for n in notifications}
+    unread = dict(session.query(Notification.user_id, db.func.count(Notification.id)).filter(
+        Notification.user_id.in_(user_ids), Notification.is_read.is_(False)
+    ).group_by(Notification.user_id).all())
+    session.info[_PAYLOAD_KEY] = [
+        (n.user_id, serialize_notification(n), unread.get(n.user_id, 0)) for n in notifications
+    ]
+
+
+@event.listens_for(Session, 'after_commit')
+def _emit_notifications(session):
+    for user_id, data, unread_count in session.info.pop(_PAYLOAD_KEY, ()):
+        emit_notification(user_id, data, unread_count)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_notifications(session):
+    session.info.pop(_SESSION_KEY, None)
+    session.info.pop(_PAYLOAD_KEY, None)
+
+
+def queue_reaction_change(post_id, emoji, delta, comment_id=None):
+    """Record a committed reaction change for the next broadcast to ``post_<post_id>``."""
+    global _flusher_started
+    if socketio.server is None:
+        return
+    with _reaction_lock:
+        change = _reaction_changes.setdefault(post_id, {'post': {}, 'comments': {}})
+        deltas = change['comments'].setdefault(comment_id, {}) if comment_id else change['post']
+        deltas[emoji] = deltas.get(emoji, 0) + delta
+        _broadcast_stats['reaction_changes'] += 1
+        start = not _flusher_started and not current_app.config.get('TESTING')
+        _flusher_started = _flusher_started or start
+    _reaction_pending.set()
+    if start:
+        spawn(run_reaction_broadcasts, current_app._get_current_object(), name='chronicle-reaction-broadcasts')
+
+
+def flush_reaction_changes():
+    """Broadcast the counts of every post with pending changes, one emit per room."""
+    with _reaction_lock:
+        changes = dict(_reaction_changes)
+        _reaction_changes.clear()
+    broadcasts = 0
+    for post_id, change in changes.items():
+        emojis = set(change['post'])
+        comments = change['comments']
+        # Counts rather than the merged deltas: applying a broadcast twice (the
+        # reacting tab, several workers) leaves the same numbers
+        data = {'post_id': post_id}
+        if emojis:
+            summary = post_reaction_summary(post_id)
+            data['reactions'] = {emoji: summary[emoji]['count'] for emoji in emojis if emoji in summary}
+        if comments:
+            data['comments'] = {}
+            for comment_id, comment_emojis in comments.items():
+                summary = comment_reaction_summary(comment_id)
+                data['comments'][comment_id] = {emoji: summary[emoji]['count'] for emoji in comment_emojis if emoji in summary}
+        emit_reaction_update(post_id, data)
+        broadcasts += 1
+    with _reaction_lock:
+        _broadcast_stats['reaction_broadcasts'] += broadcasts
+    return broadcasts
+
+
+def run_reaction_broadcasts(app, stop_event=None):
+    """Flush coalesced reaction changes every ``REACTION_BROADCAST_SECONDS`` while there are any."""
+    stop_event = stop_event or threading.Event()
+    interval = float(app.config.get('REACTION_BROADCAST_SECONDS', 1.0))
+    while not stop_event.is_set():
+        _reaction_pending.wait()
+        time.sleep(interval)
+        _reaction_pending.clear()
+        try:
+            with app.app_context():
+                flush_reaction_changes()
+                db.session.remove()
+        except Exception:
+            app.logger.exception('Reaction broadcast failed')
+
+
+def broadcast_stats():
+    """Reaction changes recorded and broadcasts sent by this process."""
+    with _reaction_lock:
+        stats = dict(_broadcast_stats)
+        stats['pending_rooms'] = len(_reaction_changes)
+    return stats
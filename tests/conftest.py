@@ -0,0 +1,23 @@
+"""Shared fixtures: application instances on throwaway SQLite databases."""
+import os
+import sys
+
+import pytest
+
+# The app uses flat imports from src/ (like gunicorn and `flask --app src.app`).
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from app import create_app  # noqa: E402
+
+
+@pytest.fixture
+def make_app(tmp_path):
+    """Return a factory that creates a TESTING app with its own database."""
+    def _make(name: str = 'app'):
+        return create_app({
+            'TESTING': True,
+            'WTF_CSRF_ENABLED': False,
+            'RATELIMIT_ENABLED': False,
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / f'{name}.sqlite'}",
+        })
+    return _make
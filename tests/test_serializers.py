@@ -0,0 +1,108 @@
+"""Post pages are serialized in a fixed number of queries.
+
+A full page of posts with media, tags, link previews and polls must cost
+as many queries as a page with two such posts or with a single one, and
+only the poll option load more than a page of plain text posts (see
+serializers.py).
+"""
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+from extensions import db
+from models import LinkPreview, Media, Poll, PollOption, Post, Tag, UrlMetadata, User
+
+POSTS = 25
+ENDPOINTS = ('/feed/api', '/api/posts', '/u/alice/api')
+# Poll options are selectin-loaded with the polls, which SQLAlchemy skips on
+# a page without any poll. Only the feed shows polls.
+POLL_OPTION_QUERIES = {'/feed/api': 1}
+
+
+def _seed(rich_posts: int, posts: int = POSTS) -> str:
+    """Create alice with ``posts`` posts, the newest ``rich_posts`` of them with
+    media, tags, link previews and a poll, and return her session token."""
+    alice = User(username='alice', email='alice@example.org')
+    alice.set_password('pw')
+    alice.ensure_session_token()
+    db.session.add(alice)
+    db.session.flush()
+    tags = [Tag(user_id=alice.id, name=f'Tag {i}', slug=f'tag-{i}') for i in range(3)]
+    db.session.add_all(tags)
+
+    now = datetime.utcnow()
+    for i in range(posts):
+        post = Post(user_id=alice.id, content=f'Post {i} with **markdown**',
+                    published_at=now - timedelta(hours=i))
+        db.session.add(post)
+        if i >= rich_posts:
+            continue
+        db.session.flush()
+        post.tags.extend(tags)
+        for n in range(3):
+            db.session.add(Media(user_id=alice.id, post_id=post.id, filename=f'{i}-{n}.jpg',
+                                 original_filename=f'{n}.jpg', file_path=f'/static/uploads/{i}-{n}.jpg',
+                                 file_type='image', order=n))
+        for n in range(2):
+            url = f'https://example.org/{i}/{n}'
+            metadata = UrlMetadata(url_hash=f'{i}-{n}', url=url, title=f'Link {n}',
+                                   site_name='Example', expires_at=now + timedelta(days=1))
+            db.session.add(LinkPreview(post_id=post.id, url=url, url_metadata=metadata))
+        poll = Poll(post_id=post.id, question=f'Poll {i}?')
+        db.session.add(poll)
+        db.session.flush()
+        db.session.add_all(PollOption(poll_id=poll.id, text=f'Option {n}', order=n) for n in range(4))
+    db.session.commit()
+    return f'{alice.id}:{alice.session_token}'
+
+
+@contextmanager
+def _count_queries(engine):
+    statements = []
+
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', _before_cursor_execute)
+
+
+def _query_counts(app, rich_posts: int, posts: int = POSTS) -> dict[str, int]:
+    with app.app_context():
+        token = _seed(rich_posts, posts)
+        engine = db.engine
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = token
+        session['_fresh'] = True
+
+    counts = {}
+    for url in ENDPOINTS:
+        # The first request warms the render cache, which is shared by all
+        # apps of the test process; only the second one is counted.
+        assert client.get(url).status_code == 200
+        with _count_queries(engine) as statements:
+            response = client.get(url)
+        assert response.status_code == 200
+        page = response.get_json()['posts']
+        assert page
+        media = [post.get('media', post.get('media_items')) for post in page]
+        assert sum(1 for items in media if items) == min(rich_posts, len(page))
+        counts[url] = len(statements)
+    return counts
+
+
+def test_post_pages_cost_a_fixed_number_of_queries(make_app):
+    plain = _query_counts(make_app('plain'), rich_posts=0)
+    single = _query_counts(make_app('single'), rich_posts=1)
+    short = _query_counts(make_app('short'), rich_posts=2, posts=2)
+    rich = _query_counts(make_app('rich'), rich_posts=POSTS)
+    # Neither the number of posts nor what each of them carries matters ...
+    assert rich == single == short
+    # ... and a page with attachments only adds the poll option load.
+    assert single == {url: count + POLL_OPTION_QUERIES.get(url, 0) for url, count in plain.items()}